@@ -1,8 +1,16 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
 import time
 
+import streamlit as st
+
+from cardioscan import metrics
+from cardioscan.app_state import (get_active_model, get_audit_log, get_cohort_index,
+                                  get_drift_monitor, get_prediction_cache, get_scoring_pool,
+                                  get_whatif_sweep, start_metrics_server, warm_up_model)
+from cardioscan.features import CLINICAL_FEATURES, FEATURE_LABELS
+from cardioscan.prediction_cache import feature_key
+from cardioscan.scoring import QueueFull
+from cardioscan.whatif import feature_grid
+
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(
     page_title="CardioScan AI | Heart Risk Assessment",
@@ -11,8 +19,229 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- 2. PROFESSIONAL UI STYLING (Internal CSS) ---
-st.markdown("""
+# Stage timings go to cardioscan_stage_seconds (see cardioscan.metrics); the
+# whole rerun is cProfiled when CARDIOSCAN_PROFILE is set, and every script or
+# fragment execution is counted with its CPU time (cardioscan_script_*)
+rerun_started = time.perf_counter()
+rerun_cpu = time.thread_time()
+rerun_profile = metrics.Profile("app_rerun").start()
+# st.rerun()/st.stop() and interrupted reruns end the script with an exception,
+# so the profile and the end-of-rerun counters are settled in `finally`
+try:
+    start_metrics_server()
+    warm_up_model()
+    PREDICTIONS = metrics.counter("cardioscan_predictions_total", "Rows scored, by caller")
+
+    # --- 1b. MODEL INPUT ---
+    # The model comes from get_active_model(), a process-wide handle shared by
+    # every session and rerun (see cardioscan.app_state). Never call joblib.load
+    # at module level here: Streamlit re-executes this script on every full rerun.
+    # Full reruns are kept rare: the inputs sit in a form (editing them runs
+    # nothing until submit), and the interactive parts of the result (what-if
+    # panel, scoring poller) are fragments that re-execute on their own.
+    # The form collects exactly the model's clinical fields; the active version's
+    # FeaturePipeline encodes and range-checks them, as it does in training.
+    # pandas is only imported on the result branch; `python -m cardioscan.importtime`
+    # keeps this script's import path within budget.
+
+    # Display labels of the categorical fields, as the pipeline encodes them
+    CATEGORY_LABELS = {feature.name: list(feature.categories)
+                       for feature in CLINICAL_FEATURES if feature.categories}
+    CATEGORY_CODES = {feature.name: {code: label for label, code in feature.categories.items()}
+                      for feature in CLINICAL_FEATURES if feature.categories}
+    # Form bounds of the numeric fields; what-if sweeps cover the same ranges
+    FORM_RANGES = {
+        "age": (18, 110),
+        "restingBP": (80, 220),
+        "maxheartrate": (60, 220),
+        "serumcholestrol": (100, 600),
+        "oldpeak": (0.0, 6.5),
+    }
+    # Grid points per swept axis: a fine curve, or a coarser heatmap (~3,600 scores)
+    WHATIF_CURVE_POINTS = 141
+    WHATIF_HEATMAP_POINTS = 60
+
+
+    # Scoring runs on the process-wide pool (cardioscan.scoring), never in this
+    # script run: the job's future lives in st.session_state["scoring"] and a
+    # fragment polls it, so the page stays interactive while the model works.
+    SCORING_POLL_SECONDS = 0.25
+
+
+    def contribution_chart(columns, contributions):
+        """Contributions in percentage points, largest effect first, split by direction."""
+        import numpy as np
+        import pandas as pd
+
+        order = np.argsort(-np.abs(contributions), kind="stable")
+        points = contributions[order] * 100
+        return pd.DataFrame({
+            "Raises risk": np.where(points > 0, points, 0.0),
+            "Lowers risk": np.where(points < 0, points, 0.0),
+        }, index=[FEATURE_LABELS.get(columns[i], columns[i]) for i in order])
+
+
+    @st.fragment(run_every=SCORING_POLL_SECONDS)
+    def await_scoring(future):
+        """Poll a pending job; a full rerun renders the result once it is done."""
+        with metrics.script_run("poll"):
+            if future.done():
+                st.rerun()
+            pool = get_scoring_pool().stats()
+            st.info("⏳ Model calculating risk factors...")
+            st.caption(f"{pool['in_flight']} of {pool['capacity']} scoring slots in use")
+
+
+    def axis_labels(name, values):
+        """Display values of a swept axis (category labels for categorical fields)."""
+        labels = CATEGORY_CODES.get(name)
+        return [labels[int(value)] for value in values] if labels else list(values)
+
+
+    @st.fragment
+    def whatif_panel(loaded, features):
+        """Risk curve (one field) or heatmap (two fields) around this patient, scored in one batch.
+
+        A fragment: changing the swept fields re-executes only this panel.
+        """
+        with metrics.script_run("whatif"):
+            pipeline = loaded.pipeline
+            sweepable = [f.name for f in pipeline.features if f.categories or f.name in FORM_RANGES
+                         or (f.low is not None and f.high is not None)]
+
+            def grid(name, points):
+                low, high = FORM_RANGES.get(name, (None, None))
+                return tuple(feature_grid(pipeline, name, low, high, points).tolist())
+
+            with st.expander("🧪 What-if analysis"):
+                c1, c2 = st.columns(2)
+                x = c1.selectbox("Vary", sweepable, format_func=lambda n: FEATURE_LABELS.get(n, n),
+                                 index=sweepable.index("restingBP") if "restingBP" in sweepable else 0,
+                                 key="whatif_x")
+                y = c2.selectbox("Against", [None] + [n for n in sweepable if n != x], key="whatif_y",
+                                 format_func=lambda n: "Nothing (risk curve)" if n is None
+                                 else FEATURE_LABELS.get(n, n))
+                base = tuple(features[0].tolist())
+                if y is None:
+                    grids = ((x, grid(x, WHATIF_CURVE_POINTS)),)
+                else:
+                    grids = ((x, grid(x, WHATIF_HEATMAP_POINTS)), (y, grid(y, WHATIF_HEATMAP_POINTS)))
+                risk = get_whatif_sweep(loaded, loaded.version, base, grids) * 100
+
+                # Plotly for both views: building its figure costs a fraction of
+                # st.line_chart's Altair spec, and this panel re-executes on every change
+                import plotly.graph_objects as go
+
+                x_label = FEATURE_LABELS.get(x, x)
+                current_x = base[pipeline.columns.index(x)]
+                layout = dict(xaxis_title=x_label, margin=dict(l=10, r=10, t=10, b=10),
+                              template="plotly_white", showlegend=False)
+                if y is None:
+                    xs = axis_labels(x, grids[0][1])
+                    trace = go.Bar if x in CATEGORY_CODES else go.Scatter
+                    fig = go.Figure(trace(x=xs, y=risk, marker_color="#0062FF",
+                                          hovertemplate=f"{x_label}: %{{x}}<br>Risk: %{{y:.0f}}%<extra></extra>"))
+                    fig.update_layout(yaxis_title="Risk (%)", yaxis_range=[0, 100], height=300, **layout)
+                    st.plotly_chart(fig, width="stretch")
+                    shown = axis_labels(x, [current_x])[0] if x in CATEGORY_CODES else f"{current_x:g}"
+                    st.caption(f"This patient: {x_label} = {shown}. "
+                               f"All other fields are held at their entered values.")
+                else:
+                    y_label = FEATURE_LABELS.get(y, y)
+                    current_y = base[pipeline.columns.index(y)]
+                    fig = go.Figure(go.Heatmap(
+                        z=risk.T, x=axis_labels(x, grids[0][1]), y=axis_labels(y, grids[1][1]),
+                        zmin=0, zmax=100, colorscale="RdYlGn_r", colorbar=dict(title="Risk %"),
+                        hovertemplate=f"{x_label}: %{{x}}<br>{y_label}: %{{y}}<br>Risk: %{{z:.0f}}%<extra></extra>",
+                    ))
+                    fig.add_trace(go.Scatter(x=axis_labels(x, [current_x]), y=axis_labels(y, [current_y]),
+                                             mode="markers", name="This patient",
+                                             marker=dict(symbol="x", size=12, color="#1E293B")))
+                    fig.update_layout(yaxis_title=y_label, height=380, **layout)
+                    st.plotly_chart(fig, width="stretch")
+                    st.caption(f"{risk.size:,} scenarios scored in one batch; ✕ marks this patient.")
+
+
+    def ordinal(number):
+        suffix = "th" if 10 <= number % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+        return f"{number}{suffix}"
+
+
+    def cohort_comparison(loaded, row, risk):
+        """Where the patient sits among reference patients of the same age band and gender."""
+        cohort = get_cohort_index(loaded.version)
+        if cohort is None:
+            return
+        with metrics.span("cohort_lookup"):
+            stratum, size, percentiles = cohort.percentiles(loaded.pipeline.columns, row, risk)
+        if not percentiles:
+            return
+        st.markdown(f"#### 👥 Compared with {size} {cohort.describe(stratum)}")
+        columns = st.columns(len(percentiles))
+        for column, (metric, percentile) in zip(columns, percentiles.items()):
+            label = "Predicted risk" if metric == "risk" else FEATURE_LABELS.get(metric, metric)
+            column.metric(label, f"{ordinal(round(percentile))} pct")
+        st.caption("Percentile within the reference cohort: the share of those patients "
+                   "with a lower value (ties count half).")
+
+
+    def record_prediction(loaded, job):
+        """Audit-log an analysed patient and count it for drift (once per analysis, not per rerun).
+
+        Both are ``None`` when scoring remotely: the service records what it scores.
+        """
+        risk = job["result"][0]
+        audit_log = get_audit_log()
+        if audit_log is not None:
+            audit_log.record(loaded.version, loaded.pipeline.columns, job["features"], risk)
+        monitor = get_drift_monitor(loaded.version)
+        if monitor is not None:
+            with metrics.span("drift_observe"):
+                monitor.observe(job["features"], risk)
+
+
+    def show_result(loaded, job):
+        risk, explanation = job["result"]
+        risk_score = int(round(risk * 100))
+
+        st.markdown(f"""
+        <div class="prediction-card">
+            <h2 style="color: #1E293B;">Result: {risk_score}% Risk</h2>
+            <p style="color: #64748B;">Based on our Random Forest model analysis</p>
+        </div>
+    """, unsafe_allow_html=True)
+        if job["cached"]:
+            st.caption("⚡ Served from the prediction cache")
+
+        cohort_comparison(loaded, job["features"][0], risk)
+
+        if explanation is not None:
+            bias, contributions = explanation
+            st.markdown("#### 🔍 What drove this score")
+            st.bar_chart(contribution_chart(loaded.pipeline.columns, contributions),
+                         horizontal=True, sort=False, stack=True,
+                         color=["#EF4444", "#10B981"])
+            st.caption(f"Percentage points each factor added to or removed from the "
+                       f"{bias * 100:.0f}% average risk of the training cohort.")
+
+        whatif_panel(loaded, job["features"])
+
+        if risk_score > 50:
+            st.error("### ⚠️ WARNING: High Risk Detected")
+            st.write("The system has identified multiple indicators associated with cardiovascular issues. We strongly recommend scheduling a clinical examination.")
+            st.progress(risk_score)
+        else:
+            st.success("### ✅ Heart Status: Healthy")
+            st.write("Your vital signs and cardiac test results fall within the statistical safe range. Maintain your current activity levels!")
+            st.progress(risk_score)
+            # Only when the result first appears, not on every later rerun
+            if job.pop("celebrate", False):
+                st.balloons()
+
+
+    # --- 2. PROFESSIONAL UI STYLING (Internal CSS) ---
+    with metrics.span("css"):
+        st.markdown("""
     <style>
     /* Main Background */
     .stApp {
@@ -58,94 +287,143 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# --- 3. SIDEBAR NAVIGATION & INFO ---
-with st.sidebar:
-    st.image("https://cdn-icons-png.flaticon.com/512/833/833472.png", width=80)
-    st.title("CardioScan Navigation")
-    st.info("Current Page: **Home & Diagnostics**")
-    st.markdown("---")
-    st.write("🩺 **How to use:**")
-    st.caption("1. Enter patient vitals in the form.")
-    st.caption("2. Review lifestyle factors.")
-    st.caption("3. Click 'Run Heart Analysis'.")
-
-# --- 4. MAIN PAGE CONTENT ---
-st.markdown('<h1 class="main-header">❤️ CardioScan AI</h1>', unsafe_allow_html=True)
-st.markdown('<p class="sub-text">Advanced Machine Learning for early Cardiovascular Risk Detection.</p>', unsafe_allow_html=True)
-
-# Layout Split
-col_input, col_result = st.columns([1.2, 1], gap="large")
-
-with col_input:
-    st.subheader("📋 Patient Diagnostic Data")
+    # --- 3. SIDEBAR NAVIGATION & INFO ---
+    with st.sidebar, metrics.span("sidebar"):
+        st.image("https://cdn-icons-png.flaticon.com/512/833/833472.png", width=80)
+        st.title("CardioScan Navigation")
+        st.info("Current Page: **Home & Diagnostics**")
+        st.markdown("---")
+        st.write("🩺 **How to use:**")
+        st.caption("1. Enter patient vitals in the form.")
+        st.caption("2. Add the cardiac test results.")
+        st.caption("3. Click 'Run Heart Analysis'.")
+
+    # --- 4. MAIN PAGE CONTENT ---
+    st.markdown('<h1 class="main-header">❤️ CardioScan AI</h1>', unsafe_allow_html=True)
+    st.markdown('<p class="sub-text">Advanced Machine Learning for early Cardiovascular Risk Detection.</p>', unsafe_allow_html=True)
+
+    # Layout Split
+    col_input, col_result = st.columns([1.2, 1], gap="large")
+
+    with col_input, metrics.span("render_form"):
+        st.subheader("📋 Patient Diagnostic Data")
     
-    # Organizing inputs into tabs for a cleaner UI
-    tab1, tab2 = st.tabs(["Physical Vitals", "Lifestyle & Habits"])
+        # Inputs only reach the script on submit, so editing them costs no rerun
+        # Widget keys are the model's field names (cardioscan.loadtest fills the form by them)
+        with st.form("patient_form", border=False):
+            # Organizing inputs into tabs for a cleaner UI
+            tab1, tab2 = st.tabs(["Physical Vitals", "Cardiac Tests"])
     
-    with tab1:
-        c1, c2 = st.columns(2)
-        age = c1.number_input("Age (Years)", 18, 110, 45)
-        gender = c2.selectbox("Gender", ["Male", "Female"])
-        
-        c3, c4 = st.columns(2)
-        height = c3.slider("Height (cm)", 100, 220, 170)
-        weight = c4.slider("Weight (kg)", 30, 200, 70)
-        
-        bp_sys = st.number_input("Systolic BP (High value)", 80, 220, 120)
-        bp_dia = st.number_input("Diastolic BP (Low value)", 50, 150, 80)
-
-    with tab2:
-        chol = st.select_slider("Cholesterol Level", options=["Normal", "Above Normal", "Well Above Normal"])
-        gluc = st.select_slider("Glucose Level", options=["Normal", "Above Normal", "Well Above Normal"])
+            with tab1:
+                c1, c2 = st.columns(2)
+                age = c1.number_input("Age (Years)", *FORM_RANGES["age"], 45, key="age")
+                gender = c2.selectbox("Gender", ["Male", "Female"], key="gender")
         
-        smoke = st.checkbox("Current Smoker")
-        alcohol = st.checkbox("Consumes Alcohol")
-        active = st.checkbox("Physically Active", value=True)
-
-    # Trigger Button
-    analyze_btn = st.button("🚀 Run Heart Analysis")
-
-# --- 5. PREDICTION LOGIC & DISPLAY ---
-with col_result:
-    st.subheader("📊 Analysis Result")
+                c3, c4 = st.columns(2)
+                resting_bp = c3.number_input("Resting Blood Pressure (mm Hg)", *FORM_RANGES["restingBP"], 120,
+                                             key="restingBP")
+                max_heart_rate = c4.number_input("Max Heart Rate Achieved (bpm)", *FORM_RANGES["maxheartrate"], 150,
+                                                 key="maxheartrate")
+
+                cholesterol = st.number_input("Serum Cholesterol (mg/dl)", *FORM_RANGES["serumcholestrol"], 200,
+                                              key="serumcholestrol")
+                high_sugar = st.checkbox("Fasting blood sugar above 120 mg/dl", key="fastingbloodsugar")
+
+            with tab2:
+                chest_pain = st.selectbox("Chest Pain Type", CATEGORY_LABELS["chestpain"], key="chestpain")
+                resting_ecg = st.selectbox("Resting ECG", CATEGORY_LABELS["restingrelectro"],
+                                           key="restingrelectro")
+
+                c5, c6 = st.columns(2)
+                oldpeak = c5.number_input("ST Depression (oldpeak)", *FORM_RANGES["oldpeak"], 1.0, step=0.1,
+                                          key="oldpeak")
+                slope = c6.select_slider("ST Segment Slope", options=[0, 1, 2, 3], value=1, key="slope")
+
+                vessels = st.select_slider("Major Vessels Coloured by Fluoroscopy", options=[0, 1, 2, 3],
+                                           key="noofmajorvessels")
+                angina = st.checkbox("Exercise-induced angina", key="exerciseangia")
+
+            # Trigger Button
+            analyze_btn = st.form_submit_button("🚀 Run Heart Analysis")
+
+    # --- 5. PREDICTION LOGIC & DISPLAY ---
+    with col_result, metrics.span("render_result"):
+        st.subheader("📊 Analysis Result")
     
-    if analyze_btn:
-        with st.spinner('Model calculating risk factors...'):
-            time.sleep(1.5) # Simulate processing
-            
-            # --- MOCK PREDICTION LOGIC ---
-            # Replace this block with: prediction = model.predict(data)
-            risk_score = 15 # Default
-            if bp_sys > 140 or chol != "Normal" or smoke:
-                risk_score = np.random.randint(65, 94)
+        job = st.session_state.get("scoring")
+        if analyze_btn or job is not None:
+            with metrics.span("model_lookup"):
+                loaded = get_active_model()
+            with metrics.span("preprocess"):
+                features = loaded.pipeline.transform({
+                    "age": age,
+                    "gender": gender,
+                    "chestpain": chest_pain,
+                    "restingBP": resting_bp,
+                    "serumcholestrol": cholesterol,
+                    "fastingbloodsugar": int(high_sugar),
+                    "restingrelectro": resting_ecg,
+                    "maxheartrate": max_heart_rate,
+                    "exerciseangia": int(angina),
+                    "oldpeak": oldpeak,
+                    "slope": slope,
+                    "noofmajorvessels": vessels,
+                })
+            key = feature_key(features)
+
+        # Changed inputs (or a model swap) supersede the shown or pending result
+        if job is not None and (job["key"] != key or job["version"] != loaded.version):
+            if job.get("future") is not None:
+                job["future"].cancel()
+            job = st.session_state["scoring"] = None
+
+        if analyze_btn and job is None:
+            # Repeat submissions of the same vitals skip the model entirely
+            cache = get_prediction_cache()
+            result = cache.get(loaded.version, key)
+            job = {"key": key, "version": loaded.version, "features": features, "result": result,
+                   "cached": result is not None, "celebrate": True}
+            if result is None:
+                try:
+                    job["future"] = get_scoring_pool().score(loaded, features)
+                except QueueFull:
+                    job = None
+                    st.warning("The scoring service is busy right now; please try again in a moment.")
             else:
-                risk_score = np.random.randint(5, 25)
-            # ------------------------------
-
-            st.markdown(f"""
-                <div class="prediction-card">
-                    <h2 style="color: #1E293B;">Result: {risk_score}% Risk</h2>
-                    <p style="color: #64748B;">Based on our XGBoost model analysis</p>
-                </div>
-            """, unsafe_allow_html=True)
-
-            if risk_score > 50:
-                st.error("### ⚠️ WARNING: High Risk Detected")
-                st.write("The system has identified multiple indicators associated with cardiovascular issues. We strongly recommend scheduling a clinical examination.")
-                st.progress(risk_score)
+                PREDICTIONS.inc(source="app")
+                record_prediction(loaded, job)
+            st.session_state["scoring"] = job
+
+        future = job.get("future") if job is not None else None
+        if future is not None and future.done():
+            del job["future"]
+            try:
+                job["result"] = future.result()
+            except Exception as error:
+                job = st.session_state["scoring"] = None
+                st.error(f"Scoring failed: {error}")
             else:
-                st.success("### ✅ Heart Status: Healthy")
-                st.write("Your vital signs and lifestyle factors fall within the statistical safe range. Maintain your current activity levels!")
-                st.progress(risk_score)
-                st.balloons()
-    else:
-        st.info("Please fill in the patient data and click **Run Heart Analysis** to see the prediction results.")
+                get_prediction_cache().put(loaded.version, key, job["result"])
+                PREDICTIONS.inc(source="app")
+                record_prediction(loaded, job)
 
+        if job is None:
+            st.info("Please fill in the patient data and click **Run Heart Analysis** to see the prediction results.")
+        elif job.get("future") is not None:
+            await_scoring(job["future"])
+        else:
+            show_result(loaded, job)
 
 
-# --- 6. FOOTER ---
-st.markdown("---")
-st.caption("© 2024 CardioScan AI - Professional Medical ML Suite")
+
+    # --- 6. FOOTER ---
+    st.markdown("---")
+    st.caption("© 2024 CardioScan AI - Professional Medical ML Suite")
+finally:
+    rerun_profile.stop()
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - rerun_started, stage="rerun")
+    metrics.SCRIPT_RUNS.inc(scope="app")
+    metrics.SCRIPT_CPU.inc(time.thread_time() - rerun_cpu, scope="app")
 
 
 
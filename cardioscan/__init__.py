@@ -0,0 +1 @@
+"""CardioScan AI - model loading and scoring helpers shared by the app and scripts."""
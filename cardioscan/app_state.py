@@ -0,0 +1,144 @@
+"""Process-wide Streamlit resources shared by ``app.py`` and the pages.
+
+Everything here is wrapped in ``st.cache_resource`` / ``st.cache_data``, so it
+is created once per server process and reused across sessions and reruns.
+"""
+
+import os
+
+import streamlit as st
+
+from cardioscan import metrics
+from cardioscan.audit import get_log
+from cardioscan.drift import get_monitor
+from cardioscan.model_store import LoadedModel, ModelHandle
+from cardioscan.prediction_cache import PredictionCache
+from cardioscan.scoring import ScoringPool
+from cardioscan.whatif import sweep
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_handle():
+    """Handle on the model store's active version (hot-swaps on activation).
+
+    The first script run of the process creates it and starts mapping the
+    model in the background, so the page renders while the model warms.
+    """
+    handle = ModelHandle()
+    handle.warm_up()
+    return handle
+
+
+def warm_up_model():
+    """Start mapping the model in the background (a no-op when scoring remotely)."""
+    if not os.environ.get("CARDIOSCAN_API_URL"):
+        get_model_handle()
+
+
+@st.cache_resource(show_spinner="Connecting to prediction service...")
+def get_remote_model(api_url, record=True):
+    """Client of the prediction service; ``record=False`` for rows that are not patients."""
+    from cardioscan.serve import RemoteModel
+    return RemoteModel(api_url, record=record)
+
+
+def get_active_model():
+    """``LoadedModel`` to score with: its predictor, feature pipeline and version.
+
+    The version keys caches that depend on the model. A remote service may
+    hot-swap behind our back, so its version is the URL and cached entries
+    for it only go stale by TTL.
+    """
+    api_url = os.environ.get("CARDIOSCAN_API_URL")
+    if api_url:
+        remote = get_remote_model(api_url)
+        return LoadedModel(f"remote:{api_url}", remote.info, remote)
+    return get_model_handle().get()
+
+
+@st.cache_resource
+def get_prediction_cache():
+    """Prediction memo shared by every session of this server process."""
+    return PredictionCache(
+        max_entries=int(os.environ.get("CARDIOSCAN_PREDICTION_CACHE_SIZE", 4096)),
+        ttl_seconds=float(os.environ.get("CARDIOSCAN_PREDICTION_CACHE_TTL", 3600)),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_scoring_pool():
+    """Bounded background pool every session submits predictions to.
+
+    Sized by ``$CARDIOSCAN_SCORING_WORKERS`` (default: one process per core,
+    or threads when scoring remotely) and ``$CARDIOSCAN_SCORING_QUEUE``
+    (jobs allowed to wait beyond those workers).
+    """
+    workers = int(os.environ.get("CARDIOSCAN_SCORING_WORKERS", 0)) or None
+    queue_size = os.environ.get("CARDIOSCAN_SCORING_QUEUE")
+    queue_size = int(queue_size) if queue_size else None
+    if os.environ.get("CARDIOSCAN_API_URL"):
+        return ScoringPool.threaded(workers, queue_size)
+    return ScoringPool.for_store(get_model_handle().store.root, workers, queue_size)
+
+
+@st.cache_resource(show_spinner=False)
+def get_cohort_index(version):
+    """Reference-cohort percentile index of a local model version (``None`` when remote)."""
+    if os.environ.get("CARDIOSCAN_API_URL"):
+        return None
+    return get_model_handle().store.cohort(version)
+
+
+@st.cache_resource(show_spinner=False)
+def get_drift_monitor(version):
+    """This process's drift monitor for a local model version (``None`` when remote).
+
+    A remote prediction service counts what it scores itself.
+    """
+    if os.environ.get("CARDIOSCAN_API_URL"):
+        return None
+    return get_monitor(get_model_handle().store, version, "app")
+
+
+@st.cache_resource(show_spinner=False)
+def get_audit_log():
+    """This process's prediction audit log (``cardioscan.audit``); ``None`` when remote.
+
+    A remote prediction service audits what it scores itself, under the
+    version that actually scored it.
+    """
+    if os.environ.get("CARDIOSCAN_API_URL"):
+        return None
+    return get_log("app")
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_whatif_sweep(_loaded, version, base, grids):
+    """Risk over a what-if grid around one patient, cached per version, patient and grid.
+
+    ``base`` is the patient's encoded row and ``grids`` a tuple of
+    ``(column, values)`` pairs, both as tuples so they hash; ``_loaded`` is
+    not hashed, ``version`` stands in for it.
+    """
+    model = _loaded.model
+    api_url = os.environ.get("CARDIOSCAN_API_URL")
+    if api_url:
+        # Synthetic grid rows must not reach the service's drift monitor or audit log
+        model = get_remote_model(api_url, record=False)
+    with metrics.span("whatif_sweep"):
+        return sweep(model, _loaded.pipeline.columns, base, dict(grids))
+
+
+@st.cache_data(show_spinner=False)
+def get_model_report(version):
+    """Persisted metrics + feature importances of ``version`` (read once per version)."""
+    return get_model_handle().store.metrics(version)
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    """Serve ``/metrics`` on ``$CARDIOSCAN_METRICS_PORT`` (once per process), if set."""
+    port = os.environ.get("CARDIOSCAN_METRICS_PORT")
+    if not port:
+        return None
+    return metrics.serve_metrics(int(port), os.environ.get("CARDIOSCAN_METRICS_HOST", "127.0.0.1"))
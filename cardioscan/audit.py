@@ -0,0 +1,545 @@
+"""Append-only prediction audit log with vectorized replay.
+
+Every scoring path records what it scored: the encoded inputs, the model
+version, the risk and the time (plus the patient id when the caller has one).
+``record`` only queues the arrays; a background thread per process
+coalesces them and appends them to the process's own segment file in
+blocks of up to ``batch_rows`` rows, at least every ``flush_seconds``::
+
+    log = get_log("app")
+    log.record(loaded.version, loaded.pipeline.columns, X, risk)   # microseconds
+    log.flush()                                                      # wait for the disk
+
+Segments live in ``$CARDIOSCAN_AUDIT_DIR`` (default ``audit/`` next to the
+app) as ``<UTC time of the first row>-<source>-<pid>-<token>-<n>.audit``
+and roll over at ``segment_bytes`` and at UTC midnight, so a day's log is a
+set of whole files. A segment is a sequence of blocks, each::
+
+    b"CSA1" | uint32 header length | header JSON | payload
+
+The header holds the row count, feature columns, version table, time range
+and a CRC32 of the payload. The payload is columnar:
+
+- time (float64 epoch seconds)
+- patient id (int64, -1 when unknown)
+- version index (uint16)
+- risk (float64)
+- the feature matrix (float32, row-major, i.e. exactly what the model
+  takes)
+
+A torn block at the end of a segment (a crash mid-write) is skipped.
+
+Replay maps segments read-only and hands out whole blocks, merged into large
+chunks, so re-scoring a day against another model runs at batch speed::
+
+    python -m cardioscan.audit summary --since 2026-10-17
+    python -m cardioscan.audit rescore --since 2026-10-17 --until 2026-10-18 --version v0004
+    python -m cardioscan.audit export audit.csv --since 2026-10-17
+
+``record`` blocks only when ``max_pending`` records are already queued, so a
+stalled disk slows callers down instead of dropping audit records.
+"""
+
+import argparse
+import atexit
+import contextlib
+import datetime
+import json
+import mmap
+import os
+import queue
+import secrets
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from cardioscan import metrics
+from cardioscan.inference import ROOT_DIR
+
+AUDIT_DIR = Path(os.environ.get("CARDIOSCAN_AUDIT_DIR", ROOT_DIR / "audit"))
+MAGIC = b"CSA1"
+FORMAT_VERSION = 1
+SUFFIX = ".audit"
+SOURCES = ("app", "serve", "batch")
+DEFAULT_BATCH_ROWS = 4096
+FLUSH_SECONDS = 1.0
+SEGMENT_BYTES = 64 << 20
+MAX_PENDING = 10_000
+DEFAULT_CHUNK_ROWS = 200_000
+NO_PATIENT = -1
+# Per-row payload fields, in order, after which comes the (rows, columns) float32 matrix
+FIELDS = (("time", "<f8"), ("patientid", "<i8"), ("version", "<u2"), ("risk", "<f8"))
+_LENGTH = struct.Struct("<I")
+_CLOSE = object()
+_Record = namedtuple("_Record", "time version columns X risk patientid")
+
+RECORDS = metrics.counter("cardioscan_audit_records_total", "Predictions written to the audit log")
+WRITE_ERRORS = metrics.counter("cardioscan_audit_write_errors_total",
+                               "Failed audit log writes (retried on the next flush)")
+
+
+class Block:
+    """Rows of one flushed batch; every array has one entry (or row) per record."""
+
+    def __init__(self, source, columns, versions, time, patientid, version, risk, X):
+        self.source = source
+        self.columns = list(columns)
+        self.versions = list(versions)
+        self.time = time
+        self.patientid = patientid
+        self.version = version
+        self.risk = risk
+        self.X = X
+
+    @property
+    def rows(self):
+        return len(self.time)
+
+    def version_names(self):
+        return np.asarray(self.versions, dtype=object)[self.version]
+
+    def take(self, mask):
+        return Block(self.source, self.columns, self.versions, self.time[mask],
+                     self.patientid[mask], self.version[mask], self.risk[mask], self.X[mask])
+
+    @classmethod
+    def concat(cls, blocks):
+        """One block of ``blocks`` (same source and columns), with their version tables merged."""
+        versions = sorted({name for block in blocks for name in block.versions})
+        lookup = {name: i for i, name in enumerate(versions)}
+        return cls(
+            blocks[0].source, blocks[0].columns, versions,
+            np.concatenate([block.time for block in blocks]),
+            np.concatenate([block.patientid for block in blocks]),
+            np.concatenate([np.asarray([lookup[name] for name in block.versions],
+                                       dtype=np.uint16)[block.version] for block in blocks]),
+            np.concatenate([block.risk for block in blocks]),
+            np.concatenate([block.X for block in blocks]),
+        )
+
+    def to_bytes(self):
+        payload = b"".join([np.ascontiguousarray(self.time, "<f8").tobytes(),
+                            np.ascontiguousarray(self.patientid, "<i8").tobytes(),
+                            np.ascontiguousarray(self.version, "<u2").tobytes(),
+                            np.ascontiguousarray(self.risk, "<f8").tobytes(),
+                            np.ascontiguousarray(self.X, "<f4").tobytes()])
+        header = json.dumps({
+            "format_version": FORMAT_VERSION, "rows": self.rows, "source": self.source,
+            "columns": self.columns, "versions": self.versions,
+            "t_min": float(self.time.min()), "t_max": float(self.time.max()),
+            "payload_bytes": len(payload), "crc32": zlib.crc32(payload),
+        }).encode()
+        return MAGIC + _LENGTH.pack(len(header)) + header + payload
+
+
+def _utc(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+class AuditLog:
+    """This process's audit writer for one source; see the module docstring."""
+
+    def __init__(self, directory=AUDIT_DIR, source="app", batch_rows=DEFAULT_BATCH_ROWS,
+                 flush_seconds=FLUSH_SECONDS, segment_bytes=SEGMENT_BYTES, max_pending=MAX_PENDING):
+        if source not in SOURCES:
+            raise ValueError(f"unknown audit source {source!r} (expected one of {SOURCES})")
+        self.directory = Path(directory)
+        self.source = source
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.segment_bytes = segment_bytes
+        self._queue = queue.Queue(max_pending)
+        self._token = secrets.token_hex(4)
+        self._file = None
+        self._path = None
+        self._day = None
+        self._started = None
+        self._segments = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"audit-{source}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, version, columns, X, risk, patientid=None, timestamp=None):
+        """Queue scored rows for the log; the arrays must not be modified afterwards."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        risk = np.atleast_1d(np.asarray(risk, dtype=np.float64))
+        if len(risk) != len(X) or X.shape[1] != len(columns):
+            raise ValueError(f"expected one risk per row and {len(columns)} columns, "
+                             f"got {len(risk)} risks for a {X.shape} matrix")
+        if patientid is None:
+            patientid = np.full(len(X), NO_PATIENT, dtype=np.int64)
+        self._queue.put(_Record(time.time() if timestamp is None else timestamp, version,
+                                tuple(columns), X, risk, np.asarray(patientid, dtype=np.int64)))
+
+    def flush(self):
+        """Block until everything recorded so far is on disk (or its write failed)."""
+        if not self._closed:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+    def _run(self):
+        pending, rows, deadline = [], 0, None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, _Record):
+                pending.append(item)
+                rows += len(item.risk)
+                deadline = deadline or time.monotonic() + self.flush_seconds
+                if rows < self.batch_rows:
+                    continue
+            if pending:
+                # Only what a failed write left unwritten is retried, after flush_seconds
+                pending = self._write(pending)
+                rows = sum(len(item.risk) for item in pending)
+                deadline = time.monotonic() + self.flush_seconds if pending else None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _CLOSE:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def _segment(self, earliest):
+        """The segment for rows of one UTC day stamped at ``earliest`` or later.
+
+        Rows are stamped before they are queued, so a segment is named after
+        its earliest row rather than the time it was opened.
+        """
+        day = _utc(earliest).date()
+        if (self._file is not None and day == self._day and earliest >= self._started
+                and self._file.tell() < self.segment_bytes):
+            return self._file
+        if self._file is not None:
+            self._file.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segments += 1
+        name = (f"{_utc(earliest):%Y%m%dT%H%M%S}-{self.source}-{os.getpid()}-{self._token}"
+                f"-{self._segments:04d}{SUFFIX}")
+        self._path = self.directory / name
+        self._file, self._day, self._started = open(self._path, "ab"), day, earliest
+        return self._file
+
+    def _write(self, pending):
+        """Append ``pending`` as one block per day and column set; returns what was not written.
+
+        Each day's blocks go to its segment in one write. A day is either
+        fully on disk or (if its write failed) cut back off the segment, so
+        retrying the returned records never duplicates rows.
+        """
+        days = {}
+        for item in pending:
+            days.setdefault(_utc(item.time).date(), {}).setdefault(item.columns, []).append(item)
+        written = 0
+        with metrics.span("audit_write"):
+            for day, groups in sorted(days.items()):
+                blocks = []
+                for columns, items in groups.items():
+                    versions = sorted({item.version for item in items})
+                    lookup = {name: i for i, name in enumerate(versions)}
+                    blocks.append(Block(
+                        self.source, columns, versions,
+                        np.concatenate([np.full(len(item.risk), item.time) for item in items]),
+                        np.concatenate([item.patientid for item in items]),
+                        np.concatenate([np.full(len(item.risk), lookup[item.version], np.uint16)
+                                        for item in items]),
+                        np.concatenate([item.risk for item in items]),
+                        np.concatenate([item.X for item in items]),
+                    ).to_bytes())
+                start = None
+                try:
+                    handle = self._segment(min(item.time for items in groups.values()
+                                               for item in items))
+                    start = handle.tell()
+                    handle.write(b"".join(blocks))
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                except Exception as error:
+                    # Cut the partial write off (a leftover torn tail is skipped
+                    # on replay); the retry starts a new segment after it
+                    if self._file is not None:
+                        with contextlib.suppress(OSError):
+                            self._file.close()
+                        self._file = None
+                        if start is not None:
+                            with contextlib.suppress(OSError):
+                                os.truncate(self._path, start)
+                    WRITE_ERRORS.inc(source=self.source)
+                    print(f"audit log: write failed, will retry: {error}", file=sys.stderr)
+                    break
+                rows = sum(len(item.risk) for items in groups.values() for item in items)
+                RECORDS.inc(rows, source=self.source)
+                written += 1
+        unwritten = set(sorted(days)[written:])
+        return [item for item in pending if _utc(item.time).date() in unwritten]
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def _forget_logs():
+    # A forked child (e.g. a batch pool worker) inherits the parent's logs but
+    # not their writer threads; it must open its own
+    global _logs_lock
+    _logs.clear()
+    _logs_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_logs)
+
+
+def get_log(source, directory=AUDIT_DIR):
+    """The process-wide ``AuditLog`` of a source (created on first use)."""
+    key = (str(directory), source)
+    with _logs_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = _logs[key] = AuditLog(directory, source)
+        return log
+
+
+# --- replay ------------------------------------------------------------------
+
+def segments(directory=AUDIT_DIR, sources=None, since=None, until=None):
+    """Segment paths, oldest first, that may hold rows in ``[since, until)``.
+
+    A segment is named after its earliest row and only holds rows of that
+    UTC day, so its name bounds its rows.
+    """
+    found = []
+    for path in Path(directory).glob(f"*{SUFFIX}"):
+        started, source = path.stem.split("-")[:2]
+        if sources is not None and source not in sources:
+            continue
+        if until is not None and started > f"{_utc(until):%Y%m%dT%H%M%S}":
+            continue
+        if since is not None and started[:8] < f"{_utc(since):%Y%m%d}":
+            continue
+        found.append(path)
+    return sorted(found)
+
+
+def read_segment(path, since=None, until=None):
+    """Blocks of one segment, as read-only views of the mapped file.
+
+    Rows outside ``[since, until)`` (epoch seconds) are filtered out; blocks
+    entirely outside it are skipped without touching their payload.
+    """
+    with open(path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    offset = 0
+    while offset + len(MAGIC) + _LENGTH.size <= len(data):
+        if data[offset:offset + len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: no block at byte {offset}")
+        block_offset = offset
+        (length,) = _LENGTH.unpack_from(data, offset + len(MAGIC))
+        start = offset + len(MAGIC) + _LENGTH.size
+        if start + length > len(data):
+            return  # torn header at the end of the segment
+        header = json.loads(data[start:start + length])
+        start += length
+        end = start + header["payload_bytes"]
+        if end > len(data):
+            return  # torn payload at the end of the segment
+        offset = end
+        if header.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported audit block format {header.get('format_version')}")
+        if ((since is not None and header["t_max"] < since)
+                or (until is not None and header["t_min"] >= until)):
+            continue
+        payload = memoryview(data)[start:end]
+        if zlib.crc32(payload) != header["crc32"]:
+            raise ValueError(f"{path}: corrupt block at byte {block_offset}")
+        rows, fields, position = header["rows"], {}, 0
+        for name, dtype in FIELDS:
+            fields[name] = np.frombuffer(payload, dtype, rows, position)
+            position += rows * np.dtype(dtype).itemsize
+        X = np.frombuffer(payload, "<f4", rows * len(header["columns"]), position)
+        block = Block(header["source"], header["columns"], header["versions"], fields["time"],
+                      fields["patientid"], fields["version"], fields["risk"],
+                      X.reshape(rows, len(header["columns"])))
+        if ((since is not None and header["t_min"] < since)
+                or (until is not None and header["t_max"] >= until)):
+            keep = np.ones(rows, dtype=bool)
+            if since is not None:
+                keep &= block.time >= since
+            if until is not None:
+                keep &= block.time < until
+            block = block.take(keep)
+        if block.rows:
+            yield block
+
+
+def replay(directory=AUDIT_DIR, since=None, until=None, sources=None,
+           chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Logged rows in ``[since, until)``, merged into blocks of about ``chunk_rows`` rows.
+
+    Consecutive blocks of the same source and feature columns are
+    concatenated, so a day of single-patient app records comes back as a few
+    large matrices.
+    """
+    pending, rows = [], 0
+    for path in segments(directory, sources, since, until):
+        for block in read_segment(path, since, until):
+            if pending and (block.source, block.columns) != (pending[0].source, pending[0].columns):
+                yield Block.concat(pending)
+                pending, rows = [], 0
+            pending.append(block)
+            rows += block.rows
+            if rows >= chunk_rows:
+                yield Block.concat(pending)
+                pending, rows = [], 0
+    if pending:
+        yield Block.concat(pending)
+
+
+def rescore(loaded, directory=AUDIT_DIR, since=None, until=None, sources=None,
+            chunk_rows=DEFAULT_CHUNK_ROWS, on_chunk=None):
+    """Re-score logged rows with ``loaded`` (a ``LoadedModel``) and compare with the log.
+
+    The logged features are matched to the model's columns by name.
+    ``on_chunk(block, new_risk)`` is called per scored chunk, e.g. to write
+    the rows out. Returns a summary with the rows scored, their speed, how
+    many changed label and the mean/max absolute change of risk.
+    """
+    from cardioscan.inference import predict_risk
+
+    started = time.perf_counter()
+    rows = changed = 0
+    total_change = max_change = 0.0
+    by_version = {}
+    for block in replay(directory, since, until, sources, chunk_rows):
+        missing = [name for name in loaded.pipeline.columns if name not in block.columns]
+        if missing:
+            raise ValueError(f"logged rows lack the model's features: {', '.join(missing)}")
+        X = block.X[:, [block.columns.index(name) for name in loaded.pipeline.columns]]
+        with metrics.span("audit_rescore"):
+            risk = predict_risk(loaded.model, X)
+        change = np.abs(risk - block.risk)
+        rows += block.rows
+        changed += int(np.count_nonzero((risk > 0.5) != (block.risk > 0.5)))
+        total_change += float(change.sum())
+        max_change = max(max_change, float(change.max()))
+        counts = np.bincount(block.version, minlength=len(block.versions))
+        for name, count in zip(block.versions, counts):
+            by_version[name] = by_version.get(name, 0) + int(count)
+        if on_chunk is not None:
+            on_chunk(block, risk)
+    seconds = time.perf_counter() - started
+    return {
+        "version": loaded.version, "rows": rows, "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+        "label_changes": changed, "mean_abs_change": total_change / rows if rows else 0.0,
+        "max_abs_change": max_change, "logged_versions": by_version,
+    }
+
+
+def _frame(block, new_risk=None):
+    import pandas as pd
+
+    frame = pd.DataFrame({
+        "time": pd.to_datetime(block.time, unit="s", utc=True),
+        "source": block.source,
+        "patientid": block.patientid,
+        "version": block.version_names(),
+        "risk": block.risk,
+    })
+    if new_risk is not None:
+        frame["new_risk"] = new_risk
+    return frame.join(pd.DataFrame(block.X, columns=block.columns))
+
+
+def _timestamp(text):
+    """Epoch seconds of an ISO date or datetime; naive values are taken as UTC."""
+    moment = datetime.datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def main(argv=None):
+    from cardioscan.model_store import MODELS_DIR, ModelStore
+
+    parser = argparse.ArgumentParser(description="Inspect and replay the prediction audit log.")
+    parser.add_argument("--dir", default=str(AUDIT_DIR), help="Audit log directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary_cmd = commands.add_parser("summary", help="Rows per source and version")
+    rescore_cmd = commands.add_parser("rescore", help="Re-score logged rows with a model version")
+    rescore_cmd.add_argument("--version", help="Model version (default: the active one)")
+    rescore_cmd.add_argument("--models-dir", default=str(MODELS_DIR))
+    rescore_cmd.add_argument("--output", help="Also write every row with its new risk to this CSV")
+    export_cmd = commands.add_parser("export", help="Write logged rows to a CSV")
+    export_cmd.add_argument("output")
+    for command in (summary_cmd, rescore_cmd, export_cmd):
+        command.add_argument("--since", type=_timestamp, help="ISO date/time (UTC), inclusive")
+        command.add_argument("--until", type=_timestamp, help="ISO date/time (UTC), exclusive")
+        command.add_argument("--source", choices=SOURCES, action="append",
+                             help="Only this source (repeatable; default: all)")
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        counts, first, last = {}, None, None
+        for block in replay(args.dir, args.since, args.until, args.source):
+            names = block.version_names()
+            for version in block.versions:
+                key = (block.source, version)
+                counts[key] = counts.get(key, 0) + int(np.count_nonzero(names == version))
+            first = min(first, block.time.min()) if first is not None else block.time.min()
+            last = max(last, block.time.max()) if last is not None else block.time.max()
+        if not counts:
+            print("No audit records in range")
+            return
+        print(f"{sum(counts.values()):,} records from {_utc(first):%Y-%m-%d %H:%M:%S} "
+              f"to {_utc(last):%Y-%m-%d %H:%M:%S} UTC")
+        for (source, version), count in sorted(counts.items()):
+            print(f"  {source:<6} {version:<12} {count:>12,}")
+        return
+
+    header = True
+
+    def write(block, new_risk=None):
+        nonlocal header
+        _frame(block, new_risk).to_csv(args.output, mode="w" if header else "a",
+                                       header=header, index=False)
+        header = False
+
+    if args.command == "export":
+        for block in replay(args.dir, args.since, args.until, args.source):
+            write(block)
+        print(f"Exported to {args.output}" if not header else "No audit records in range")
+        return
+
+    store = ModelStore(args.models_dir)
+    loaded = store.load(args.version) if args.version else store.load()
+    result = rescore(loaded, args.dir, args.since, args.until, args.source,
+                     on_chunk=write if args.output else None)
+    print(f"Re-scored {result['rows']:,} logged rows with {result['version']} in "
+          f"{result['seconds']:.2f}s ({result['rows_per_second']:,.0f} rows/s): "
+          f"{result['label_changes']:,} label changes, mean |Δrisk| "
+          f"{result['mean_abs_change']:.4f}, max {result['max_abs_change']:.4f}")
+    for version, count in sorted(result["logged_versions"].items()):
+        print(f"  logged by {version}: {count:,} rows")
+
+
+if __name__ == "__main__":
+    main()
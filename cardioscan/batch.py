@@ -0,0 +1,191 @@
+"""Batch scoring of large patient CSVs.
+
+The input is streamed in fixed-size chunks so peak memory depends on
+``--chunksize`` (times ``--jobs`` in flight), not on the size of the file::
+
+    python -m cardioscan.batch patients.csv scores.csv --chunksize 50000 --jobs 4
+
+The output has one ``patientid, probability, label`` row per input row, in
+input order. With ``--explain`` it also gets a ``bias`` column and one
+``contribution_<feature>`` column per model feature; per row, bias plus the
+contributions equals the probability (see ``FlatForest.explain``). The model comes from the model store; the version active when
+the run starts is pinned for the whole file so every row is scored alike,
+through the feature pipeline stored with that version. A value outside a
+feature's valid range stops the run with the column and row at fault.
+Scored rows are counted by the drift monitor (``cardioscan.drift``) as
+source ``batch``; pass ``--no-drift`` for backfills and test files. Every
+scored row is also written to the audit log (``cardioscan.audit``) with its
+patient id.
+"""
+
+import argparse
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from cardioscan import metrics
+from cardioscan.audit import NO_PATIENT, get_log
+from cardioscan.drift import get_monitor
+from cardioscan.inference import explain_risk, predict_risk
+from cardioscan.model_store import MODELS_DIR, ModelHandle, ModelStore
+
+OUTPUT_COLUMNS = ["patientid", "probability", "label"]
+DEFAULT_CHUNKSIZE = 50_000
+PREDICTIONS = metrics.counter("cardioscan_predictions_total", "Rows scored, by caller")
+
+# Per-process loaded model and drift reference for pool workers (set by _init_worker)
+_worker_loaded = None
+_worker_reference = None
+
+
+def output_columns(loaded, explain=False):
+    if not explain:
+        return OUTPUT_COLUMNS
+    return OUTPUT_COLUMNS + ["bias"] + [f"contribution_{name}" for name in loaded.pipeline.columns]
+
+
+def score_chunk(loaded, chunk, explain=False, sketch=None, audit=None):
+    """Score one DataFrame chunk with a ``LoadedModel`` and return the output frame.
+
+    The chunk's rows and risk are also counted into ``sketch`` and recorded
+    in the ``AuditLog`` ``audit`` if given.
+    """
+    with metrics.span("preprocess"):
+        X = loaded.pipeline.transform(chunk)
+    with metrics.span("batch_predict"):
+        probability = predict_risk(loaded.model, X)
+    if sketch is not None:
+        sketch.update(X, probability)
+    if audit is not None:
+        patientid = pd.to_numeric(chunk["patientid"], errors="coerce").fillna(NO_PATIENT)
+        audit.record(loaded.version, loaded.pipeline.columns, X, probability,
+                     patientid.to_numpy(dtype="int64"))
+    output = {
+        "patientid": chunk["patientid"].to_numpy(),
+        "probability": probability,
+        # Same tie-breaking as RandomForestClassifier.predict (argmax picks class 0)
+        "label": (probability > 0.5).astype("int8"),
+    }
+    if explain:
+        with metrics.span("batch_explain"):
+            bias, contributions = explain_risk(loaded.model, X)
+        output["bias"] = bias
+        for name, column in zip(loaded.pipeline.columns, contributions.T):
+            output[f"contribution_{name}"] = column
+    return pd.DataFrame(output)
+
+
+def _init_worker(models_dir, version, drift):
+    global _worker_loaded, _worker_reference
+    # Workers map the same forest files, so their pages are shared
+    store = ModelStore(models_dir)
+    _worker_loaded = store.load(version)
+    _worker_reference = store.drift_reference(version) if drift else None
+
+
+def _score_in_worker(chunk, explain):
+    # The chunk's drift counts travel back with it; the parent merges them.
+    # Audit records go to this worker's own segment, on disk before the
+    # chunk is handed back (pool workers exit without running atexit hooks).
+    sketch = _worker_reference.empty() if _worker_reference is not None else None
+    audit = get_log("batch")
+    frame = score_chunk(_worker_loaded, chunk, explain, sketch, audit)
+    audit.flush()
+    return frame, sketch
+
+
+def _report(rows, started):
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Progress: {rows:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+
+
+def score_csv(input_path, output_path, models_dir=MODELS_DIR, version=None,
+              chunksize=DEFAULT_CHUNKSIZE, jobs=1, quiet=False, explain=False, drift=True):
+    """Stream ``input_path`` through the model into ``output_path``.
+
+    ``version`` defaults to the store's active version. Returns
+    ``(rows, seconds, version)``. With ``jobs > 1`` chunks are scored in a
+    process pool; at most ``2 * jobs`` chunks are held in memory at once and
+    results are still written in input order. ``explain`` adds the
+    per-feature attribution columns; ``drift=False`` keeps the rows out of
+    the drift monitor.
+    """
+    started = time.perf_counter()
+    store = ModelStore(models_dir)
+    loaded = store.load(version) if version else ModelHandle(store).get()
+    monitor = get_monitor(store, loaded.version, "batch") if drift else None
+    audit = get_log("batch")
+    rows = 0
+    header = True
+    reader = pd.read_csv(input_path, chunksize=chunksize)
+
+    def write(frame, sketch):
+        nonlocal rows, header
+        if monitor is not None:
+            monitor.merge(sketch)
+        frame.to_csv(output_path, mode="w" if header else "a", header=header, index=False)
+        header = False
+        rows += len(frame)
+        PREDICTIONS.inc(len(frame), source="batch")
+        if not quiet:
+            _report(rows, started)
+
+    if jobs <= 1:
+        for chunk in reader:
+            sketch = monitor.reference.empty() if monitor is not None else None
+            write(score_chunk(loaded, chunk, explain, sketch, audit), sketch)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(models_dir, loaded.version, drift)) as pool:
+            pending = deque()
+            for chunk in reader:
+                pending.append(pool.submit(_score_in_worker, chunk, explain))
+                if len(pending) >= 2 * jobs:
+                    write(*pending.popleft().result())
+            while pending:
+                write(*pending.popleft().result())
+
+    if header:
+        # Empty input: still produce a well-formed file
+        pd.DataFrame(columns=output_columns(loaded, explain)).to_csv(output_path, index=False)
+    if monitor is not None:
+        monitor.flush()
+    audit.flush()
+
+    return rows, time.perf_counter() - started, loaded.version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a patient CSV with the heart model.")
+    parser.add_argument("input", help="CSV shaped like Cardiovascular_Disease_Dataset.csv")
+    parser.add_argument("output", help="Destination CSV (patientid, probability, label)")
+    parser.add_argument("--models-dir", default=str(MODELS_DIR), help="Model store directory")
+    parser.add_argument("--version", help="Model version to use (default: the active one)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Rows read and scored per chunk (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Worker processes used for scoring (default: %(default)s)")
+    parser.add_argument("--explain", action="store_true",
+                        help="Add per-feature contribution columns to the output")
+    parser.add_argument("--quiet", action="store_true", help="Only print the final summary")
+    parser.add_argument("--no-drift", action="store_true",
+                        help="Do not count these rows in the drift monitor")
+    args = parser.parse_args(argv)
+
+    with metrics.Profile("batch"):
+        rows, seconds, version = score_csv(args.input, args.output, models_dir=args.models_dir,
+                                           version=args.version, chunksize=args.chunksize,
+                                           jobs=args.jobs, quiet=args.quiet, explain=args.explain,
+                                           drift=not args.no_drift)
+    metrics.write_textfile()
+    rate = rows / seconds if seconds > 0 else 0.0
+    print(f"Scored {rows:,} rows with model {version} in {seconds:.2f}s "
+          f"({rate:,.0f} rows/s) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
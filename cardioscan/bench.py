@@ -0,0 +1,228 @@
+"""Offline benchmark suite for the training, loading and inference paths.
+
+Datasets are synthesized from the bundled CSV (resampled rows with jittered
+measurements), so nothing needs to be downloaded::
+
+    python -m cardioscan.bench --out bench_results.json
+    python -m cardioscan.bench --quick --baseline bench_baseline.json
+    python -m cardioscan.bench --save-baseline bench_baseline.json
+
+Results are written as JSON: one entry per metric with its value, unit and
+whether lower or higher is better. With ``--baseline`` every metric is
+compared to the stored run and the exit status is 1 if any got worse by more
+than ``--tolerance`` (relative).
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+
+from cardioscan.dataset import DATA_PATH, load_dataset
+from cardioscan.evaluation import TARGET
+from cardioscan.features import FeaturePipeline
+from cardioscan.model_store import ModelStore
+
+DEFAULT_TOLERANCE = 0.25
+# Measurements, not categories: these get jitter when synthesizing rows
+CONTINUOUS_COLUMNS = ("age", "restingBP", "serumcholestrol", "maxheartrate", "oldpeak")
+
+FULL_PLAN = {
+    "load_rows": [100_000, 1_000_000],
+    "fit_rows": [1_000, 10_000, 50_000],
+    "fit_trees": [10, 50, 100],
+    "batch_sizes": [1, 16, 256, 4096, 65_536],
+    "latency_calls": 500,
+}
+QUICK_PLAN = {
+    "load_rows": [20_000],
+    "fit_rows": [1_000, 5_000],
+    "fit_trees": [10, 50],
+    "batch_sizes": [1, 256, 4096],
+    "latency_calls": 100,
+}
+
+
+def synthesize(data, n_rows, seed=0):
+    """Resample ``data`` to ``n_rows`` rows with jittered continuous columns."""
+    rng = np.random.default_rng(seed)
+    sample = data.iloc[rng.integers(0, len(data), n_rows)].reset_index(drop=True).copy()
+    for column in CONTINUOUS_COLUMNS:
+        values = data[column].to_numpy(dtype=np.float64)
+        jitter = rng.normal(0.0, 0.05 * values.std(), n_rows)
+        jittered = np.clip(sample[column].to_numpy(dtype=np.float64) + jitter, values.min(), values.max())
+        sample[column] = jittered.round(1) if column == "oldpeak" else jittered.round()
+        sample[column] = sample[column].astype(data[column].dtype)
+    sample["patientid"] = np.arange(n_rows, dtype=np.int64) + 1_000_000
+    return sample
+
+
+def _best_of(fn, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+class Results:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better="lower"):
+        self.metrics[name] = {"value": float(value), "unit": unit, "better": better}
+        print(f"  {name:<48} {value:>14.4f} {unit}", flush=True)
+
+
+def bench_load(results, data, plan, workdir):
+    print("CSV load")
+    for rows in plan["load_rows"]:
+        path = workdir / f"synthetic_{rows}.csv"
+        synthesize(data, rows, seed=rows).to_csv(path, index=False)
+        cache = workdir / f"dataset_cache_{rows}"
+        results.add(f"load.read_csv.{rows}", _best_of(lambda: pd.read_csv(path)), "s")
+        started = time.perf_counter()
+        load_dataset(path, cache)
+        results.add(f"load.columnar_cold.{rows}", time.perf_counter() - started, "s")
+        results.add(f"load.columnar_warm.{rows}", _best_of(lambda: load_dataset(path, cache)), "s")
+
+
+def bench_fit(results, data, plan):
+    print("Training")
+    pipeline = FeaturePipeline()
+    for rows in plan["fit_rows"]:
+        sample = synthesize(data, rows, seed=rows)
+        X = pipeline.frame(sample)
+        for trees in plan["fit_trees"]:
+            model = RandomForestClassifier(n_estimators=trees, random_state=0)
+            elapsed = _best_of(lambda: model.fit(X, sample[TARGET]), repeats=1)
+            results.add(f"fit.rows_{rows}.trees_{trees}", elapsed, "s")
+
+
+def bench_artifacts(results, data, workdir):
+    print("Artifact load")
+    model = RandomForestClassifier(random_state=0).fit(FeaturePipeline().frame(data), data[TARGET])
+    pickle_path = workdir / "model.pkl"
+    joblib.dump(model, pickle_path)
+    store = ModelStore(workdir / "models")
+    version = store.publish(model, "benchmark")
+    results.add("artifact.joblib_load", _best_of(lambda: joblib.load(pickle_path)), "s")
+    results.add("artifact.store_load", _best_of(lambda: store.load(version)), "s")
+    return model, store.load(version).model
+
+
+def bench_inference(results, data, plan, model, forest):
+    print("Inference")
+    pipeline = FeaturePipeline()
+    frame = pipeline.frame(data)
+    rows = frame.to_numpy(dtype=np.float64)
+    for name, predictor, single in (("sklearn", model, lambda i: frame.iloc[i:i + 1]),
+                                    ("flat", forest, lambda i: rows[i:i + 1])):
+        predictor.predict_proba(single(0))
+        latencies = np.empty(plan["latency_calls"])
+        for call in range(plan["latency_calls"]):
+            row = single(call % len(rows))
+            started = time.perf_counter()
+            predictor.predict_proba(row)
+            latencies[call] = time.perf_counter() - started
+        for percentile in (50, 95, 99):
+            results.add(f"latency.{name}.p{percentile}",
+                        np.percentile(latencies, percentile) * 1000, "ms")
+
+    for batch in plan["batch_sizes"]:
+        X = pipeline.frame(synthesize(data, batch, seed=batch))
+        values = X.to_numpy(dtype=np.float64)
+        # Small batches are noisy; give them more attempts at a clean timing
+        repeats = max(3, min(100, 4096 // batch))
+        results.add(f"throughput.sklearn.batch_{batch}",
+                    batch / _best_of(lambda: model.predict_proba(X), repeats), "rows/s", better="higher")
+        results.add(f"throughput.flat.batch_{batch}",
+                    batch / _best_of(lambda: forest.predict_proba(values), repeats), "rows/s",
+                    better="higher")
+
+
+def run(quick=False, data_path=DATA_PATH):
+    plan = QUICK_PLAN if quick else FULL_PLAN
+    data = pd.read_csv(data_path)
+    results = Results()
+    with tempfile.TemporaryDirectory(prefix="cardioscan-bench-") as tmp:
+        workdir = Path(tmp)
+        bench_load(results, data, plan, workdir)
+        bench_fit(results, data, plan)
+        model, forest = bench_artifacts(results, data, workdir)
+        bench_inference(results, data, plan, model, forest)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "plan": "quick" if quick else "full",
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "metrics": results.metrics,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return ``(name, baseline, current, change)`` for every regressed metric.
+
+    ``change`` is the relative slowdown (lower-is-better metrics) or loss
+    (higher-is-better metrics); metrics missing from either run are skipped.
+    """
+    regressions = []
+    for name, old in baseline["metrics"].items():
+        new = current["metrics"].get(name)
+        if new is None or old["value"] <= 0:
+            continue
+        if old["better"] == "lower":
+            change = new["value"] / old["value"] - 1.0
+        else:
+            change = 1.0 - new["value"] / old["value"]
+        if change > tolerance:
+            regressions.append((name, old["value"], new["value"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CardioScan pipeline.")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes for a fast smoke run")
+    parser.add_argument("--data", default=str(DATA_PATH), help="Seed CSV for synthetic datasets")
+    parser.add_argument("--out", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON")
+    parser.add_argument("--save-baseline", help="Also write results as the new baseline here")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    current = run(args.quick, args.data)
+    for path in (args.out, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(current, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for name, old, new, change in regressions:
+                print(f"  {name}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+"""Histogram-binned, out-of-core random forest training.
+
+The exact-split trainer loads the whole CSV as float64 and sorts feature
+values at every node. This mode parses the CSV once, chunk by chunk, and
+keeps everything else in memory-mapped scratch files::
+
+    python train_model.py --binned [--max-bins 64] [--chunk-rows 100000] [--jobs 4]
+
+1. While parsing, every feature's training values are folded into a
+   bounded, mergeable (value, weight) summary, and the float32 rows are
+   spilled to disk. The summary's quantiles become at most ``max_bins``
+   buckets (one per distinct value for low-cardinality fields).
+2. The spilled rows are rewritten as ``uint8`` bucket codes (12 bytes a row
+   for the clinical features).
+3. Trees grow on the mapped codes. Each tree draws a bootstrap of at most
+   ``max_samples`` rows and grows level by level from per-node
+   ``(feature, bin, class)`` count histograms, one ``bincount`` per level,
+   so a split search costs O(rows x features + bins) instead of a sort.
+4. The exported forest scores the spilled held-out rows for the metrics,
+   the cohort index's risk column and the drift reference.
+
+Resident memory while fitting is one chunk plus one tree's bootstrap; fit
+time is bounded by ``max_samples``, not row count. Step 4 scores and counts
+the drift reference a chunk at a time, but the rest of it grows with the
+data: the held-out risk, and the cohort index, which reads its five columns
+of every row and keeps three clinical metrics per row as sorted float64.
+
+Code ``c`` of feature ``f`` means ``edges[f][c-1] < x <= edges[f][c]``, so a
+split "code <= b" is exactly the float split ``x <= edges[f][b]``. The trees
+are exported as a ``FlatForest`` with those thresholds, which the model
+store, quantizer and compressor handle like any other forest. Held-out rows
+are chosen by ``patientid`` hash, as in ``cardioscan.incremental``.
+"""
+
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cardioscan import metrics
+from cardioscan.cohort import METRICS, RISK, CohortIndex
+from cardioscan.drift import DriftSketch
+from cardioscan.evaluation import TARGET, classification_metrics, is_test_row
+from cardioscan.flat_forest import FlatForest
+from cardioscan.inference import POSITIVE_CLASS, ROOT_DIR
+
+# Scratch space for the binned matrix; on disk, since /tmp is often RAM-backed
+WORK_DIR = ROOT_DIR / ".cache" / "binned"
+DEFAULT_MAX_BINS = 64
+MAX_BINS = 256  # codes are uint8
+DEFAULT_CHUNK_ROWS = 100_000
+# Rows drawn per tree; beyond this, more data adds trees' worth of variety, not depth
+DEFAULT_MAX_SAMPLES = 250_000
+# Distinct values kept per feature while fitting edges (~max_bins / this quantile error)
+SUMMARY_SIZE = 4096
+# Histogram cells (nodes x features x bins x classes) built at once
+HIST_CELLS = 1 << 20
+# Rows the drift reference's bins are fitted on; every row is then counted
+DRIFT_SAMPLE_ROWS = 100_000
+RANDOM_STATE = 42
+
+# Binned matrix for pool workers (set by _init_worker)
+_worker_data = None
+
+
+def _merge_summary(values, weights, new_values, new_weights, size):
+    """Merge weighted values into a sorted summary of at most ``size`` distinct values.
+
+    Over-full summaries keep the largest value of each of ``size`` equal-weight
+    runs, carrying the run's weight, so quantiles stay within ~1/size.
+    """
+    values, inverse = np.unique(np.concatenate([values, new_values]), return_inverse=True)
+    weights = np.bincount(inverse, weights=np.concatenate([weights, new_weights]))
+    if len(values) > size:
+        cumulative = np.cumsum(weights)
+        run = np.searchsorted(cumulative[-1] * np.arange(1, size + 1) / size, cumulative)
+        run = np.minimum(run, size - 1)
+        last = np.flatnonzero(np.diff(run, append=size))
+        values, weights = values[last], np.bincount(run, weights=weights)[run[last]]
+    return values, weights
+
+
+def _edges(values, weights, max_bins):
+    """Split points between the summary's values at ``max_bins`` quantiles."""
+    if len(values) <= max_bins:
+        cut = np.arange(len(values) - 1)
+    else:
+        cumulative = np.cumsum(weights) / weights.sum()
+        cut = np.unique(np.searchsorted(cumulative, np.arange(1, max_bins) / max_bins))
+        cut = cut[cut < len(values) - 1]
+    # Midpoints in float64 between float32 values, as sklearn places its thresholds
+    low, high = values[cut].astype(np.float64), values[cut + 1].astype(np.float64)
+    return low + (high - low) / 2
+
+
+class BinMapper:
+    """Per-feature quantile bin edges, fitted chunk by chunk."""
+
+    def __init__(self, n_features, max_bins=DEFAULT_MAX_BINS, summary_size=SUMMARY_SIZE):
+        if not 2 <= max_bins <= MAX_BINS:
+            raise ValueError(f"max_bins must be between 2 and {MAX_BINS}, got {max_bins}")
+        self.max_bins = max_bins
+        self.summary_size = max(summary_size, max_bins)
+        self._summaries = [(np.empty(0, np.float32), np.empty(0)) for _ in range(n_features)]
+        self.edges = None
+
+    def partial_fit(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        for index, column in enumerate(X.T):
+            new_values, counts = np.unique(column, return_counts=True)
+            self._summaries[index] = _merge_summary(*self._summaries[index], new_values, counts,
+                                                    self.summary_size)
+        return self
+
+    def finalize(self):
+        self.edges = [_edges(values, weights, self.max_bins) for values, weights in self._summaries]
+        return self
+
+    @property
+    def n_bins(self):
+        return np.array([len(edges) + 1 for edges in self.edges], dtype=np.int64)
+
+    def transform(self, X):
+        """``uint8`` codes of the float32 matrix ``X``."""
+        X = np.asarray(X, dtype=np.float32)
+        codes = np.empty(X.shape, dtype=np.uint8)
+        for index, edges in enumerate(self.edges):
+            codes[:, index] = np.searchsorted(edges, X[:, index], side="left")
+        return codes
+
+
+class BinnedDataset:
+    """Every row as float32 features, ``uint8`` codes and labels, all memory-mapped.
+
+    ``directory`` holds the rows as parsed (``features.bin``, ``labels.bin``,
+    the held-out mask ``test.bin`` and training row numbers ``train.bin``),
+    their codes (``codes.npy``) and the edges (``bins.json``). The object
+    pickles as its path, so pool workers map the same files.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / "bins.json").read_text())
+        self.columns = meta["columns"]
+        self.classes = np.asarray(meta["classes"])
+        self.edges = [np.asarray(edges, dtype=np.float64) for edges in meta["edges"]]
+        self.rows = meta["rows"]
+
+    def __getstate__(self):
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+
+    def _spill(self, name, dtype, shape=None):
+        return np.memmap(self.directory / f"{name}.bin", dtype=dtype, mode="r", shape=shape)
+
+    @property
+    def features(self):
+        return self._spill("features", np.float32, (self.rows, len(self.columns)))
+
+    @property
+    def codes(self):
+        return np.load(self.directory / "codes.npy", mmap_mode="r")
+
+    @property
+    def labels(self):
+        return self._spill("labels", np.int64)
+
+    @property
+    def test(self):
+        return self._spill("test", np.bool_)
+
+    @property
+    def train_rows(self):
+        return self._spill("train", np.int64)
+
+    @property
+    def n_bins(self):
+        return np.array([len(edges) + 1 for edges in self.edges], dtype=np.int64)
+
+    @classmethod
+    def build(cls, chunks, columns, directory, max_bins=DEFAULT_MAX_BINS,
+              chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Bin ``chunks`` into ``directory`` in one pass over the input.
+
+        ``chunks`` yields ``(X, y, is_test)`` triples: the float32 feature
+        matrix, labels and held-out mask. Edges are fitted on training rows
+        only; codes are then written from the spilled features.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        mapper = BinMapper(len(columns), max_bins)
+        rows = n_train = 0
+        classes = np.empty(0, dtype=np.int64)
+        spills = {name: open(directory / f"{name}.bin", "wb")
+                  for name in ("features", "labels", "test", "train")}
+        try:
+            for X, y, held_out in chunks:
+                X = np.ascontiguousarray(X, dtype=np.float32)
+                y, held_out = np.asarray(y, dtype=np.int64), np.asarray(held_out, dtype=bool)
+                mapper.partial_fit(X[~held_out])
+                classes = np.union1d(classes, y)
+                spills["features"].write(X.tobytes())
+                spills["labels"].write(y.tobytes())
+                spills["test"].write(held_out.tobytes())
+                spills["train"].write((rows + np.flatnonzero(~held_out)).astype(np.int64).tobytes())
+                rows += len(X)
+                n_train += int((~held_out).sum())
+        finally:
+            for spill in spills.values():
+                spill.close()
+        if n_train == 0:
+            raise ValueError("no training rows to bin")
+        mapper.finalize()
+
+        meta = {"columns": list(columns), "classes": classes.tolist(), "rows": rows,
+                "edges": [edges.tolist() for edges in mapper.edges]}
+        (directory / "bins.json").write_text(json.dumps(meta))
+        dataset = cls(directory)
+        features = dataset.features
+        codes = np.lib.format.open_memmap(directory / "codes.npy", mode="w+", dtype=np.uint8,
+                                          shape=features.shape)
+        for start in range(0, rows, chunk_rows):
+            codes[start:start + chunk_rows] = mapper.transform(features[start:start + chunk_rows])
+        codes.flush()
+        return dataset
+
+
+def _max_features(max_features, n_features):
+    if max_features == "sqrt":
+        return max(1, int(np.sqrt(n_features)))
+    if max_features == "log2":
+        return max(1, int(np.log2(n_features)))
+    if max_features is None:
+        return n_features
+    if isinstance(max_features, float):
+        return max(1, int(max_features * n_features))
+    return min(int(max_features), n_features)
+
+
+def _grow_tree(X, y, n_bins, n_classes, max_features, max_depth, min_samples_leaf, rng):
+    """Grow one tree on the in-memory code matrix ``X``, breadth first.
+
+    Returns the node arrays in breadth-first order (``feature`` is -1 for
+    leaves) plus per-node class counts, depths and per-feature impurity
+    decrease.
+    """
+    n_rows, n_features = X.shape
+    n_cells = int(n_bins.max())
+    capacity = 2 * n_rows + 1
+    feature = np.full(capacity, -1, dtype=np.int32)
+    split_bin = np.zeros(capacity, dtype=np.int32)
+    left = np.zeros(capacity, dtype=np.int32)
+    right = np.zeros(capacity, dtype=np.int32)
+    counts = np.zeros((capacity, n_classes), dtype=np.float64)
+    depth = np.zeros(capacity, dtype=np.int32)
+    importances = np.zeros(n_features)
+    counts[0] = np.bincount(y, minlength=n_classes)
+    n_nodes = 1
+
+    def can_split(nodes, level):
+        sizes = counts[nodes].sum(axis=1)
+        impure = (counts[nodes] > 0).sum(axis=1) > 1
+        deep_enough = max_depth is not None and level >= max_depth
+        return nodes[impure & (sizes >= 2 * min_samples_leaf) & (not deep_enough)]
+
+    # Rows of the open nodes, grouped by the node's slot in ``open_nodes``
+    open_nodes = can_split(np.array([0]), 0)
+    rows = np.arange(n_rows) if len(open_nodes) else np.empty(0, dtype=np.int64)
+    slots = np.zeros(len(rows), dtype=np.int64)
+    level = 0
+    group = max(1, HIST_CELLS // (n_features * n_cells * n_classes))
+    while len(open_nodes):
+        bounds = np.searchsorted(slots, np.arange(len(open_nodes) + 1))
+        next_nodes, next_rows, next_slots = [], [], []
+        for first in range(0, len(open_nodes), group):
+            nodes = open_nodes[first:first + group]
+            lo, hi = bounds[first], bounds[first + len(nodes)]
+            block_rows, block_slots = rows[lo:hi], slots[lo:hi] - first
+            codes, labels = X[block_rows], y[block_rows]
+            # One bincount per feature keeps the keys at one int64 per row
+            shape = (len(nodes), n_cells, n_classes)
+            base = block_slots * (n_cells * n_classes) + labels
+            hist = np.stack([np.bincount(base + codes[:, index] * n_classes,
+                                         minlength=np.prod(shape)).reshape(shape)
+                             for index in range(n_features)], axis=1)
+            # Class counts left of each candidate split "code <= b", and right of it
+            below = hist.cumsum(axis=2)
+            total = counts[nodes][:, None, None, :]
+            above = total - below
+            n_below, n_above = below.sum(axis=3), above.sum(axis=3)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Gini: n * impurity = n - sum(c^2) / n, so maximise sum(c^2) / n over both sides
+                score = (below ** 2).sum(axis=3) / n_below + (above ** 2).sum(axis=3) / n_above
+            score[(n_below < min_samples_leaf) | (n_above < min_samples_leaf)] = -np.inf
+
+            # Like sklearn, draw max_features among the features that can split at all
+            best_bin = score.argmax(axis=2)
+            best = np.take_along_axis(score, best_bin[:, :, None], axis=2)[:, :, 0]
+            usable = np.isfinite(best)
+            draw = rng.random(best.shape)
+            draw[~usable] = np.inf
+            rank = draw.argsort(axis=1).argsort(axis=1)
+            best[~usable | (rank >= max_features)] = -np.inf
+            chosen = best.argmax(axis=1)
+            split = np.isfinite(best[np.arange(len(nodes)), chosen])
+            if not split.any():
+                continue
+
+            parents = nodes[split]
+            f, b = chosen[split], best_bin[split, chosen[split]]
+            parent_counts = counts[parents]
+            n_parent = parent_counts.sum(axis=1)
+            left_counts = below[np.flatnonzero(split), f, b]
+            gain = best[split, f] - (parent_counts ** 2).sum(axis=1) / n_parent
+            np.add.at(importances, f, gain)
+
+            children = n_nodes + np.arange(2 * len(parents), dtype=np.int32)
+            n_nodes += len(children)
+            feature[parents], split_bin[parents] = f, b
+            left[parents], right[parents] = children[0::2], children[1::2]
+            counts[children[0::2]] = left_counts
+            counts[children[1::2]] = parent_counts - left_counts
+            depth[children] = level + 1
+
+            # Route the rows of split nodes; rows of new leaves drop out
+            slot_split = np.full(len(nodes), -1, dtype=np.int64)
+            slot_split[split] = np.arange(len(parents))
+            row_split = slot_split[block_slots]
+            kept = row_split >= 0
+            row_split = row_split[kept]
+            goes_right = codes[kept, f[row_split]] > b[row_split]
+            grow = can_split(children, level + 1)
+            child_slot = np.full(len(children), -1, dtype=np.int64)
+            child_slot[grow - children[0]] = np.arange(len(grow)) + sum(map(len, next_nodes))
+            row_slot = child_slot[2 * row_split + goes_right]
+            keep = row_slot >= 0
+            order = np.argsort(row_slot[keep], kind="stable")
+            next_nodes.append(grow)
+            next_rows.append(block_rows[kept][keep][order])
+            next_slots.append(row_slot[keep][order])
+        open_nodes = np.concatenate(next_nodes) if next_nodes else np.empty(0, dtype=np.int32)
+        rows = np.concatenate(next_rows) if next_rows else np.empty(0, dtype=np.int64)
+        slots = np.concatenate(next_slots) if next_slots else np.empty(0, dtype=np.int64)
+        level += 1
+
+    size = slice(0, n_nodes)
+    return (feature[size], split_bin[size], left[size], right[size], counts[size], depth[size],
+            importances)
+
+
+def _preorder(feature, left, right, depth):
+    """Preorder position of every node of a breadth-first tree (parents before children)."""
+    n_nodes = len(feature)
+    internal = np.flatnonzero(feature >= 0)
+    subtree = np.ones(n_nodes, dtype=np.int64)
+    for level in range(int(depth.max()), -1, -1):
+        nodes = internal[depth[internal] == level]
+        subtree[nodes] += subtree[left[nodes]] + subtree[right[nodes]]
+    position = np.zeros(n_nodes, dtype=np.int64)
+    for level in range(int(depth.max()) + 1):
+        nodes = internal[depth[internal] == level]
+        position[left[nodes]] = position[nodes] + 1
+        position[right[nodes]] = position[nodes] + 1 + subtree[left[nodes]]
+    return position
+
+
+def _export_tree(tree, edges, offset):
+    """Global preorder FlatForest arrays of one grown tree."""
+    feature, split_bin, left, right, counts, depth, _ = tree
+    position = _preorder(feature, left, right, depth)
+    n_nodes = len(feature)
+    leaf = feature < 0
+    ids = position + offset
+    out_feature = np.zeros(n_nodes, dtype=np.int32)
+    out_threshold = np.full(n_nodes, np.inf)
+    out_left, out_right = np.empty(n_nodes, dtype=np.int32), np.empty(n_nodes, dtype=np.int32)
+    out_value = np.empty_like(counts)
+    internal = np.flatnonzero(~leaf)
+    out_feature[position[internal]] = feature[internal]
+    out_threshold[position[internal]] = [edges[f][b] for f, b in zip(feature[internal],
+                                                                   split_bin[internal])]
+    out_left[position] = np.where(leaf, ids, ids[left])
+    out_right[position] = np.where(leaf, ids, ids[right])
+    out_value[position] = counts / counts.sum(axis=1, keepdims=True)
+    return out_feature, out_threshold, out_left, out_right, out_value, int(depth.max())
+
+
+def _init_worker(dataset):
+    global _worker_data
+    _worker_data = dataset
+
+
+def _fit_tree(params, seed):
+    """Draw a bootstrap from the mapped matrix and grow one tree on it."""
+    dataset = _worker_data
+    codes, train_rows = dataset.codes, dataset.train_rows
+    rng = np.random.default_rng(seed)
+    n_rows = len(train_rows)
+    n_samples = min(n_rows, params["max_samples"] or n_rows)
+    # Sorted draws turn the gather into one forward sweep over the file
+    rows = train_rows[np.sort(rng.integers(0, n_rows, size=n_samples))]
+    labels = np.searchsorted(dataset.classes, dataset.labels[rows])
+    return _grow_tree(np.asarray(codes[rows]), labels,
+                      dataset.n_bins, len(dataset.classes),
+                      _max_features(params["max_features"], codes.shape[1]),
+                      params["max_depth"], params["min_samples_leaf"], rng)
+
+
+class BinnedForestClassifier:
+    """Random forest grown on a ``BinnedDataset``; see the module docstring.
+
+    Parameters mirror ``RandomForestClassifier``'s where they mean the same
+    thing. The fitted trees are held as a ``FlatForest`` (``to_flat()``),
+    which also does the predicting.
+    """
+
+    def __init__(self, n_estimators=100, max_depth=None, min_samples_leaf=1, max_features="sqrt",
+                 max_samples=DEFAULT_MAX_SAMPLES, max_bins=DEFAULT_MAX_BINS,
+                 random_state=RANDOM_STATE, n_jobs=None):
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.max_features = max_features
+        self.max_samples = max_samples
+        self.max_bins = max_bins
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+
+    def get_params(self, deep=True):
+        return {name: getattr(self, name) for name in (
+            "n_estimators", "max_depth", "min_samples_leaf", "max_features", "max_samples",
+            "max_bins", "random_state", "n_jobs")}
+
+    def fit(self, dataset):
+        """Grow ``n_estimators`` trees on a ``BinnedDataset``."""
+        params = {name: getattr(self, name) for name in (
+            "max_features", "max_depth", "min_samples_leaf", "max_samples")}
+        seeds = np.random.SeedSequence(self.random_state).spawn(self.n_estimators)
+        jobs = self.n_jobs or 1
+        if jobs == 1:
+            _init_worker(dataset)
+            trees = [_fit_tree(params, seed) for seed in seeds]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs if jobs > 0 else os.cpu_count(),
+                                     initializer=_init_worker, initargs=(dataset,)) as pool:
+                trees = list(pool.map(_fit_tree, [params] * len(seeds), seeds))
+
+        arrays, roots, offset, max_depth = [], [], 0, 0
+        importances = np.zeros(len(dataset.columns))
+        for tree in trees:
+            *exported, depth = _export_tree(tree, dataset.edges, offset)
+            arrays.append(exported)
+            roots.append(offset)
+            offset += len(exported[0])
+            max_depth = max(max_depth, depth)
+            if tree[-1].sum() > 0:
+                importances += tree[-1] / tree[-1].sum()
+        feature, threshold, left, right, value = (np.concatenate(parts) for parts in zip(*arrays))
+        self.forest_ = FlatForest(feature, threshold, left, right, np.ascontiguousarray(value),
+                                  np.asarray(roots, dtype=np.int32), max_depth, dataset.classes,
+                                  dataset.columns)
+        self.classes_ = self.forest_.classes_
+        self.feature_names_in_ = self.forest_.feature_names_in_
+        self.n_features_in_ = self.forest_.n_features_in_
+        total = importances.sum()
+        self.feature_importances_ = importances / total if total > 0 else importances
+        return self
+
+    def to_flat(self):
+        return self.forest_
+
+    def predict_proba(self, X):
+        return self.forest_.predict_proba(X)
+
+    def predict(self, X):
+        return self.forest_.predict(X)
+
+
+def score_rows(forest, dataset, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Held-out metrics, cohort index and drift reference of ``dataset``, scored by ``forest``.
+
+    The drift bins are fitted on a sample of rows (and all held-out risk),
+    then every chunk is counted into them. The cohort index is built from
+    only the columns it reads.
+    """
+    features, labels, test = dataset.features, dataset.labels, np.asarray(dataset.test)
+    positive = list(forest.classes_).index(POSITIVE_CLASS)
+    # Only held-out rows are scored: the forest is overconfident on its training rows
+    held_out = np.flatnonzero(test)
+    risk = np.empty(len(held_out))
+    y_pred = []
+    for start in range(0, len(held_out), chunk_rows):
+        proba = forest.predict_proba(features[held_out[start:start + chunk_rows]])
+        risk[start:start + chunk_rows] = proba[:, positive]
+        y_pred.append(forest.classes_.take(proba.argmax(axis=1)))
+    scores = classification_metrics(labels[test], np.concatenate(y_pred)) if test.any() else {}
+
+    rng = np.random.default_rng(RANDOM_STATE)
+    sample = np.sort(rng.choice(dataset.rows, size=min(dataset.rows, DRIFT_SAMPLE_ROWS),
+                                replace=False))
+    drift = DriftSketch.fit(dataset.columns, features[sample], risk).empty().update(risk=risk)
+    for start in range(0, dataset.rows, chunk_rows):
+        drift.update(features[start:start + chunk_rows])
+
+    indexed = ["age", "gender"] + [metric for metric in METRICS if metric != RISK]
+    keep = [dataset.columns.index(name) for name in indexed]
+    cohort = CohortIndex.build(indexed, features[:, keep], risk, features[np.ix_(held_out, keep)])
+    return scores, cohort, drift
+
+
+def train_csv(path, pipeline, params=None, chunk_rows=DEFAULT_CHUNK_ROWS, work_dir=WORK_DIR):
+    """Train on the CSV at ``path`` without loading it whole.
+
+    Returns ``(model, metrics, cohort, drift, rows)``: the fitted
+    ``BinnedForestClassifier``, held-out metrics, the cohort index of every
+    row (with held-out risk), the drift reference sketch and the number of rows read.
+    """
+    chunks = ((pipeline.transform(chunk), chunk[TARGET].to_numpy(),
+               is_test_row(chunk["patientid"].to_numpy()))
+              for chunk in pd.read_csv(path, chunksize=chunk_rows))
+    model = BinnedForestClassifier(**(params or {}))
+    Path(work_dir).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=work_dir) as scratch:
+        with metrics.span("bin"):
+            dataset = BinnedDataset.build(chunks, pipeline.columns, scratch, model.max_bins,
+                                          chunk_rows)
+        with metrics.span("fit"):
+            model.fit(dataset)
+        # Scored by the exported forest on the parsed floats, i.e. exactly as served
+        with metrics.span("evaluate"):
+            scores, cohort, drift = score_rows(model.to_flat(), dataset, chunk_rows)
+        return model, scores, cohort, drift, dataset.rows
@@ -0,0 +1,202 @@
+"""Percentile of a patient within their age and gender band of the reference cohort.
+
+The index holds, for every stratum (age band x gender), the sorted values of
+each compared metric: predicted risk, resting BP, serum cholesterol and max
+heart rate. Strata are contiguous slices of one array per metric, so a
+lookup is one ``searchsorted`` per metric instead of a groupby per click::
+
+    index = CohortIndex.build(pipeline.columns, X, risk_test, X_test)
+    index.percentiles(pipeline.columns, patient_row, patient_risk)
+    # {"risk": 71.5, "restingBP": 40.0, ...}, plus the stratum size
+
+The clinical metrics index every row; the risk column only the held-out
+rows (``risk_X``), because a forest is overconfident on the rows it trained
+on. Each metric therefore has its own stratum offsets.
+
+Percentiles are mid-rank: the share of the stratum below the value plus
+half of the ties. The index is stored with each model version (``cohort/``)
+and built when the version is published. ``insert`` merges new rows into
+the sorted arrays without re-sorting them; ``with_risk`` replaces the risk
+column, e.g. for a new model.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 2
+META_FILE = "cohort.json"
+RISK = "risk"
+METRICS = (RISK, "restingBP", "serumcholestrol", "maxheartrate")
+# Lower edges of the age bands after the first: <40, 40-49, 50-59, 60-69, 70+
+AGE_BANDS = (40, 50, 60, 70)
+GENDERS = ("women", "men")  # by the pipeline's gender code
+
+
+def _sorted_by_stratum(strata, values):
+    order = np.lexsort((values, strata))
+    return np.asarray(values, dtype=np.float64)[order]
+
+
+class CohortIndex:
+    def __init__(self, offsets, values, age_bands=AGE_BANDS):
+        self.offsets = offsets  # {metric: stratum start offsets into values[metric], plus the end}
+        self.values = values
+        self.age_bands = tuple(age_bands)
+
+    @property
+    def n_strata(self):
+        return (len(self.age_bands) + 1) * len(GENDERS)
+
+    @property
+    def rows(self):
+        """Patient rows indexed for the clinical metrics."""
+        return max((int(offsets[-1]) for metric, offsets in self.offsets.items()
+                    if metric != RISK), default=0)
+
+    @property
+    def risk_rows(self):
+        return int(self.offsets[RISK][-1]) if RISK in self.offsets else 0
+
+    def strata(self, columns, X):
+        """Stratum of every row of the encoded matrix ``X``."""
+        X = np.atleast_2d(X)
+        band = np.searchsorted(self.age_bands, X[:, columns.index("age")], side="right")
+        return band * len(GENDERS) + X[:, columns.index("gender")].astype(np.int64)
+
+    def describe(self, stratum):
+        """Readable stratum name, e.g. ``"men aged 50-59"``."""
+        band, gender = divmod(int(stratum), len(GENDERS))
+        edges = (None,) + self.age_bands + (None,)
+        low, high = edges[band], edges[band + 1]
+        if low is None:
+            ages = f"under {high}"
+        elif high is None:
+            ages = f"{low} and over"
+        else:
+            ages = f"{low}-{high - 1}"
+        return f"{GENDERS[gender]} aged {ages}"
+
+    def _offsets(self, strata):
+        return np.concatenate([[0], np.cumsum(
+            np.bincount(strata, minlength=self.n_strata))]).astype(np.int64)
+
+    @classmethod
+    def build(cls, columns, X, risk, risk_X=None, age_bands=AGE_BANDS):
+        """Index the encoded rows ``X`` (model columns), and ``risk`` of the rows ``risk_X``.
+
+        ``risk_X`` defaults to ``X``; pass the held-out rows and their risk.
+        """
+        index = cls({}, {}, age_bands)
+        strata = index.strata(columns, X)
+        for metric in METRICS[1:]:
+            index.offsets[metric] = index._offsets(strata)
+            index.values[metric] = _sorted_by_stratum(strata, X[:, columns.index(metric)])
+        return index.with_risk(columns, X if risk_X is None else risk_X, risk)
+
+    def _merge(self, metric, strata, new):
+        counts = np.bincount(strata, minlength=self.n_strata)
+        current, current_offsets = self.values[metric], self.offsets[metric]
+        order = np.lexsort((new, strata))
+        new, new_strata = np.asarray(new, dtype=np.float64)[order], strata[order]
+        positions = np.empty(len(new), dtype=np.int64)
+        for stratum in np.flatnonzero(counts):
+            lo, hi = current_offsets[stratum], current_offsets[stratum + 1]
+            rows = new_strata == stratum
+            positions[rows] = lo + np.searchsorted(current[lo:hi], new[rows], side="right")
+        return (current_offsets + np.concatenate([[0], np.cumsum(counts)]),
+                np.insert(current, positions, new))
+
+    def insert(self, columns, X, risk=None, risk_X=None):
+        """A new index with rows ``X`` merged in; O(n + k log k) for k new rows.
+
+        ``risk`` (of the rows ``risk_X``, default ``X``) is merged into the
+        risk column; without it the result has no risk column (add it with
+        ``with_risk``).
+        """
+        strata = self.strata(columns, X)
+        offsets, values = {}, {}
+        for metric in self.values:
+            if metric != RISK:
+                offsets[metric], values[metric] = self._merge(metric, strata,
+                                                              X[:, columns.index(metric)])
+            elif risk is not None:
+                risk_strata = strata if risk_X is None else self.strata(columns, risk_X)
+                offsets[RISK], values[RISK] = self._merge(RISK, risk_strata, risk)
+        return CohortIndex(offsets, values, self.age_bands)
+
+    def with_risk(self, columns, X, risk):
+        """A copy whose risk column is rebuilt from the rows ``X`` and their ``risk``."""
+        if len(risk) != len(X):
+            raise ValueError(f"expected {len(X)} risk values, got {len(risk)}")
+        strata = self.strata(columns, X)
+        # Risk stays the first metric, the order the result card shows them in
+        offsets = {RISK: self._offsets(strata), **{metric: offsets for metric, offsets
+                                                   in self.offsets.items() if metric != RISK}}
+        values = {RISK: _sorted_by_stratum(strata, risk), **{metric: values for metric, values
+                                                             in self.values.items() if metric != RISK}}
+        return CohortIndex(offsets, values, self.age_bands)
+
+    def percentiles(self, columns, row, risk):
+        """Mid-rank percentile (0-100) of one patient per metric, within their stratum.
+
+        Returns ``(stratum, size, percentiles)``; ``size`` counts the
+        stratum's patients and ``percentiles`` skips metrics with no
+        reference rows there.
+        """
+        row = np.asarray(row, dtype=np.float64).reshape(-1)
+        stratum = int(self.strata(columns, row)[0])
+        size = 0
+        found = {}
+        for metric, values in self.values.items():
+            lo, hi = self.offsets[metric][stratum], self.offsets[metric][stratum + 1]
+            if metric != RISK:
+                size = max(size, int(hi - lo))
+            if hi == lo:
+                continue
+            value = risk if metric == RISK else row[columns.index(metric)]
+            segment = values[lo:hi]
+            below = np.searchsorted(segment, value, side="left")
+            ties = np.searchsorted(segment, value, side="right") - below
+            found[metric] = float(100.0 * (below + ties / 2) / (hi - lo))
+        return stratum, size, found
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for metric, values in self.values.items():
+            np.save(directory / f"{metric}.npy", values)
+            np.save(directory / f"{metric}.offsets.npy", self.offsets[metric])
+        meta = {"format_version": FORMAT_VERSION, "age_bands": list(self.age_bands),
+                "metrics": list(self.values), "rows": self.rows, "risk_rows": self.risk_rows}
+        (directory / META_FILE).write_text(json.dumps(meta, indent=2))
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        meta = json.loads((directory / META_FILE).read_text())
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported cohort index format: {meta.get('format_version')}")
+        mode = "r" if mmap else None
+        values = {metric: np.load(directory / f"{metric}.npy", mmap_mode=mode).view(np.ndarray)
+                  for metric in meta["metrics"]}
+        offsets = {metric: np.load(directory / f"{metric}.offsets.npy") for metric in meta["metrics"]}
+        return cls(offsets, values, meta["age_bands"])
+
+
+def build_cohort(model, pipeline, data, split=None):
+    """Index every row of the dataset frame ``data``, with ``model``'s held-out risk.
+
+    ``split`` is the version's hold-out split (see ``cardioscan.evaluation``,
+    default ``holdout_split``'s); only the rows it holds out are scored.
+    """
+    from cardioscan.evaluation import HOLDOUT, test_mask
+    from cardioscan.inference import predict_risk
+
+    held_out = data[test_mask(data, split or HOLDOUT)]
+    # A frame keeps the column names an sklearn estimator was fitted with
+    risk = predict_risk(model, pipeline.frame(held_out))
+    return CohortIndex.build(pipeline.columns, pipeline.transform(data), risk,
+                             pipeline.transform(held_out))
@@ -0,0 +1,346 @@
+"""Post-training compression of the served forest, bounded by validation AUC.
+
+The default forest (100 full-depth trees on a few hundred rows) is far larger
+than the data justifies. Compression works on the ``FlatForest`` and never
+touches the sklearn estimator, which the store keeps for retraining:
+
+1. **Depth cap** - nodes at the cap become leaves holding their own class
+   distribution (what the tree would have learned with ``max_depth``).
+2. **Leaf merging** - a split whose two leaves predict the same distribution
+   (within ``merge_tolerance``) is redundant and becomes one leaf, bottom-up.
+3. **Tree selection** - trees are added greedily, each time the one that
+   raises validation AUC most, until AUC is back within ``max_auc_drop`` of
+   the full forest's.
+
+Every depth cap is tried and the feasible result with the fewest nodes wins.
+Cap and selection are chosen on rows that neither trained the forest nor go
+into its published metrics: ``train_model.py --compress`` holds a validation
+split out of the training rows, and compressing an existing version halves
+its held-out split, picking on one half and reporting (trade-off table and
+published metrics) on the other::
+
+    python -m cardioscan.compress --max-auc-drop 0.002 --dry-run
+    python -m cardioscan.compress --max-auc-drop 0.002 --activate
+
+Without ``--activate`` the compressed version is published but not served,
+so the trade-off can be reviewed first (``model_store activate`` later).
+With a small, nearly separable validation half, AUC saturates quickly; the
+report half is what shows the real cost. ``train_model.py --compress``
+compresses as part of training.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from cardioscan.flat_forest import ARRAY_NAMES, FlatForest, flatten
+from cardioscan.inference import POSITIVE_CLASS
+
+DEFAULT_MAX_AUC_DROP = 0.005
+DEFAULT_MERGE_TOLERANCE = 0.0
+LATENCY_CALLS = 200
+
+
+def roc_auc(y_true, scores):
+    """ROC AUC of each row of ``scores`` (candidates, samples) against ``y_true``.
+
+    Mann-Whitney rank sum with mid-ranks, so a tie between a positive and a
+    negative counts one half (small trees produce few distinct
+    probabilities); O(samples log samples) per candidate.
+    """
+    from scipy.stats import rankdata
+
+    scores = np.atleast_2d(scores)
+    y_true = np.asarray(y_true) == POSITIVE_CLASS
+    positives = int(y_true.sum())
+    negatives = len(y_true) - positives
+    if not positives or not negatives:
+        raise ValueError("AUC needs both classes in the validation set")
+    ranks = rankdata(scores, axis=1)[:, y_true].sum(axis=1)
+    return (ranks - positives * (positives + 1) / 2) / (positives * negatives)
+
+
+def _split_trees(forest):
+    """Per-tree copies of the node arrays, with tree-local node indices."""
+    bounds = list(forest.roots) + [forest.n_nodes]
+    trees = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        trees.append({
+            "feature": np.array(forest.feature[start:stop]),
+            "threshold": np.array(forest.threshold[start:stop]),
+            "left": np.array(forest.left[start:stop]) - start,
+            "right": np.array(forest.right[start:stop]) - start,
+            "value": np.array(forest.value[start:stop]),
+        })
+    return trees
+
+
+def _depths(tree):
+    # Nodes are in preorder, so every parent precedes its children
+    depth = np.zeros(len(tree["left"]), dtype=np.int32)
+    for node in range(len(depth)):
+        if tree["left"][node] != node:
+            depth[tree["left"][node]] = depth[tree["right"][node]] = depth[node] + 1
+    return depth
+
+
+def _make_leaf(tree, node):
+    tree["left"][node] = tree["right"][node] = node
+    tree["feature"][node] = 0
+    tree["threshold"][node] = np.inf
+
+
+def _compact(tree):
+    """Drop nodes no longer reachable from the root, keeping preorder."""
+    reachable = np.zeros(len(tree["left"]), dtype=bool)
+    reachable[0] = True
+    for node in range(len(reachable)):
+        if reachable[node]:
+            reachable[tree["left"][node]] = reachable[tree["right"][node]] = True
+    new_ids = np.cumsum(reachable) - 1
+    return {
+        "feature": tree["feature"][reachable],
+        "threshold": tree["threshold"][reachable],
+        "left": new_ids[tree["left"][reachable]],
+        "right": new_ids[tree["right"][reachable]],
+        "value": tree["value"][reachable],
+    }
+
+
+def _join(trees, template):
+    """Concatenate tree-local arrays back into a ``FlatForest`` like ``template``."""
+    offsets = np.cumsum([0] + [len(tree["left"]) for tree in trees[:-1]])
+    return FlatForest(
+        feature=np.concatenate([tree["feature"] for tree in trees]).astype(np.int32),
+        threshold=np.concatenate([tree["threshold"] for tree in trees]).astype(np.float64),
+        left=np.concatenate([tree["left"] + o for tree, o in zip(trees, offsets)]).astype(np.int32),
+        right=np.concatenate([tree["right"] + o for tree, o in zip(trees, offsets)]).astype(np.int32),
+        value=np.ascontiguousarray(np.concatenate([tree["value"] for tree in trees])),
+        roots=offsets.astype(np.int32),
+        max_depth=max(int(_depths(tree).max()) for tree in trees),
+        classes=template.classes_,
+        feature_names=template.feature_names_in_.tolist(),
+    )
+
+
+def select_trees(forest, indices):
+    """A forest of only the trees at ``indices`` (in that order)."""
+    trees = _split_trees(forest)
+    return _join([trees[i] for i in indices], forest)
+
+
+def cap_depth(forest, max_depth):
+    """Turn every node at ``max_depth`` into a leaf with its own distribution."""
+    trees = []
+    for tree in _split_trees(forest):
+        for node in np.flatnonzero(_depths(tree) == max_depth):
+            _make_leaf(tree, node)
+        trees.append(_compact(tree))
+    return _join(trees, forest)
+
+
+def merge_leaves(forest, tolerance=DEFAULT_MERGE_TOLERANCE):
+    """Collapse splits whose two leaves predict within ``tolerance`` of each other.
+
+    The merged leaf keeps the parent's distribution, i.e. the sample-weighted
+    mean of the two; with ``tolerance=0`` predictions only change by rounding.
+    """
+    trees = []
+    for tree in _split_trees(forest):
+        left, right, value = tree["left"], tree["right"], tree["value"]
+        # Reverse preorder visits children first, so merges cascade upwards
+        for node in range(len(left) - 1, -1, -1):
+            l, r = left[node], right[node]
+            if l == node or left[l] != l or left[r] != r:
+                continue
+            if np.abs(value[l] - value[r]).max() <= tolerance:
+                _make_leaf(tree, node)
+        trees.append(_compact(tree))
+    return _join(trees, forest)
+
+
+def greedy_selection(tree_scores, y_val, min_auc):
+    """Smallest greedy tree subset whose averaged scores reach ``min_auc``.
+
+    ``tree_scores`` is (trees, rows) of per-tree positive-class probability.
+    Returns ``(indices, auc)``; if no subset reaches ``min_auc`` the indices
+    cover every tree.
+    """
+    remaining = list(range(len(tree_scores)))
+    chosen, total, auc = [], np.zeros(tree_scores.shape[1]), 0.0
+    while remaining:
+        candidates = (total + tree_scores[remaining]) / (len(chosen) + 1)
+        aucs = roc_auc(y_val, candidates)
+        best = int(np.argmax(aucs))
+        index = remaining.pop(best)
+        chosen.append(index)
+        total += tree_scores[index]
+        auc = float(aucs[best])
+        if auc >= min_auc:
+            break
+    return chosen, auc
+
+
+def _tree_scores(forest, X):
+    column = list(forest.classes_).index(POSITIVE_CLASS)
+    return forest.value[forest.apply(X), column]
+
+
+def compress(forest, X_val, y_val, max_auc_drop=DEFAULT_MAX_AUC_DROP,
+             merge_tolerance=DEFAULT_MERGE_TOLERANCE, depths=None):
+    """Smallest forest within ``max_auc_drop`` of ``forest``'s validation AUC.
+
+    Tries every depth cap in ``depths`` (default: 1 .. the forest's depth)
+    and returns ``(compressed, summary)``; ``summary`` records the chosen
+    cap, the selected trees and both validation AUCs.
+    """
+    reference = float(roc_auc(y_val, _tree_scores(forest, X_val).mean(axis=0))[0])
+    min_auc = reference - max_auc_drop
+    best = None
+    for depth in depths or range(1, forest.max_depth + 1):
+        pruned = merge_leaves(cap_depth(forest, depth), merge_tolerance)
+        indices, auc = greedy_selection(_tree_scores(pruned, X_val), y_val, min_auc)
+        if auc < min_auc:
+            continue
+        candidate = select_trees(pruned, indices)
+        if best is None or candidate.n_nodes < best[0].n_nodes:
+            best = (candidate, {"max_depth": depth, "trees": indices, "validation_auc": auc})
+    if best is None:
+        # Every cap fell short; leaf merging alone is (near-)lossless
+        candidate = merge_leaves(forest, merge_tolerance)
+        best = (candidate, {"max_depth": None, "trees": list(range(forest.n_trees)),
+                            "validation_auc": float(roc_auc(
+                                y_val, _tree_scores(candidate, X_val).mean(axis=0))[0])})
+    compressed, summary = best
+    summary.update({"reference_auc": reference, "max_auc_drop": max_auc_drop,
+                    "merge_tolerance": merge_tolerance})
+    return compressed, summary
+
+
+def _size_bytes(forest):
+    return int(sum(np.asarray(getattr(forest, name)).nbytes for name in ARRAY_NAMES))
+
+
+def _latency_ms(forest, X, calls=LATENCY_CALLS):
+    """Best single-row latency over ``calls`` rows, and one full-batch pass."""
+    forest.predict_proba(X[:1])
+    single = float("inf")
+    for call in range(calls):
+        row = X[call % len(X):call % len(X) + 1]
+        started = time.perf_counter()
+        forest.predict_proba(row)
+        single = min(single, time.perf_counter() - started)
+    started = time.perf_counter()
+    forest.predict_proba(X)
+    return single * 1000, (time.perf_counter() - started) * 1000
+
+
+def tradeoff(full, compressed, X, y):
+    """Size, latency and accuracy of both forests on ``(X, y)``, side by side."""
+    report = {}
+    for name, forest in (("full", full), ("compressed", compressed)):
+        proba = forest.predict_proba(X)[:, list(forest.classes_).index(POSITIVE_CLASS)]
+        single_ms, batch_ms = _latency_ms(forest, X)
+        report[name] = {
+            "n_trees": forest.n_trees,
+            "n_nodes": forest.n_nodes,
+            "max_depth": forest.max_depth,
+            "size_bytes": _size_bytes(forest),
+            "latency_single_ms": single_ms,
+            "latency_batch_ms": batch_ms,
+            "accuracy": float((forest.predict(X) == np.asarray(y)).mean()),
+            "auc": float(roc_auc(y, proba)[0]),
+        }
+    return report
+
+
+def selection_split(X, y, size=0.5):
+    """Stratified ``(X_rest, X_val, y_rest, y_val)`` with ``size`` of the rows for selection."""
+    from sklearn.model_selection import train_test_split
+
+    from cardioscan.evaluation import SPLIT_SEED
+
+    return train_test_split(X, y, test_size=size, stratify=y, random_state=SPLIT_SEED)
+
+
+def compress_for_serving(model, X_val, y_val, X_report, y_report,
+                         max_auc_drop=DEFAULT_MAX_AUC_DROP, merge_tolerance=DEFAULT_MERGE_TOLERANCE):
+    """Compress a fitted forest (sklearn or binned), selecting on ``X_val``.
+
+    Neither split may have trained ``model``; the trade-off table is
+    measured on ``X_report``. Returns ``(forest, report)``; ``report`` holds
+    the selection summary and the trade-off table, ready to go into the
+    version manifest.
+    """
+    full = flatten(model)
+    compressed, summary = compress(full, np.asarray(X_val, dtype=np.float64), y_val,
+                                   max_auc_drop, merge_tolerance)
+    summary["validation_rows"] = int(len(y_val))
+    summary["tradeoff"] = tradeoff(full, compressed, np.asarray(X_report, dtype=np.float64),
+                                   y_report)
+    return compressed, summary
+
+
+def format_report(summary):
+    lines = [f"{'':<20}{'full':>14}{'compressed':>14}"]
+    full, small = summary["tradeoff"]["full"], summary["tradeoff"]["compressed"]
+    for key, fmt in (("n_trees", "{:,}"), ("n_nodes", "{:,}"), ("max_depth", "{}"),
+                     ("size_bytes", "{:,}"), ("latency_single_ms", "{:.3f}"),
+                     ("latency_batch_ms", "{:.3f}"), ("accuracy", "{:.4f}"), ("auc", "{:.4f}")):
+        lines.append(f"{key:<20}{fmt.format(full[key]):>14}{fmt.format(small[key]):>14}")
+    lines.append(f"validation AUC {summary['validation_auc']:.4f} "
+                 f"(full {summary['reference_auc']:.4f}, allowed drop {summary['max_auc_drop']}), "
+                 f"depth cap {summary['max_depth']}, {len(summary['trees'])} trees")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from cardioscan.cohort import build_cohort
+    from cardioscan.dataset import load_dataset
+    from cardioscan.drift import build_reference
+    from cardioscan.evaluation import classification_metrics, split_frames, split_of
+    from cardioscan.model_store import DATA_PATH, ModelStore
+
+    parser = argparse.ArgumentParser(description="Compress the served forest of a model version.")
+    parser.add_argument("--version", help="Version to compress (default: the active one)")
+    parser.add_argument("--max-auc-drop", type=float, default=DEFAULT_MAX_AUC_DROP,
+                        help="Largest allowed loss of validation AUC (default: %(default)s)")
+    parser.add_argument("--merge-tolerance", type=float, default=DEFAULT_MERGE_TOLERANCE,
+                        help="Merge sibling leaves whose probabilities differ by at most this")
+    parser.add_argument("--data", default=str(DATA_PATH))
+    parser.add_argument("--dry-run", action="store_true", help="Report only; publish nothing")
+    parser.add_argument("--activate", action="store_true",
+                        help="Serve the compressed version right away")
+    args = parser.parse_args(argv)
+
+    store = ModelStore()
+    version = args.version or store.current_version()
+    manifest = store.manifest(version)
+    model = store.load_estimator(version)
+    pipeline = store.load(version).pipeline
+    data = load_dataset(args.data)
+    # The source version's own hold-out rows (binned and incremental versions hash patientid)
+    split = split_of(manifest)
+    _, X_test, _, y_test = split_frames(data, pipeline, split)
+
+    # The version trained on everything else, so both halves come from its held-out rows
+    X_report, X_val, y_report, y_val = selection_split(X_test, y_test)
+    forest, summary = compress_for_serving(model, X_val, y_val, X_report, y_report,
+                                           args.max_auc_drop, args.merge_tolerance)
+    print(format_report(summary))
+    if args.dry_run:
+        return
+    scores = classification_metrics(y_report, forest.predict(X_report.to_numpy(dtype=np.float64)))
+    extra = {key: manifest[key] for key in ("data_rows", "search", "source") if key in manifest}
+    extra.update({"split": split, "compression": {**summary, "source_version": version}})
+    published = store.publish(model, manifest["training_data_sha256"], scores, extra=extra,
+                              activate=args.activate, pipeline=pipeline, forest=forest,
+                              cohort=build_cohort(forest, pipeline, data, split),
+                              drift=build_reference(forest, pipeline, data, split))
+    print(f"Published {published}: {forest.n_trees} trees / {forest.n_nodes:,} nodes "
+          f"(held-out accuracy {scores['accuracy']:.3f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Typed, memory-mapped columnar cache of the dataset CSV.
+
+The first load of a CSV parses it in chunks into compact per-column arrays
+(int8/int16/float32 instead of int64/float64) stored under
+``.cache/dataset/<sha256 of the file>/``. Later loads map those arrays
+read-only, so they are near-instant and share pages between processes::
+
+    from cardioscan.dataset import load_dataset
+    data = load_dataset()          # pandas DataFrame with the compact dtypes
+
+A changed file has a different content hash and therefore a fresh cache.
+The hash itself is remembered per (path, size, mtime), so an unchanged file
+is not re-read just to be hashed.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cardioscan.hashing import file_sha256
+from cardioscan.inference import ROOT_DIR
+
+DATA_PATH = ROOT_DIR / "Cardiovascular_Disease_Dataset.csv"
+CACHE_DIR = ROOT_DIR / ".cache" / "dataset"
+CACHE_FORMAT_VERSION = 1
+CHUNK_ROWS = 250_000
+META_FILE = "meta.json"
+HASH_INDEX_FILE = "hashes.json"
+
+# Storage dtype per known column; values outside a dtype's range are rejected
+SCHEMA = {
+    "patientid": "int64",
+    "age": "int8",
+    "gender": "int8",
+    "chestpain": "int8",
+    "restingBP": "int16",
+    "serumcholestrol": "int16",
+    "fastingbloodsugar": "int8",
+    "restingrelectro": "int8",
+    "maxheartrate": "int16",
+    "exerciseangia": "int8",
+    "oldpeak": "float32",
+    "slope": "int8",
+    "noofmajorvessels": "int8",
+    "target": "int8",
+}
+
+
+def storage_dtype(name, series):
+    """Compact dtype a column is stored as (``SCHEMA`` or a narrowed fallback)."""
+    if name in SCHEMA:
+        return np.dtype(SCHEMA[name])
+    # Unknown extra columns keep their kind but never widen past 32 bits of float
+    return np.dtype("float32") if series.dtype.kind == "f" else series.dtype
+
+
+def to_storage(name, series, dtype):
+    """Column values cast to ``dtype``; raises ``ValueError`` if they do not fit."""
+    values = series.to_numpy()
+    if dtype.kind in "iu":
+        if series.isna().any():
+            raise ValueError(f"column {name!r} has missing values but is stored as {dtype}")
+        if values.dtype.kind == "f" and np.any(values != np.trunc(values)):
+            raise ValueError(f"column {name!r} has fractional values but is stored as {dtype}")
+        info = np.iinfo(dtype)
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            raise ValueError(f"column {name!r} has values outside the {dtype} range")
+    return values.astype(dtype, copy=False)
+
+
+def dataset_sha256(path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Content hash of ``path``, memoized by (path, size, mtime_ns)."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+    index_path = Path(cache_dir) / HASH_INDEX_FILE
+    try:
+        index = json.loads(index_path.read_text())
+    except (FileNotFoundError, ValueError):
+        index = {}
+    if key not in index:
+        index = {k: v for k, v in index.items() if not k.startswith(f"{path}|")}
+        index[key] = file_sha256(path)
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = index_path.with_name(f".{HASH_INDEX_FILE}.{os.getpid()}")
+        tmp.write_text(json.dumps(index, indent=2))
+        os.replace(tmp, index_path)
+    return index[key]
+
+
+def build_cache(path, directory, chunk_rows=CHUNK_ROWS):
+    """Parse ``path`` in chunks into raw per-column files under ``directory``."""
+    directory = Path(directory)
+    staging = directory.with_name(f".{directory.name}.{os.getpid()}")
+    staging.mkdir(parents=True, exist_ok=True)
+    dtypes = None
+    handles = {}
+    rows = 0
+    try:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            if dtypes is None:
+                dtypes = {name: storage_dtype(name, chunk[name]) for name in chunk.columns}
+                handles = {name: open(staging / f"{name}.bin", "wb") for name in dtypes}
+            for name, dtype in dtypes.items():
+                handles[name].write(to_storage(name, chunk[name], dtype).tobytes())
+            rows += len(chunk)
+    finally:
+        for handle in handles.values():
+            handle.close()
+    meta = {
+        "format_version": CACHE_FORMAT_VERSION,
+        "source": str(path),
+        "rows": rows,
+        "columns": {name: dtype.str for name, dtype in (dtypes or {}).items()},
+    }
+    (staging / META_FILE).write_text(json.dumps(meta, indent=2))
+    try:
+        os.rename(staging, directory)
+    except OSError:
+        # Another process finished the same cache first; theirs is identical
+        for item in staging.iterdir():
+            item.unlink()
+        staging.rmdir()
+    return directory
+
+
+def load_dataset(path=DATA_PATH, cache_dir=CACHE_DIR, mmap=True):
+    """Return the dataset as a DataFrame of compact, memory-mapped columns."""
+    directory = Path(cache_dir) / dataset_sha256(path, cache_dir)
+    meta_path = directory / META_FILE
+    if not meta_path.exists():
+        build_cache(path, directory)
+    meta = json.loads(meta_path.read_text())
+    if meta.get("format_version") != CACHE_FORMAT_VERSION:
+        raise ValueError(f"unsupported dataset cache format in {directory}")
+    rows = meta["rows"]
+    columns = {}
+    for name, dtype in meta["columns"].items():
+        file = directory / f"{name}.bin"
+        if mmap and rows:
+            columns[name] = np.memmap(file, dtype=dtype, mode="r", shape=(rows,)).view(np.ndarray)
+        else:
+            columns[name] = np.fromfile(file, dtype=dtype, count=rows)
+    return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,368 @@
+"""Streaming drift monitor: do served patients still look like the training data?
+
+Every scoring path (the app, the HTTP service, batch scoring) folds what it
+scores into a ``DriftSketch``: one fixed-bin histogram per model feature plus
+one for the predicted risk. The bins are those of the version's reference
+sketch, built from the training data when the version is published, so a
+sketch is a few hundred counts however many patients it has seen, and two
+sketches of the same version merge by adding counts::
+
+    reference = DriftSketch.fit(pipeline.columns, X, risk)     # training time
+    live = reference.empty().update(X_served, risk_served)
+    live.merge(sketch_from_another_process)
+    live.compare(reference)   # {"age": {"rows": 812, "psi": 0.02, "ks": 0.04, ...}, ...}
+
+Continuous features get equal-mass quantile bins; features with at most
+``bins`` distinct values (the categorical codes, slope, vessels) get one bin
+per value. PSI is computed over those bins with empty ones floored at
+``PSI_EPSILON``; KS is the largest gap between the two binned CDFs, i.e. the
+sample KS statistic evaluated at the bin edges.
+
+Each process keeps one ``DriftMonitor`` per version and source, and writes
+its sketch for the current UTC hour to
+``$CARDIOSCAN_DRIFT_DIR/<version>/<hour>-<source>-<pid>-<token>.json``
+(default ``models/drift/``) every ``FLUSH_SECONDS`` and at exit. Readers
+merge whichever hours and sources they want (``load_live``); the Drift
+Monitor page and the CLI do exactly that::
+
+    python -m cardioscan.drift report --hours 24
+    python -m cardioscan.drift prune --days 30
+"""
+
+import argparse
+import atexit
+import json
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+RISK = "risk"
+DEFAULT_BINS = 10
+PSI_EPSILON = 1e-4
+# Conventional PSI reading: below 0.1 stable, up to 0.25 moderate, above that a real shift
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+# With fewer live rows than this, scores are mostly sampling noise
+MIN_ROWS = 100
+FLUSH_SECONDS = 30.0
+DRIFT_DIR_ENV = "CARDIOSCAN_DRIFT_DIR"
+SOURCES = ("app", "serve", "batch")
+HOUR_FORMAT = "%Y%m%d%H"
+
+
+def _bins(values, bins, discrete=True):
+    """``(edges, values)`` of one column: per-value bins when few distinct values, else quantiles."""
+    values = np.asarray(values, dtype=np.float64)
+    distinct = np.unique(values[~np.isnan(values)])
+    if discrete and len(distinct) <= bins:
+        return (distinct[:-1] + distinct[1:]) / 2, distinct
+    return np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])), None
+
+
+def psi(expected, actual, epsilon=PSI_EPSILON):
+    """Population stability index of ``actual`` bin counts against ``expected``."""
+    p = np.maximum(np.asarray(expected, dtype=np.float64) / max(np.sum(expected), 1), epsilon)
+    q = np.maximum(np.asarray(actual, dtype=np.float64) / max(np.sum(actual), 1), epsilon)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks(expected, actual):
+    """Largest gap between the binned CDFs of ``expected`` and ``actual`` counts."""
+    p = np.cumsum(expected) / max(np.sum(expected), 1)
+    q = np.cumsum(actual) / max(np.sum(actual), 1)
+    return float(np.max(np.abs(q - p))) if len(p) else 0.0
+
+
+def status(score, rows):
+    """``"stable"``, ``"moderate"`` or ``"shifted"`` by PSI; ``"too few rows"`` below ``MIN_ROWS``."""
+    if rows < MIN_ROWS:
+        return "too few rows"
+    if score > PSI_ALERT:
+        return "shifted"
+    return "moderate" if score > PSI_WARN else "stable"
+
+
+class DriftSketch:
+    """Per-column bin counts over fixed edges; the model columns, then ``"risk"``.
+
+    ``edges[name]`` are the inner bin edges (bin ``i`` holds values in
+    ``[edges[i - 1], edges[i])``, the outer bins are open-ended);
+    ``values[name]`` is the value of each bin for per-value columns.
+    """
+
+    def __init__(self, columns, edges, counts=None, values=None):
+        self.columns = list(columns)
+        self.edges = {name: np.asarray(edges[name], dtype=np.float64) for name in self.columns}
+        self.counts = {name: np.zeros(len(self.edges[name]) + 1, dtype=np.int64)
+                       for name in self.columns}
+        for name, column in (counts or {}).items():
+            self.counts[name][:] = column
+        self.values = {name: np.asarray(column, dtype=np.float64)
+                       for name, column in (values or {}).items() if column is not None}
+
+    @property
+    def features(self):
+        return [name for name in self.columns if name != RISK]
+
+    def rows(self, name=RISK):
+        return int(self.counts[name].sum())
+
+    @classmethod
+    def fit(cls, columns, X, risk, bins=DEFAULT_BINS):
+        """Reference sketch binned and counted on the encoded rows ``X`` and ``risk``.
+
+        ``risk`` need not come from the rows of ``X``: a forest is overfit to
+        its own training rows, so callers pass the held-out rows' risk.
+        """
+        X = np.atleast_2d(X)
+        edges, values = {}, {}
+        for i, name in enumerate(columns):
+            edges[name], values[name] = _bins(X[:, i], bins)
+        # Risk is continuous even when a small forest only emits a few distinct values
+        edges[RISK], values[RISK] = _bins(risk, bins, discrete=False)
+        return cls(list(columns) + [RISK], edges, values=values).update(X, risk)
+
+    def empty(self):
+        """A sketch with the same bins and no counts."""
+        return DriftSketch(self.columns, self.edges, values=self.values)
+
+    def update(self, X=None, risk=None):
+        """Count the encoded rows ``X`` and/or their ``risk``; returns ``self``."""
+        if X is not None:
+            X = np.atleast_2d(X)
+            if X.shape[1] != len(self.features):
+                raise ValueError(f"expected {len(self.features)} feature columns, got {X.shape[1]}")
+            for i, name in enumerate(self.features):
+                self._count(name, X[:, i])
+        if risk is not None:
+            self._count(RISK, np.atleast_1d(risk))
+        return self
+
+    def _count(self, name, values):
+        bins = np.searchsorted(self.edges[name], values, side="right")
+        self.counts[name] += np.bincount(bins, minlength=len(self.counts[name]))
+
+    def _check(self, other):
+        if other.columns != self.columns or any(
+                not np.array_equal(other.edges[name], self.edges[name]) for name in self.columns):
+            raise ValueError("drift sketches were binned differently (different model versions?)")
+
+    def merge(self, other):
+        """Add ``other``'s counts (same bins) into this sketch; returns ``self``."""
+        self._check(other)
+        for name in self.columns:
+            self.counts[name] += other.counts[name]
+        return self
+
+    def compare(self, reference):
+        """Per column: live ``rows``, ``psi``, ``ks`` and ``status`` against ``reference``."""
+        self._check(reference)
+        report = {}
+        for name in self.columns:
+            rows = self.rows(name)
+            score = psi(reference.counts[name], self.counts[name]) if rows else None
+            report[name] = {
+                "rows": rows,
+                "psi": score,
+                "ks": ks(reference.counts[name], self.counts[name]) if rows else None,
+                "status": status(score, rows) if rows else "no data",
+            }
+        return report
+
+    def to_dict(self):
+        return {"format_version": FORMAT_VERSION, "columns": self.columns,
+                "edges": {name: edges.tolist() for name, edges in self.edges.items()},
+                "values": {name: values.tolist() for name, values in self.values.items()},
+                "counts": {name: counts.tolist() for name, counts in self.counts.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported drift sketch format: {data.get('format_version')}")
+        return cls(data["columns"], data["edges"], data["counts"], data.get("values"))
+
+    def save(self, path):
+        """Write as JSON, atomically (readers of ``path`` never see a partial file)."""
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(self.to_dict()))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_dict(json.loads(Path(path).read_text()))
+
+
+def build_reference(model, pipeline, data, split=None):
+    """Reference sketch of the dataset frame ``data``: all rows, held-out risk.
+
+    ``split`` is the version's hold-out split (see ``cardioscan.evaluation``,
+    default ``holdout_split``'s).
+    """
+    from cardioscan.evaluation import HOLDOUT, split_frames
+    from cardioscan.inference import predict_risk
+
+    _, X_test, _, _ = split_frames(data, pipeline, split or HOLDOUT)
+    # A frame keeps the column names an sklearn estimator was fitted with
+    risk = predict_risk(model, X_test)
+    return DriftSketch.fit(pipeline.columns, pipeline.transform(data), risk)
+
+
+def drift_dir(store):
+    """Root of the live sketches of ``store``'s versions."""
+    return Path(os.environ.get(DRIFT_DIR_ENV) or Path(store.root) / "drift")
+
+
+def _hour(timestamp=None):
+    return time.strftime(HOUR_FORMAT, time.gmtime(timestamp))
+
+
+class DriftMonitor:
+    """This process's live sketch of one version and source, flushed to ``directory``.
+
+    ``observe`` and ``merge`` are thread-safe. Counts roll over to a new file
+    every UTC hour, so readers can pick a time window.
+    """
+
+    def __init__(self, reference, directory, source, flush_seconds=FLUSH_SECONDS):
+        if source not in SOURCES:
+            raise ValueError(f"unknown drift source {source!r} (expected one of {SOURCES})")
+        self.reference = reference
+        self.directory = Path(directory)
+        self.source = source
+        self.flush_seconds = flush_seconds
+        self._token = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._hour = None
+        self._sketch = None
+        self._dirty = False
+        self._flushed = time.monotonic()
+        atexit.register(self.flush)
+
+    def observe(self, X, risk):
+        """Count served rows ``X`` (encoded) and their predicted ``risk``."""
+        self.merge(self.reference.empty().update(X, risk))
+
+    def merge(self, sketch):
+        """Fold in a sketch counted elsewhere (e.g. by a batch worker process)."""
+        hour = _hour()
+        with self._lock:
+            if hour != self._hour:
+                self._write()
+                self._hour, self._sketch = hour, self.reference.empty()
+            self._sketch.merge(sketch)
+            self._dirty = True
+            if time.monotonic() - self._flushed >= self.flush_seconds:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        if not self._dirty:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{self._hour}-{self.source}-{os.getpid()}-{self._token}.json"
+        self._sketch.save(self.directory / name)
+        self._dirty = False
+        self._flushed = time.monotonic()
+
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+def get_monitor(store, version, source):
+    """The process-wide ``DriftMonitor`` of a local model version and source."""
+    key = (str(store.root), version, source)
+    with _monitors_lock:
+        monitor = _monitors.get(key)
+        if monitor is None:
+            monitor = _monitors[key] = DriftMonitor(store.drift_reference(version),
+                                                    drift_dir(store) / version, source)
+        return monitor
+
+
+def _live_files(directory, since=None, sources=None):
+    for path in sorted(Path(directory).glob("*.json")):
+        hour, source = path.stem.split("-")[:2]
+        if (since is None or hour >= _hour(since)) and (sources is None or source in sources):
+            yield path
+
+
+def load_live(directory, reference, since=None, sources=None):
+    """Merge the live sketches in ``directory`` for hours from ``since`` (a timestamp) on.
+
+    Returns ``(sketch, files)``; ``sources`` limits it to some of ``SOURCES``.
+    """
+    merged = reference.empty()
+    files = 0
+    for path in _live_files(directory, since, sources):
+        merged.merge(DriftSketch.load(path))
+        files += 1
+    return merged, files
+
+
+def prune(directory, before):
+    """Delete the live sketches of every version for hours before the timestamp ``before``."""
+    removed = 0
+    for path in Path(directory).glob("*/*.json"):
+        if path.stem.split("-")[0] < _hour(before):
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def format_report(report):
+    lines = [f"{'column':<20}{'rows':>10}{'psi':>9}{'ks':>8}  status"]
+    for name, entry in report.items():
+        if entry["rows"]:
+            lines.append(f"{name:<20}{entry['rows']:>10,}{entry['psi']:>9.3f}"
+                         f"{entry['ks']:>8.3f}  {entry['status']}")
+        else:
+            lines.append(f"{name:<20}{0:>10}{'-':>9}{'-':>8}  {entry['status']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from cardioscan.model_store import MODELS_DIR, ModelStore
+
+    parser = argparse.ArgumentParser(description="Compare served traffic with the training data.")
+    parser.add_argument("--models-dir", default=str(MODELS_DIR))
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_cmd = commands.add_parser("report", help="Print drift scores of a version")
+    report_cmd.add_argument("--version", help="Model version (default: the active one)")
+    report_cmd.add_argument("--hours", type=float, help="Only the last N hours (default: all)")
+    report_cmd.add_argument("--source", choices=SOURCES, action="append",
+                            help="Only this source (repeatable; default: all)")
+    report_cmd.add_argument("--json", action="store_true", help="Print the report as JSON")
+    prune_cmd = commands.add_parser("prune", help="Delete live sketches older than N days")
+    prune_cmd.add_argument("--days", type=float, default=30)
+    args = parser.parse_args(argv)
+
+    store = ModelStore(args.models_dir)
+    if args.command == "prune":
+        removed = prune(drift_dir(store), time.time() - args.days * 86400)
+        print(f"Removed {removed} sketch file(s)")
+        return
+    version = args.version or store.current_version()
+    reference = store.drift_reference(version)
+    since = time.time() - args.hours * 3600 if args.hours else None
+    live, files = load_live(drift_dir(store) / version, reference, since, args.source)
+    report = live.compare(reference)
+    if args.json:
+        print(json.dumps({"version": version, "files": files, "columns": report}, indent=2))
+    else:
+        print(f"{version}: {files} sketch file(s), {live.rows():,} scored rows")
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Hold-out split and classification metrics shared by training and the model store."""
+
+import numpy as np
+from sklearn.metrics import accuracy_score, confusion_matrix, f1_score, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+
+from cardioscan.features import FeaturePipeline
+
+TARGET = "target"
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
+# How a version's held-out rows were chosen (its manifest's "split")
+HOLDOUT = "holdout"  # holdout_split: a seeded shuffle of the row positions
+PATIENT_HASH = "patientid_hash"  # is_test_row: stable as rows are appended (binned, incremental)
+
+
+def holdout_split(data, pipeline=None):
+    """Split the dataset exactly like ``train_model.py`` always has.
+
+    ``X`` holds the columns of ``pipeline`` (the default clinical features);
+    the row split does not depend on which columns are used.
+    """
+    X = (pipeline or FeaturePipeline()).frame(data)
+    y = data[TARGET]
+    return train_test_split(X, y, test_size=TEST_SIZE, random_state=SPLIT_SEED)
+
+
+def is_test_row(patientid):
+    """Deterministic ~20% hold-out by multiplicative hash of ``patientid``."""
+    mixed = (np.asarray(patientid, dtype=np.uint64) * np.uint64(2654435761)) % np.uint64(2 ** 32)
+    return (mixed % np.uint64(5)) == 0
+
+
+def split_of(manifest):
+    """The hold-out split of a version; older manifests go by their training mode."""
+    if "split" in manifest:
+        return manifest["split"]
+    return PATIENT_HASH if manifest.get("training_mode") in ("binned", "full", "warm_start") else HOLDOUT
+
+
+def test_mask(data, split=HOLDOUT):
+    """Boolean mask of the rows of the dataset frame ``data`` that ``split`` holds out."""
+    if split == PATIENT_HASH:
+        return np.asarray(is_test_row(data["patientid"].to_numpy()))
+    if split != HOLDOUT:
+        raise ValueError(f"unknown hold-out split {split!r}")
+    # holdout_split's shuffle only depends on the row count
+    _, test = train_test_split(np.arange(len(data)), test_size=TEST_SIZE, random_state=SPLIT_SEED)
+    mask = np.zeros(len(data), dtype=bool)
+    mask[test] = True
+    return mask
+
+
+def split_frames(data, pipeline=None, split=HOLDOUT):
+    """``(X_train, X_test, y_train, y_test)`` of ``split``, shaped like ``holdout_split``'s."""
+    if split == HOLDOUT:
+        return holdout_split(data, pipeline)
+    test = test_mask(data, split)
+    X = (pipeline or FeaturePipeline()).frame(data)
+    y = data[TARGET]
+    return X[~test], X[test], y[~test], y[test]
+
+
+def classification_metrics(y_true, y_pred):
+    """Held-out metrics in the JSON-friendly shape stored in model manifests."""
+    return {
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "precision": float(precision_score(y_true, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_true, y_pred, zero_division=0)),
+        "f1": float(f1_score(y_true, y_pred, zero_division=0)),
+        "confusion_matrix": confusion_matrix(y_true, y_pred, labels=[0, 1]).tolist(),
+        "n_test": int(len(y_true)),
+    }
+
+
+def confusion_metrics(matrix):
+    """``classification_metrics`` of a running ``[[tn, fp], [fn, tp]]`` confusion matrix."""
+    (tn, fp), (fn, tp) = matrix
+    n_test = tn + fp + fn + tp
+    return {
+        "accuracy": (tn + tp) / n_test if n_test else 0.0,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "f1": 2 * tp / (2 * tp + fp + fn) if tp else 0.0,
+        "confusion_matrix": [[int(tn), int(fp)], [int(fn), int(tp)]],
+        "n_test": int(n_test),
+    }
@@ -0,0 +1,198 @@
+"""The one mapping from raw patient fields to the model's feature matrix.
+
+Training, the Streamlit form, batch scoring and the HTTP service all go
+through ``FeaturePipeline``: it owns the column order, the storage dtype of
+every column, the label encodings of categorical fields and their valid
+ranges. It works column-wise on arrays, so one form submission and a
+million-row chunk take the same code path::
+
+    from cardioscan.features import FeaturePipeline
+    pipeline = FeaturePipeline()
+    X = pipeline.transform({"age": 52, "gender": "Male", ...})   # (1, 12) float32
+    X = pipeline.transform(chunk)                                # DataFrame in, same out
+
+The pipeline is serialized into every model manifest (``to_dict``), and the
+store hands it back with the model, so a version is always scored with the
+exact columns it was trained on.
+"""
+
+import numpy as np
+
+PIPELINE_FORMAT_VERSION = 1
+
+
+class Feature:
+    """One model input column: dtype, valid range and optional label encoding.
+
+    ``categories`` maps display labels to codes; inputs may use either.
+    """
+
+    def __init__(self, name, dtype, low=None, high=None, categories=None):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.categories = dict(categories) if categories else None
+        if self.categories:
+            codes = self.categories.values()
+            low, high = min(codes), max(codes)
+        self.low = low
+        self.high = high
+
+    def to_dict(self):
+        return {"name": self.name, "dtype": self.dtype.str, "low": self.low, "high": self.high,
+                "categories": self.categories}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["dtype"], data.get("low"), data.get("high"),
+                   data.get("categories"))
+
+    def __repr__(self):
+        return f"Feature({self.name!r}, {self.dtype})"
+
+
+# Clinical columns of Cardiovascular_Disease_Dataset.csv, in training order.
+# Ranges are physiological bounds, a little wider than anything in the data;
+# serum cholesterol is 0 where the source did not record it.
+CLINICAL_FEATURES = (
+    Feature("age", "int8", 1, 120),
+    Feature("gender", "int8", categories={"Female": 0, "Male": 1}),
+    Feature("chestpain", "int8", categories={
+        "Typical angina": 0, "Atypical angina": 1, "Non-anginal pain": 2, "Asymptomatic": 3}),
+    Feature("restingBP", "int16", 50, 250),
+    Feature("serumcholestrol", "int16", 0, 1000),
+    Feature("fastingbloodsugar", "int8", categories={"<= 120 mg/dl": 0, "> 120 mg/dl": 1}),
+    Feature("restingrelectro", "int8", categories={
+        "Normal": 0, "ST-T wave abnormality": 1, "Left ventricular hypertrophy": 2}),
+    Feature("maxheartrate", "int16", 40, 250),
+    Feature("exerciseangia", "int8", categories={"No": 0, "Yes": 1}),
+    Feature("oldpeak", "float32", 0.0, 10.0),
+    Feature("slope", "int8", 0, 3),
+    Feature("noofmajorvessels", "int8", 0, 3),
+)
+
+# Only models trained before the pipeline existed use it; it identifies a
+# patient and carries no clinical signal
+PATIENT_ID = Feature("patientid", "int64")
+
+# Display names for the UI (result card, About page)
+FEATURE_LABELS = {
+    "patientid": "Patient ID",
+    "age": "Age",
+    "gender": "Gender",
+    "chestpain": "Chest Pain Type",
+    "restingBP": "Resting BP",
+    "serumcholestrol": "Serum Cholesterol",
+    "fastingbloodsugar": "Fasting Blood Sugar",
+    "restingrelectro": "Resting ECG",
+    "maxheartrate": "Max Heart Rate",
+    "exerciseangia": "Exercise Angina",
+    "oldpeak": "ST Depression",
+    "slope": "ST Slope",
+    "noofmajorvessels": "Major Vessels",
+}
+
+_KNOWN = {feature.name: feature for feature in CLINICAL_FEATURES + (PATIENT_ID,)}
+
+
+class FeaturePipeline:
+    def __init__(self, features=CLINICAL_FEATURES):
+        self.features = tuple(features)
+        self.columns = [feature.name for feature in self.features]
+
+    @classmethod
+    def for_columns(cls, names):
+        """Pipeline for an existing column list (models that predate manifests with one)."""
+        return cls(_KNOWN.get(name) or Feature(name, "float32") for name in names)
+
+    @classmethod
+    def from_manifest(cls, manifest):
+        if "feature_pipeline" in manifest:
+            return cls.from_dict(manifest["feature_pipeline"])
+        return cls.for_columns(manifest["feature_names"])
+
+    def to_dict(self):
+        return {"format_version": PIPELINE_FORMAT_VERSION,
+                "features": [feature.to_dict() for feature in self.features]}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("format_version") != PIPELINE_FORMAT_VERSION:
+            raise ValueError(f"unsupported feature pipeline format {data.get('format_version')}")
+        return cls(Feature.from_dict(item) for item in data["features"])
+
+    def _column(self, data, name):
+        try:
+            values = data[name]
+        except KeyError:
+            raise ValueError(f"missing feature: {name}") from None
+        if hasattr(values, "to_numpy"):
+            values = values.to_numpy()
+        return np.atleast_1d(np.asarray(values))
+
+    @staticmethod
+    def _parse(feature, text):
+        if feature.categories and text in feature.categories:
+            return feature.categories[text]
+        try:
+            return float(text)
+        except ValueError:
+            return np.nan
+
+    def _encode(self, feature, values):
+        """Numeric float64 codes of one column; ``ValueError`` on bad input."""
+        if values.dtype.kind in "biuf":
+            numeric = values.astype(np.float64)
+        else:
+            # Labels or numbers as text: resolve each distinct value once, then scatter
+            distinct, inverse = np.unique(values.astype(str), return_inverse=True)
+            numeric = np.array([self._parse(feature, text) for text in distinct],
+                               dtype=np.float64)[inverse.reshape(-1)]
+
+        bad = np.isnan(numeric)
+        if feature.categories:
+            bad |= ~np.isin(numeric, list(feature.categories.values()))
+        else:
+            if feature.low is not None:
+                bad |= numeric < feature.low
+            if feature.high is not None:
+                bad |= numeric > feature.high
+            if feature.dtype.kind in "iu":
+                bad |= numeric != np.round(numeric)
+        if bad.any():
+            rows = np.flatnonzero(bad)
+            first = values[rows[0]]
+            first = first.item() if isinstance(first, np.generic) else first
+            if feature.categories:
+                allowed = ", ".join(f"{label!r}={code}" for label, code in feature.categories.items())
+            else:
+                allowed = f"{feature.dtype} in [{feature.low}, {feature.high}]"
+            raise ValueError(f"{feature.name}: {len(rows)} invalid value(s), first "
+                             f"{first!r} at row {rows[0]} (expected {allowed})")
+        return numeric
+
+    def frame(self, data):
+        """Validated DataFrame of the model columns in their storage dtypes.
+
+        ``data`` is a DataFrame or a mapping of column name to a scalar or
+        array; extra columns are ignored.
+        """
+        import pandas as pd  # training-side only; keeps pandas off the app's import path
+
+        return pd.DataFrame({
+            feature.name: self._encode(feature, self._column(data, feature.name)).astype(feature.dtype)
+            for feature in self.features
+        }, copy=False)
+
+    def transform(self, data):
+        """Validated ``(rows, features)`` float32 matrix, the precision trees compare at."""
+        columns = [self._encode(feature, self._column(data, feature.name)) for feature in self.features]
+        lengths = {len(column) for column in columns}
+        if len(lengths) > 1:
+            raise ValueError(f"feature columns have different lengths: {sorted(lengths)}")
+        return np.column_stack(columns).astype(np.float32) if columns else np.empty((0, 0), np.float32)
+
+    def __eq__(self, other):
+        return isinstance(other, FeaturePipeline) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"FeaturePipeline({', '.join(self.columns)})"
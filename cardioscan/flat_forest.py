@@ -0,0 +1,266 @@
+"""Flat, array-based form of the trained RandomForest.
+
+Every tree of the forest is concatenated into one set of contiguous node
+arrays (``feature``, ``threshold``, ``left``, ``right``, ``value``) which are
+saved as ``.npy`` files and memory-mapped on load. Prediction walks all trees
+for all rows at once with plain NumPy, so inference workers need neither
+scikit-learn nor an unpickling step::
+
+    python -m cardioscan.flat_forest export heart_model.pkl heart_model_flat/
+    python -m cardioscan.flat_forest check heart_model.pkl heart_model_flat/
+
+``predict_proba`` reproduces ``RandomForestClassifier.predict_proba`` bit for
+bit: inputs are cast to float32 and compared with ``<=`` against the float64
+thresholds, and per-tree leaf values are summed in estimator order before
+dividing by the number of trees, exactly as scikit-learn does.
+
+``explain`` splits each prediction into per-feature contributions by
+following the decision paths (Saabas attribution): every split credits the
+change in class probability from parent to child to the split's feature, so
+``bias + contributions.sum(axis=1)`` equals the predicted probability.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+META_FILE = "forest.json"
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+APPLY_BLOCK_ROWS = 512
+
+
+class FlatForest:
+    """Vectorized predictor over concatenated tree node arrays.
+
+    Leaves point to themselves (``left[i] == right[i] == i``), so a fixed
+    ``max_depth`` number of steps lands every row on its leaf without
+    per-row branching. Node indices are global across the whole forest and
+    ``roots[t]`` is the root of tree ``t``.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots,
+                 max_depth, classes, feature_names):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        # Estimator-style attributes so cardioscan.inference.predict_risk works unchanged
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(feature_names)
+        # Interleaved (left, right) pairs: one gather per step instead of two plus a select
+        self._children = np.stack([left, right], axis=1).ravel()
+        self._class_values = {}
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model, feature_names=None):
+        """Flatten a fitted ``RandomForestClassifier`` (single output).
+
+        ``feature_names`` is only needed for estimators fitted on a bare array.
+        """
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("only single-output forests can be flattened")
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            ids = np.arange(n, dtype=np.int32) + offset
+            leaf = tree.children_left == -1
+            features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold).astype(np.float64))
+            lefts.append(np.where(leaf, ids, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(leaf, ids, tree.children_right + offset).astype(np.int32))
+            # tree_.value is (nodes, outputs, classes); DecisionTreeClassifier.predict_proba
+            # returns value[leaf, 0, :n_classes] as-is
+            values.append(np.asarray(tree.value[:, 0, :model.n_classes_], dtype=np.float64))
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            classes=model.classes_,
+            feature_names=[str(name) for name in (
+                model.feature_names_in_ if feature_names is None else feature_names)],
+        )
+
+    def save(self, directory):
+        """Write one ``.npy`` per node array plus ``forest.json`` metadata."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "n_trees": self.n_trees,
+            "n_nodes": self.n_nodes,
+            "max_depth": self.max_depth,
+            "classes": self.classes_.tolist(),
+            "feature_names": self.feature_names_in_.tolist(),
+        }
+        (directory / META_FILE).write_text(json.dumps(meta, indent=2))
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved forest; arrays are read-only memory maps by default."""
+        directory = Path(directory)
+        meta = json.loads((directory / META_FILE).read_text())
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported flat forest format: {meta.get('format_version')}")
+        arrays = {}
+        for name in ARRAY_NAMES:
+            array = np.load(directory / f"{name}.npy", mmap_mode="r" if mmap else None)
+            # A plain ndarray view keeps the mapping but skips np.memmap's per-op overhead
+            arrays[name] = array.view(np.ndarray)
+        return cls(max_depth=meta["max_depth"], classes=meta["classes"],
+                   feature_names=meta["feature_names"], **arrays)
+
+    def _as_matrix(self, X):
+        if hasattr(X, "columns"):
+            X = X[list(self.feature_names_in_)].to_numpy()
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"expected {self.n_features_in_} features, got {X.shape[1]}")
+        if not np.isfinite(X).all():
+            raise ValueError("input contains NaN or infinity")
+        return X
+
+    def apply(self, X):
+        """Return the global leaf index reached in every tree, shape (trees, rows)."""
+        X = self._as_matrix(X)
+        n_rows, n_features = X.shape
+        leaves = np.empty((self.n_trees, n_rows), dtype=np.int32)
+        # Row blocks keep the (trees x rows) working set in cache
+        for start in range(0, n_rows, APPLY_BLOCK_ROWS):
+            block = np.ascontiguousarray(X[start:start + APPLY_BLOCK_ROWS])
+            flat = block.ravel()
+            offsets = (np.arange(len(block), dtype=np.int32) * n_features)[None, :]
+            node = np.repeat(self.roots[:, None], len(block), axis=1)
+            for _ in range(self.max_depth):
+                # float32 input vs float64 threshold, as in sklearn's `x <= threshold`
+                go_right = flat.take(offsets + self.feature.take(node)) > self.threshold.take(node)
+                node = self._children.take(2 * node + go_right)
+            leaves[:, start:start + len(block)] = node
+        return leaves
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.empty((leaves.shape[1], len(self.classes_)), dtype=np.float64)
+        for start in range(0, leaves.shape[1], APPLY_BLOCK_ROWS):
+            block = leaves[:, start:start + APPLY_BLOCK_ROWS]
+            # add.accumulate sums strictly in tree order (np.sum would use pairwise
+            # summation), which keeps the result identical to scikit-learn's
+            proba[start:start + block.shape[1]] = np.add.accumulate(self.value[block], axis=0)[-1]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def _values_of(self, class_index):
+        values = self._class_values.get(class_index)
+        if values is None:
+            values = self._class_values[class_index] = np.ascontiguousarray(self.value[:, class_index])
+        return values
+
+    def explain(self, X, class_index):
+        """Exact path attribution of ``predict_proba(X)[:, class_index]``.
+
+        Returns ``(bias, contributions)``: the forest's mean root probability
+        and a (rows, features) array such that ``bias + contributions.sum(1)``
+        is each row's probability (up to float rounding). All trees and rows
+        are walked together, one ``bincount`` per depth level.
+        """
+        X = self._as_matrix(X)
+        n_rows, n_features = X.shape
+        values = self._values_of(class_index)
+        contributions = np.zeros((n_rows, n_features), dtype=np.float64)
+        for start in range(0, n_rows, APPLY_BLOCK_ROWS):
+            block = np.ascontiguousarray(X[start:start + APPLY_BLOCK_ROWS])
+            flat = block.ravel()
+            offsets = (np.arange(len(block), dtype=np.int32) * n_features)[None, :]
+            node = np.repeat(self.roots[:, None], len(block), axis=1)
+            totals = np.zeros(flat.size, dtype=np.float64)
+            for _ in range(self.max_depth):
+                feature = self.feature.take(node)
+                go_right = flat.take(offsets + feature) > self.threshold.take(node)
+                child = self._children.take(2 * node + go_right)
+                # Leaves loop onto themselves, so finished paths add exactly zero
+                delta = values.take(child) - values.take(node)
+                totals += np.bincount((offsets + feature).ravel(), weights=delta.ravel(),
+                                      minlength=flat.size)
+                node = child
+            contributions[start:start + len(block)] = totals.reshape(len(block), n_features)
+        bias = float(values.take(self.roots).mean())
+        return bias, contributions / self.n_trees
+
+
+def flatten(model):
+    """The ``FlatForest`` of a fitted forest: sklearn's, or one that exports itself (``to_flat``)."""
+    if hasattr(model, "to_flat"):
+        return model.to_flat()
+    return FlatForest.from_sklearn(model)
+
+
+def check_against(model, forest, X):
+    """Return the number of rows whose probabilities differ from ``model``'s."""
+    expected = model.predict_proba(X)
+    actual = forest.predict_proba(X)
+    return int(np.any(expected != actual, axis=1).sum())
+
+
+def main(argv=None):
+    import joblib
+    import pandas as pd
+
+    from cardioscan.inference import MODEL_PATH, ROOT_DIR
+
+    parser = argparse.ArgumentParser(description="Export or verify a flat forest.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ("export", "check"):
+        sub = commands.add_parser(command)
+        sub.add_argument("model", nargs="?", default=str(MODEL_PATH))
+        sub.add_argument("output", nargs="?", default=str(ROOT_DIR / "heart_model_flat"))
+        sub.add_argument("--data", default=str(ROOT_DIR / "Cardiovascular_Disease_Dataset.csv"))
+    args = parser.parse_args(argv)
+
+    model = joblib.load(args.model)
+    if args.command == "export":
+        forest = FlatForest.from_sklearn(model)
+        forest.save(args.output)
+        print(f"Exported {forest.n_trees} trees / {forest.n_nodes} nodes to {args.output}")
+    else:
+        forest = FlatForest.load(args.output)
+    X = pd.read_csv(args.data)[list(forest.feature_names_in_)]
+    mismatches = check_against(model, forest, X)
+    print(f"Checked {len(X)} rows: {mismatches} probability mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
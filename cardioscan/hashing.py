@@ -0,0 +1,12 @@
+"""Content hashes of files, shared by the dataset cache and the model store."""
+
+import hashlib
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Content hash of a file, streamed so large datasets are not read into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
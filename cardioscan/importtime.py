@@ -0,0 +1,122 @@
+"""Import-time report and budget for the Streamlit entry points.
+
+Runs the module-level imports of a script in a fresh interpreter under
+``python -X importtime`` and summarizes where cold-start time goes::
+
+    python -m cardioscan.importtime                       # app.py and every page
+    python -m cardioscan.importtime app.py --budget-ms 1200 --top 15
+
+Exits with status 1 when a script's imports take longer than the budget or
+pull in a dependency that must stay lazy (``LAZY_MODULES``), so the same
+check can run in CI. ``report()`` and ``check()`` are the programmatic form.
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+from cardioscan.inference import ROOT_DIR
+
+DEFAULT_BUDGET_MS = 1000.0
+DEFAULT_REPEATS = 3
+# Heavy dependencies that only specific branches need; never at script import.
+# (streamlit itself loads the plotly core, but not plotly.express.)
+LAZY_MODULES = ("pandas", "plotly.express", "sklearn", "scipy", "joblib", "pyarrow")
+
+
+def script_imports(path):
+    """Source of the module-level import statements of a script, in order."""
+    tree = ast.parse(open(path, encoding="utf-8").read(), filename=str(path))
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def _parse(stderr):
+    """``-X importtime`` lines -> list of (module, depth, self_us, cumulative_us)."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def measure(statements, python=sys.executable, cwd=ROOT_DIR):
+    """Run ``statements`` once in a fresh interpreter; returns parsed entries."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(cwd),
+                                                                    os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([python, "-X", "importtime", "-c", "\n".join(statements)],
+                            cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"imports failed:\n{result.stderr[-2000:]}")
+    return _parse(result.stderr)
+
+
+def report(script, repeats=DEFAULT_REPEATS):
+    """Import-time summary of ``script``: the fastest of ``repeats`` cold runs.
+
+    Returns a dict with ``total_ms``, ``top_level`` (direct imports and their
+    cumulative ms, slowest first) and ``modules`` (every module loaded).
+    """
+    statements = script_imports(script)
+    # Whatever the bare interpreter loads (site, encodings, ...) is not the script's cost
+    startup = {name for name, _, _, _ in measure([])}
+    best = None
+    for _ in range(max(1, repeats)):
+        entries = [entry for entry in measure(statements) if entry[0] not in startup]
+        total = sum(cumulative for _, depth, _, cumulative in entries if depth == 0)
+        if best is None or total < best[0]:
+            best = (total, entries)
+    total, entries = best
+    top_level = sorted(((name, cumulative / 1000) for name, depth, _, cumulative in entries
+                        if depth == 0), key=lambda item: item[1], reverse=True)
+    return {
+        "script": str(script),
+        "total_ms": total / 1000,
+        "top_level": top_level,
+        "modules": sorted({name for name, _, _, _ in entries}),
+    }
+
+
+def check(summary, budget_ms=DEFAULT_BUDGET_MS, lazy_modules=LAZY_MODULES):
+    """Budget violations of a ``report()`` summary, as readable strings."""
+    problems = []
+    if summary["total_ms"] > budget_ms:
+        problems.append(f"imports take {summary['total_ms']:.0f}ms (budget {budget_ms:.0f}ms)")
+    eager = sorted({lazy for lazy in lazy_modules for name in summary["modules"]
+                    if name == lazy or name.startswith(lazy + ".")})
+    if eager:
+        problems.append(f"imported eagerly: {', '.join(eager)}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report and budget script import times.")
+    parser.add_argument("scripts", nargs="*",
+                        help="Scripts to check (default: app.py and pages/*.py)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--top", type=int, default=10, help="Slowest direct imports to list")
+    args = parser.parse_args(argv)
+
+    scripts = args.scripts or [ROOT_DIR / "app.py", *sorted((ROOT_DIR / "pages").glob("*.py"))]
+    failed = False
+    for script in scripts:
+        summary = report(script, args.repeats)
+        problems = check(summary, args.budget_ms)
+        failed |= bool(problems)
+        print(f"{summary['script']}: {summary['total_ms']:.0f}ms "
+              f"({len(summary['modules'])} modules) {'FAIL' if problems else 'ok'}")
+        for name, ms in summary["top_level"][:args.top]:
+            print(f"  {ms:9.1f}ms  {name}")
+        for problem in problems:
+            print(f"  ! {problem}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
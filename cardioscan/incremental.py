@@ -0,0 +1,324 @@
+"""Incremental retraining on an append-only dataset CSV.
+
+The CSV is treated as a log: each run ingests only the bytes appended since
+the previous run. Ingested byte ranges are fingerprinted, and the parsed rows
+are kept as an append-only columnar copy, so history is never re-parsed::
+
+    .cache/incremental/
+        state.json          # byte offset, block fingerprints, running feature stats
+        history/<col>.bin   # raw column values of every ingested row
+
+Per run, the new rows are compared against the running per-feature mean and
+standard deviation of history. Below the drift threshold the current forest
+is extended with warm-started trees fitted on the new rows plus an equal-size
+sample of history; above it (or with no model yet) the forest is refit on
+the full columnar history. A warm start's work is proportional to the
+delta: the history sample is drawn by position, and the held-out metrics
+are a running confusion matrix to which only the delta's held-out rows are
+added (earlier rows keep the prediction of the version that ingested them,
+as with the cohort risk). A full refit reads, and re-scores, all history.
+
+Rows are assigned to the held-out test set by a hash of ``patientid``, so a
+patient stays on the same side of the split across runs. Versions published
+from here record the chained block fingerprint as their training data hash,
+since hashing the whole file would defeat the point.
+"""
+
+import hashlib
+import io
+import json
+import math
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from cardioscan.cohort import RISK, CohortIndex
+from cardioscan.dataset import storage_dtype, to_storage
+from cardioscan.evaluation import PATIENT_HASH, TARGET, confusion_metrics, is_test_row
+from cardioscan.features import FeaturePipeline
+from cardioscan.inference import ROOT_DIR, predict_risk
+from cardioscan.model_store import COHORT_DIR, ModelStore
+
+STATE_DIR = ROOT_DIR / ".cache" / "incremental"
+STATE_FILE = "state.json"
+HISTORY_DIR = "history"
+DEFAULT_DRIFT_THRESHOLD = 0.25
+MIN_NEW_TREES = 5
+MAX_TREES = 200
+RANDOM_STATE = 42
+
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        return handle.read(end - start)
+
+
+class IncrementalTrainer:
+    def __init__(self, csv_path, state_dir=STATE_DIR, store=None):
+        self.csv_path = Path(csv_path)
+        self.state_dir = Path(state_dir)
+        self.store = store or ModelStore()
+        self.pipeline = FeaturePipeline()
+        self.state = self._load_state()
+
+    # --- state & history -------------------------------------------------
+
+    def _load_state(self):
+        path = self.state_dir / STATE_FILE
+        if path.exists():
+            return json.loads(path.read_text())
+        return None
+
+    def _save_state(self):
+        tmp = self.state_dir / f".{STATE_FILE}.tmp"
+        tmp.write_text(json.dumps(self.state, indent=2))
+        tmp.replace(self.state_dir / STATE_FILE)
+
+    def _reset(self):
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+        (self.state_dir / HISTORY_DIR).mkdir(parents=True)
+        self.state = None
+
+    def history(self):
+        """Columnar history as a DataFrame backed by memory-mapped columns."""
+        rows = self.state["rows"]
+        columns = {}
+        for name, dtype in self.state["dtypes"].items():
+            path = self.state_dir / HISTORY_DIR / f"{name}.bin"
+            # Columns can be longer than `rows` after an interrupted run; ignore the tail
+            columns[name] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,)) if rows else \
+                np.empty(0, dtype=dtype)
+        return pd.DataFrame(columns, copy=False)
+
+    def _append_history(self, frame):
+        for name, dtype in self.state["dtypes"].items():
+            path = self.state_dir / HISTORY_DIR / f"{name}.bin"
+            values = to_storage(name, frame[name], np.dtype(dtype))
+            with open(path, "r+b" if path.exists() else "wb") as handle:
+                handle.seek(self.state["rows"] * np.dtype(dtype).itemsize)
+                handle.write(values.tobytes())
+                handle.truncate()
+
+    def verify(self, full=False):
+        """Check that already-ingested bytes are unchanged.
+
+        By default only the header and the most recent block are re-hashed,
+        which catches rewrites of the file without reading all of it.
+        """
+        if self.state is None:
+            return False
+        if self.csv_path.stat().st_size < self.state["offset"]:
+            return False
+        header = _read_range(self.csv_path, 0, self.state["header_end"])
+        if _sha1(header) != self.state["header_sha1"]:
+            return False
+        blocks = self.state["blocks"] if full else self.state["blocks"][-1:]
+        return all(_sha1(_read_range(self.csv_path, b["start"], b["end"])) == b["sha1"]
+                   for b in blocks)
+
+    # --- ingestion -------------------------------------------------------
+
+    def ingest(self):
+        """Parse bytes appended since the last run; returns the new rows."""
+        if not self.verify():
+            self._reset()
+        size = self.csv_path.stat().st_size
+        if self.state is None:
+            with open(self.csv_path, "rb") as handle:
+                header = handle.readline()
+            start = len(header)
+        else:
+            header = _read_range(self.csv_path, 0, self.state["header_end"])
+            start = self.state["offset"]
+
+        tail = _read_range(self.csv_path, start, size)
+        # Only ingest complete lines; a partially written last row waits for the next run
+        tail = tail[:tail.rfind(b"\n") + 1]
+        if not tail.strip():
+            return None
+        delta = pd.read_csv(io.BytesIO(header + tail))
+        end = start + len(tail)
+
+        if self.state is None:
+            self.state = {
+                "source": str(self.csv_path),
+                "header_end": len(header),
+                "header_sha1": _sha1(header),
+                "offset": start,
+                "rows": 0,
+                # The dataset schema's compact dtypes, fixed on the first block
+                "dtypes": {name: storage_dtype(name, delta[name]).str for name in delta.columns},
+                "blocks": [],
+                "chain_sha1": _sha1(header),
+                "feature_stats": None,
+                "test_confusion": None,
+                "model_version": None,
+            }
+        self._append_history(delta)
+        digest = _sha1(tail)
+        self.state["blocks"].append({"start": start, "end": end, "rows": len(delta), "sha1": digest})
+        self.state["chain_sha1"] = _sha1((self.state["chain_sha1"] + digest).encode("ascii"))
+        self.state["offset"] = end
+        self.state["rows"] += len(delta)
+        return delta
+
+    # --- drift -------------------------------------------------------------
+
+    def _feature_columns(self):
+        return self.pipeline.columns
+
+    def drift_score(self, delta):
+        """Largest standardized mean shift of any feature, delta vs. history.
+
+        Shifts are reduced by ``2 / sqrt(len(delta))``, the noise expected from
+        a delta of that size alone, so small daily appends do not read as drift.
+        """
+        stats = self.state["feature_stats"]
+        if not stats:
+            return math.inf
+        noise = 2.0 / math.sqrt(len(delta))
+        score = 0.0
+        for name in self._feature_columns():
+            if name not in stats:
+                return math.inf  # stats from an older feature set; refit from scratch
+            count, total, total_sq = stats[name]
+            mean = total / count
+            std = math.sqrt(max(total_sq / count - mean * mean, 0.0)) or 1.0
+            score = max(score, abs(float(delta[name].mean()) - mean) / std - noise)
+        return max(score, 0.0)
+
+    def _update_stats(self, delta):
+        stats = self.state["feature_stats"] or {}
+        for name in self._feature_columns():
+            values = delta[name].to_numpy(dtype=np.float64)
+            count, total, total_sq = stats.get(name, (0, 0.0, 0.0))
+            stats[name] = [count + len(values), total + float(values.sum()),
+                           total_sq + float((values * values).sum())]
+        self.state["feature_stats"] = stats
+
+    # --- training --------------------------------------------------------
+
+    def _cohort(self, model, history, history_rows, previous_version, full):
+        """Cohort index of all history rows, with held-out risk.
+
+        The previous version's index already holds the first ``history_rows``
+        rows, so only the delta is transformed and merged in. A warm start
+        also only scores the delta's held-out rows: earlier rows keep the risk
+        of the version that ingested them, just as the forest keeps their
+        trees. A full refit replaces every tree, so it re-scores all held-out
+        rows (the refit itself already reads the whole history).
+        """
+        columns = self.pipeline.columns
+        path = self.store.path(previous_version) / COHORT_DIR if previous_version else None
+        previous = None
+        if path is not None and path.is_dir():
+            try:
+                previous = CohortIndex.load(path)
+            except ValueError:
+                pass  # an older index format; rebuild
+        if previous is None or previous.rows != history_rows:
+            X_test, risk = self._held_out_risk(model, history)
+            return CohortIndex.build(columns, self.pipeline.transform(history), risk, X_test)
+        delta = history.iloc[history_rows:]
+        X = self.pipeline.transform(delta)
+        if not full and RISK in previous.values:
+            X_test, risk = self._held_out_risk(model, delta)
+            return previous.insert(columns, X, risk, X_test)
+        X_test, risk = self._held_out_risk(model, history)
+        return previous.insert(columns, X).with_risk(columns, X_test, risk)
+
+    def _sample_training_rows(self, history, history_rows, n):
+        """Up to ``n`` random non-held-out rows among the first ``history_rows``.
+
+        Positions are drawn and then checked, so only the sampled rows of the
+        memory-mapped history are read; ~80% of rows are training rows.
+        """
+        rng = np.random.default_rng(RANDOM_STATE)
+        size = min(history_rows, 2 * n + 64)
+        positions = np.sort(rng.choice(history_rows, size=size, replace=False))
+        candidates = history.iloc[positions]
+        candidates = candidates[~is_test_row(candidates["patientid"])]
+        if len(candidates) < n and size < history_rows:
+            # Too few training rows drawn; fall back to scanning all of them
+            old = history.iloc[:history_rows]
+            candidates = old[~is_test_row(old["patientid"])]
+        if len(candidates) > n:
+            candidates = candidates.iloc[np.sort(rng.choice(len(candidates), size=n, replace=False))]
+        return candidates
+
+    def _confusion(self, model, rows):
+        """``[[tn, fp], [fn, tp]]`` of ``model`` on the held-out rows of the frame ``rows``."""
+        test = rows[is_test_row(rows["patientid"])]
+        if not len(test):
+            return [[0, 0], [0, 0]]
+        y_true = test[TARGET].to_numpy()
+        y_pred = model.predict(self.pipeline.frame(test))
+        return [[int(np.sum((y_true == actual) & (y_pred == predicted))) for predicted in (0, 1)]
+                for actual in (0, 1)]
+
+    def _held_out_risk(self, model, rows):
+        """Encoded held-out rows of the frame ``rows`` and ``model``'s risk for them."""
+        test = rows[is_test_row(rows["patientid"])]
+        return self.pipeline.transform(test), predict_risk(model, self.pipeline.frame(test))
+
+    def run(self, drift_threshold=DEFAULT_DRIFT_THRESHOLD, force_full=False, params=None):
+        """Ingest new rows and update the model; returns a summary dict."""
+        previous_version = self.state["model_version"] if self.state else None
+        delta = self.ingest()
+        if delta is None:
+            return {"mode": "noop", "delta_rows": 0, "version": previous_version}
+
+        history_rows = self.state["rows"] - len(delta)
+        drift = self.drift_score(delta)
+        full = force_full or previous_version is None or history_rows == 0 or drift > drift_threshold
+        if not full and self.store.manifest(previous_version)["feature_names"] != self.pipeline.columns:
+            full = True  # the previous forest was trained on other columns
+        history = self.history()
+
+        if full:
+            train = history[~is_test_row(history["patientid"])]
+            model = RandomForestClassifier(random_state=RANDOM_STATE, **(params or {}))
+            model.fit(self.pipeline.frame(train), train[TARGET])
+        else:
+            model = self.store.load_estimator(previous_version)
+            new_trees = max(MIN_NEW_TREES, math.ceil(model.n_estimators * len(delta) / history_rows))
+            fresh = delta[~is_test_row(delta["patientid"])]
+            sample = self._sample_training_rows(history, history_rows, len(fresh))
+            fit_rows = pd.concat([fresh, sample], ignore_index=True)
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + new_trees)
+            model.fit(self.pipeline.frame(fit_rows), fit_rows[TARGET])
+            if len(model.estimators_) > MAX_TREES:
+                # Retire the oldest trees so the forest size stays bounded
+                model.estimators_ = model.estimators_[-MAX_TREES:]
+                model.n_estimators = MAX_TREES
+            model.set_params(warm_start=False)
+
+        cohort = self._cohort(model, history, history_rows, previous_version, full)
+        confusion = self.state.get("test_confusion")
+        if full or confusion is None:
+            confusion = self._confusion(model, history)
+        else:
+            confusion = (np.asarray(confusion) + self._confusion(model, delta)).tolist()
+        self.state["test_confusion"] = confusion
+        metrics = confusion_metrics(confusion) if np.sum(confusion) else {}
+        version = self.store.publish(model, self.state["chain_sha1"], metrics, extra={
+            "training_mode": "full" if full else "warm_start",
+            "split": PATIENT_HASH,
+            "data_rows": self.state["rows"],
+            "delta_rows": len(delta),
+            "drift_score": None if math.isinf(drift) else drift,
+        }, pipeline=self.pipeline, cohort=cohort)
+        self._update_stats(delta)
+        self.state["model_version"] = version
+        self._save_state()
+        return {"mode": "full" if full else "warm_start", "delta_rows": len(delta),
+                "drift": drift, "version": version, "n_trees": len(model.estimators_),
+                "metrics": metrics}
@@ -0,0 +1,40 @@
+"""Loading the trained heart model and turning its output into a risk score."""
+
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MODEL_PATH = ROOT_DIR / "heart_model.pkl"
+
+# Positive class in `target` (1 = cardiovascular disease)
+POSITIVE_CLASS = 1
+
+
+def load_model(path=MODEL_PATH):
+    """Unpickle the estimator written by ``train_model.py``.
+
+    This is deliberately uncached; callers decide how long the handle lives
+    (the Streamlit app wraps it in ``st.cache_resource``).
+    """
+    import joblib
+
+    return joblib.load(path)
+
+
+def predict_risk(model, features):
+    """Return P(target == 1) for every row of ``features`` as a float array."""
+    proba = model.predict_proba(features)
+    column = list(model.classes_).index(POSITIVE_CLASS)
+    return np.asarray(proba[:, column], dtype=np.float64)
+
+
+def explain_risk(model, features):
+    """Per-feature contributions to P(target == 1) for every row of ``features``.
+
+    Returns ``(bias, contributions)`` as ``FlatForest.explain`` does, so
+    ``bias + contributions.sum(axis=1)`` is the risk. ``model`` must be a
+    ``FlatForest`` (what the model store serves).
+    """
+    column = list(model.classes_).index(POSITIVE_CLASS)
+    return model.explain(features, column)
@@ -0,0 +1,431 @@
+"""Concurrent-session load test of the Streamlit app.
+
+Each simulated clinician is a websocket client speaking the browser's own
+protocol (protobuf ``BackMsg`` / ``ForwardMsg`` on ``/_stcore/stream``), so
+the server does exactly the work a real tab causes: form submits are full
+reruns, the scoring poller and the what-if panel re-execute as fragments,
+and every session gets its own script thread. Nothing leaves the machine;
+by default a headless ``streamlit run app.py`` is started on a free local
+port and stopped afterwards::
+
+    python -m cardioscan.loadtest --sessions 1,4,16,32 --duration 30
+    python -m cardioscan.loadtest --url http://localhost:8501 --sessions 8 --allow-production-writes
+
+Per session, a loop of: fill the form with a dataset patient (numeric
+vitals jittered, so the prediction cache rarely answers), press
+"Run Heart Analysis", answer the poller's auto-reruns like the browser
+until the result shows, sometimes change the what-if axis, then pause for
+an exponentially distributed think time.
+
+Reported per concurrency level: latency percentiles of submit reruns,
+fragment polls, what-if fragment reruns and submit-to-result, throughput
+(analyses and script runs per second), busy rejections and errors, and
+the server's resident memory per session (started servers only: RSS of
+the server process and its scoring workers, measured on Linux via
+``/proc``). A started server audit-logs and drift-counts into a temporary
+directory, never the production ones. A server given with ``--url`` records
+the synthetic patients like real ones, in whatever audit log and drift data
+it writes to, so that takes ``--allow-production-writes``. The load generator
+shares the machine with the server, so leave it cores to spare.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+from cardioscan.features import CLINICAL_FEATURES
+from cardioscan.inference import ROOT_DIR
+
+DEFAULT_SESSIONS = (1, 4, 16)
+DEFAULT_DURATION = 20.0
+DEFAULT_THINK_SECONDS = 1.0
+WHATIF_SHARE = 0.5  # analyses followed by a what-if change
+JITTERED = ("age", "restingBP", "serumcholestrol", "maxheartrate")
+JITTER = 3  # +- on the vitals above
+RUN_TIMEOUT = 60.0
+SERVER_START_TIMEOUT = 60.0
+WARM_UP_ATTEMPTS = 5
+# How the app says where a submit ended up (see app.py)
+RESULT_TEXTS = ("High Risk Detected", "Heart Status: Healthy")
+BUSY_TEXT = "scoring service is busy"
+WHATIF_KEY = "whatif_x"
+LATENCY_KINDS = ("submit", "poll", "whatif", "result")
+
+
+def _widget_key(widget_id):
+    # Streamlit widget ids are "$$ID-<hash>-<user key>", with "None" for no key
+    key = widget_id.split("-", 2)[-1]
+    return None if key == "None" else key
+
+
+class Session:
+    """One simulated browser tab: the widget values it holds and its timings."""
+
+    def __init__(self, url):
+        self.url = url
+        self.states = {}  # widget id -> WidgetState, resent on every rerun like the browser
+        self.widgets = {}  # key (or id) -> (id, element kind, element proto, fragment id)
+        self.polls = {}  # fragment id -> auto-rerun interval registered by the last full run
+        self.alerts = []
+        self.submit_id = None
+        self.latency = collections.defaultdict(list)
+        self.outcomes = collections.Counter()
+        self.runs = 0
+        self.errors = []
+        self._ws = None
+
+    async def connect(self):
+        from websockets.asyncio.client import connect
+
+        self._ws = await connect(self.url, subprotocols=["streamlit"], max_size=None,
+                                 open_timeout=RUN_TIMEOUT)
+        await self.run()
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+
+    def _element(self, delta):
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        proto = getattr(element, kind)
+        if kind == "alert":
+            self.alerts.append(proto.body)
+        elif kind == "exception":
+            self.errors.append(proto.message)
+        widget_id = getattr(proto, "id", "") if hasattr(proto, "id") else ""
+        if widget_id:
+            self.widgets[_widget_key(widget_id) or widget_id] = (widget_id, kind, proto,
+                                                                 delta.fragment_id)
+            if kind == "button" and proto.is_form_submitter:
+                self.submit_id = widget_id
+
+    async def run(self, changes=(), trigger=None, fragment_id="", auto=False):
+        """Rerun the script (or one fragment) and wait for it; returns the seconds taken."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        for state in changes:
+            self.states[state.id] = state
+        message = BackMsg()
+        client = message.rerun_script
+        client.fragment_id = fragment_id
+        client.is_auto_rerun = auto
+        client.widget_states.widgets.extend(self.states.values())
+        if trigger is not None:
+            client.widget_states.widgets.add(id=trigger, trigger_value=True)
+        started = time.perf_counter()
+        await self._ws.send(message.SerializeToString())
+        while True:
+            reply = ForwardMsg()
+            reply.ParseFromString(await asyncio.wait_for(self._ws.recv(), RUN_TIMEOUT))
+            kind = reply.WhichOneof("type")
+            if kind == "new_session" and not reply.new_session.fragment_ids_this_run:
+                # A full run starts (possibly requested by a fragment's st.rerun)
+                self.widgets, self.polls, self.alerts = {}, {}, []
+            elif kind == "delta" and reply.delta.WhichOneof("type") == "new_element":
+                self._element(reply.delta)
+            elif kind == "auto_rerun":
+                self.polls[reply.auto_rerun.fragment_id] = reply.auto_rerun.interval
+            elif kind == "script_finished":
+                self.runs += 1
+                if reply.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return time.perf_counter() - started
+
+    def _state(self, key, value):
+        """The ``WidgetState`` that sets widget ``key`` to the model value ``value``."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget_id, kind, proto, _ = self.widgets[key]
+        state = WidgetState(id=widget_id)
+        labels = {code: label for feature in CLINICAL_FEATURES if feature.name == key
+                  for label, code in (feature.categories or {}).items()}
+        if kind == "number_input":
+            low = proto.min if proto.has_min else -np.inf
+            high = proto.max if proto.has_max else np.inf
+            state.double_value = float(np.clip(value, low, high))
+        elif kind == "selectbox":
+            label = labels.get(int(value), str(value))
+            state.string_value = label if label in proto.options else str(value)
+        elif kind == "checkbox":
+            state.bool_value = bool(value)
+        elif kind == "slider" and proto.options:
+            state.string_array_value.data.append(str(int(value)))
+        elif kind == "slider":
+            state.double_array_value.data.append(float(value))
+        else:
+            return None
+        return state
+
+    async def analyze(self, patient):
+        """Submit ``patient`` (model field -> value) and poll until the page settles."""
+        changes = [self._state(key, value) for key, value in patient.items() if key in self.widgets]
+        started = time.perf_counter()
+        self.latency["submit"].append(await self.run([c for c in changes if c], self.submit_id))
+        while self.polls and not any(text in alert for alert in self.alerts for text in RESULT_TEXTS):
+            fragment_id, interval = next(iter(self.polls.items()))
+            await asyncio.sleep(interval)
+            self.latency["poll"].append(await self.run(fragment_id=fragment_id, auto=True))
+        if any(text in alert for alert in self.alerts for text in RESULT_TEXTS):
+            self.outcomes["result"] += 1
+            self.latency["result"].append(time.perf_counter() - started)
+        elif any(BUSY_TEXT in alert for alert in self.alerts):
+            self.outcomes["busy"] += 1
+        else:
+            self.outcomes["no_result"] += 1
+
+    async def explore(self, rng):
+        """Switch the what-if panel to another field (a fragment rerun), if it is shown."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        if WHATIF_KEY not in self.widgets:
+            return
+        widget_id, _, proto, fragment_id = self.widgets[WHATIF_KEY]
+        option = proto.options[rng.integers(len(proto.options))]
+        change = WidgetState(id=widget_id, string_value=option)
+        self.latency["whatif"].append(await self.run([change], fragment_id=fragment_id))
+
+
+def patients(data, rng):
+    """Endless realistic form inputs: dataset rows with the ``JITTERED`` vitals jittered."""
+    rows = data[[feature.name for feature in CLINICAL_FEATURES]].to_numpy(dtype=np.float64)
+    jitter = np.array([feature.name in JITTERED for feature in CLINICAL_FEATURES])
+    while True:
+        row = rows[rng.integers(len(rows))].copy()
+        row[jitter] += rng.integers(-JITTER, JITTER + 1, size=int(jitter.sum()))
+        yield {feature.name: value for feature, value in zip(CLINICAL_FEATURES, row)}
+
+
+async def _clinician(session, inputs, rng, deadline, think):
+    while time.perf_counter() < deadline:
+        try:
+            await session.analyze(next(inputs))
+            if rng.random() < WHATIF_SHARE:
+                await session.explore(rng)
+        except (asyncio.TimeoutError, OSError) as error:
+            session.errors.append(f"{type(error).__name__}: {error}")
+            return
+        await asyncio.sleep(rng.exponential(think))
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    p50, p90, p99 = np.percentile(np.asarray(values) * 1000.0, [50, 90, 99])
+    return {"p50_ms": float(p50), "p90_ms": float(p90), "p99_ms": float(p99), "n": len(values)}
+
+
+def _children(pid):
+    # Each thread lists the children it forked; scoring workers are forked from script threads
+    children = []
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            children += (task / "children").read_text().split()
+        except OSError:
+            pass  # the thread exited meanwhile
+    return [int(child) for child in children]
+
+
+def rss_bytes(pid):
+    """Resident memory of ``pid`` plus all its descendant processes (Linux), or ``None``."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None
+    rss = next(int(line.split()[1]) * 1024 for line in status.splitlines()
+               if line.startswith("VmRSS:"))
+    return rss + sum(rss_bytes(child) or 0 for child in _children(pid))
+
+
+async def run_level(url, n_sessions, duration, think, inputs, seed, pid=None):
+    """Drive ``n_sessions`` concurrent sessions for ``duration`` seconds; returns a summary."""
+    idle_rss = rss_bytes(pid) if pid else None
+    sessions = [Session(url) for _ in range(n_sessions)]
+    await asyncio.gather(*(session.connect() for session in sessions))
+    started = time.perf_counter()
+    runs_before = sum(session.runs for session in sessions)
+    rngs = [np.random.default_rng([seed, n_sessions, index]) for index in range(n_sessions)]
+    await asyncio.gather(*(_clinician(session, inputs, rng, started + duration, think)
+                           for session, rng in zip(sessions, rngs)))
+    elapsed = time.perf_counter() - started
+    loaded_rss = rss_bytes(pid) if pid else None
+    await asyncio.gather(*(session.close() for session in sessions))
+
+    outcomes = sum((session.outcomes for session in sessions), collections.Counter())
+    errors = [error for session in sessions for error in session.errors]
+    summary = {
+        "sessions": n_sessions,
+        "seconds": elapsed,
+        "analyses_per_s": outcomes["result"] / elapsed,
+        "runs_per_s": (sum(session.runs for session in sessions) - runs_before) / elapsed,
+        "outcomes": dict(outcomes),
+        # Script exceptions, timeouts, and submits that ended with neither result nor busy
+        "errors": len(errors) + outcomes["no_result"],
+        "first_error": errors[0] if errors else None,
+        "rss_mb": loaded_rss / 2 ** 20 if loaded_rss else None,
+        "rss_per_session_mb": (loaded_rss - idle_rss) / 2 ** 20 / n_sessions
+        if loaded_rss and idle_rss else None,
+    }
+    for kind in LATENCY_KINDS:
+        summary[kind] = _percentiles([value for session in sessions
+                                      for value in session.latency[kind]])
+    return summary
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(app=ROOT_DIR / "app.py", port=None, log=None, scratch_dir=None):
+    """Start ``streamlit run app`` headless on localhost; returns ``(process, base_url)``.
+
+    The server's audit log and drift sketches go to ``scratch_dir`` (default:
+    a new temporary directory, left to the caller), so synthetic sessions
+    never reach the production ones.
+    """
+    port = port or _free_port()
+    scratch_dir = Path(scratch_dir or tempfile.mkdtemp(prefix="cardioscan-loadtest-"))
+    env = dict(os.environ, CARDIOSCAN_AUDIT_DIR=str(scratch_dir / "audit"),
+               CARDIOSCAN_DRIFT_DIR=str(scratch_dir / "drift"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(app), "--server.headless=true",
+         "--server.address=127.0.0.1", f"--server.port={port}", "--server.fileWatcherType=none",
+         "--browser.gatherUsageStats=false"],
+        cwd=Path(app).parent, env=env, stdout=log or subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"streamlit exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"streamlit did not become healthy within {SERVER_START_TIMEOUT:.0f}s")
+
+
+def stream_url(base_url):
+    return base_url.replace("http://", "ws://").replace("https://", "wss://").rstrip("/") \
+        + "/_stcore/stream"
+
+
+async def load_test(base_url, levels, duration, think, seed=0, pid=None, quiet=False):
+    from cardioscan.dataset import load_dataset
+
+    url = stream_url(base_url)
+    inputs = patients(load_dataset(), np.random.default_rng(seed))
+    # Until one result shows: starts the scoring workers, fills the process-wide caches
+    # and imports the result page's libraries, none of which is a per-session cost
+    warm_up = Session(url)
+    await warm_up.connect()
+    for _ in range(WARM_UP_ATTEMPTS):
+        await warm_up.analyze(next(inputs))
+        if warm_up.outcomes["result"]:
+            break
+    else:
+        raise RuntimeError(f"no result after {WARM_UP_ATTEMPTS} analyses: "
+                           f"{warm_up.errors[:1] or warm_up.alerts[-1:]}")
+    await warm_up.explore(np.random.default_rng(seed))
+    await warm_up.close()
+
+    results = []
+    for n_sessions in levels:
+        summary = await run_level(url, n_sessions, duration, think, inputs, seed, pid)
+        results.append(summary)
+        if not quiet:
+            print(format_row(summary), flush=True)
+    return results
+
+
+def _ms(summary, kind, key):
+    stats = summary[kind]
+    return f"{stats[key]:.0f}" if stats else "-"
+
+
+def format_header():
+    return (f"{'sessions':>8} {'analyses/s':>10} {'runs/s':>7} {'submit p50/p99':>15} "
+            f"{'poll p50/p99':>13} {'whatif p50/p99':>15} {'result p50/p90/p99':>19} "
+            f"{'busy':>5} {'errors':>6} {'MB/session':>10}")
+
+
+def format_row(summary):
+    per_session = summary["rss_per_session_mb"]
+    return (f"{summary['sessions']:>8} {summary['analyses_per_s']:>10.2f} "
+            f"{summary['runs_per_s']:>7.1f} "
+            f"{_ms(summary, 'submit', 'p50_ms') + '/' + _ms(summary, 'submit', 'p99_ms'):>15} "
+            f"{_ms(summary, 'poll', 'p50_ms') + '/' + _ms(summary, 'poll', 'p99_ms'):>13} "
+            f"{_ms(summary, 'whatif', 'p50_ms') + '/' + _ms(summary, 'whatif', 'p99_ms'):>15} "
+            f"{'/'.join(_ms(summary, 'result', key) for key in ('p50_ms', 'p90_ms', 'p99_ms')):>19} "
+            f"{summary['outcomes'].get('busy', 0):>5} {summary['errors']:>6} "
+            f"{'-' if per_session is None else f'{per_session:.1f}':>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with concurrent sessions.")
+    parser.add_argument("--sessions", default=",".join(map(str, DEFAULT_SESSIONS)),
+                        help="Comma-separated concurrency levels, run in order")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION,
+                        help="Seconds per concurrency level")
+    parser.add_argument("--think", type=float, default=DEFAULT_THINK_SECONDS,
+                        help="Mean pause between a session's analyses (seconds)")
+    parser.add_argument("--url", help="Test a running server (e.g. http://localhost:8501) "
+                                      "instead of starting one; no memory figures then. Its "
+                                      "audit log and drift data record every synthetic patient, "
+                                      "so this needs --allow-production-writes")
+    parser.add_argument("--allow-production-writes", action="store_true",
+                        help="Accept that --url writes load-test predictions into that "
+                             "server's audit log and drift data")
+    parser.add_argument("--app", default=str(ROOT_DIR / "app.py"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    if args.url and not args.allow_production_writes:
+        parser.error("--url records the synthetic patients in that server's audit log and drift "
+                     "data; pass --allow-production-writes to do so anyway")
+    levels = [int(level) for level in args.sessions.split(",") if level.strip()]
+
+    process = None
+    log = None
+    scratch = None
+    if args.url:
+        base_url = args.url
+    else:
+        log = tempfile.NamedTemporaryFile("w+b", prefix="cardioscan-loadtest-", suffix=".log",
+                                          delete=False)
+        scratch = tempfile.TemporaryDirectory(prefix="cardioscan-loadtest-")
+        process, base_url = start_server(args.app, log=log, scratch_dir=scratch.name)
+        print(f"Started {Path(args.app).name} at {base_url} (pid {process.pid}, log {log.name})")
+    try:
+        print(format_header())
+        results = asyncio.run(load_test(base_url, levels, args.duration, args.think, args.seed,
+                                        pid=process.pid if process else None))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+            log.close()
+            scratch.cleanup()
+    if log is not None:
+        os.unlink(log.name)  # kept when the run failed
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
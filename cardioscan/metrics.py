@@ -0,0 +1,328 @@
+"""In-process counters, gauges, latency histograms and timing spans.
+
+Everything records into one process-wide registry that renders the
+Prometheus text exposition format, so any scraper (or ``curl``) can read it::
+
+    from cardioscan import metrics
+
+    PREDICTIONS = metrics.counter("cardioscan_predictions_total", "Rows scored")
+    with metrics.span("predict"):
+        ...
+    PREDICTIONS.inc(source="app")
+
+Spans feed the ``cardioscan_stage_seconds`` histogram, labelled by stage;
+``script_run`` counts Streamlit script and fragment executions and the CPU
+they cost, which is what user interactions drive.
+The HTTP service exposes ``GET /metrics``; the Streamlit app serves the same
+page on ``$CARDIOSCAN_METRICS_PORT`` when set, and one-shot scripts write it
+to ``$CARDIOSCAN_METRICS_FILE`` (the node_exporter textfile convention).
+
+Setting ``$CARDIOSCAN_PROFILE`` to a directory makes every ``Profile`` block
+dump a cProfile ``.prof`` file there (open with ``python -m pstats`` or
+snakeviz). Only one block is profiled at a time per process; concurrent
+blocks run unprofiled rather than fight over the profiler.
+"""
+
+import bisect
+import cProfile
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROFILE_ENV = "CARDIOSCAN_PROFILE"
+METRICS_FILE_ENV = "CARDIOSCAN_METRICS_FILE"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from sub-millisecond model calls up to slow training stages
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0.0)
+
+    def _lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0.0)
+
+    def _lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def _lines(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name!r} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric._lines())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help=""):
+    return REGISTRY.counter(name, help)
+
+
+def gauge(name, help=""):
+    return REGISTRY.gauge(name, help)
+
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help, buckets)
+
+
+def render():
+    return REGISTRY.render()
+
+
+STAGE_SECONDS = histogram("cardioscan_stage_seconds", "Wall time of instrumented stages")
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block into ``cardioscan_stage_seconds{stage=...}``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+SCRIPT_RUNS = counter("cardioscan_script_runs_total",
+                      "Streamlit script and fragment executions, by scope")
+SCRIPT_CPU = counter("cardioscan_script_cpu_seconds_total",
+                     "Server CPU time of those executions, by scope")
+
+
+@contextmanager
+def script_run(scope):
+    """Count one execution of ``scope`` and the CPU time it took.
+
+    Streamlit executes a script or fragment on a single thread, so
+    ``time.thread_time`` excludes concurrent sessions. A fragment also counts
+    when it runs as part of a full script run (whose CPU includes it).
+    """
+    started = time.thread_time()
+    try:
+        yield
+    finally:
+        SCRIPT_RUNS.inc(scope=scope)
+        SCRIPT_CPU.inc(time.thread_time() - started, scope=scope)
+
+
+def write_textfile(path=None):
+    """Write the current metrics to ``path`` (default ``$CARDIOSCAN_METRICS_FILE``), atomically."""
+    path = path or os.environ.get(METRICS_FILE_ENV)
+    if not path:
+        return None
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    tmp.write_text(render())
+    os.replace(tmp, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Serve ``GET /metrics`` from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+_profile_lock = threading.Lock()
+
+
+class Profile:
+    """cProfile the enclosed block when ``$CARDIOSCAN_PROFILE`` names a directory.
+
+    Usable as a context manager or with explicit ``start()``/``stop()`` (for
+    code such as a Streamlit script that can't be wrapped in one block).
+    ``stop()`` returns the path of the ``.prof`` file, or ``None``.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._profiler = None
+
+    def start(self):
+        directory = os.environ.get(PROFILE_ENV)
+        if directory and _profile_lock.acquire(blocking=False):
+            self.directory = Path(directory)
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def stop(self):
+        if self._profiler is None:
+            return None
+        self._profiler.disable()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{self.name}-{os.getpid()}-{time.time_ns()}.prof"
+            self._profiler.dump_stats(path)
+        finally:
+            self._profiler = None
+            _profile_lock.release()
+        return path
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,373 @@
+"""Versioned, memory-mappable model store.
+
+Layout (``models/`` next to the app, or ``$CARDIOSCAN_MODEL_DIR``)::
+
+    models/
+        CURRENT                 # name of the active version, e.g. "v0003"
+        v0003/
+            manifest.json       # feature pipeline, classes, data hash, sklearn version, metrics
+            metrics.json        # held-out metrics + feature importances for the About page
+            cohort/             # per age/gender band percentile index (cardioscan.cohort)
+            drift.json          # reference feature/risk histograms (cardioscan.drift)
+            forest/             # FlatForest (or QuantizedForest) .npy arrays, mapped read-only
+            estimator.joblib    # the fitted estimator, for retraining only
+
+Serving never unpickles: every process maps the same ``forest/*.npy`` files, so
+N workers share one copy of the model through the OS page cache. Publishing
+writes a new version directory and flips ``CURRENT`` atomically;
+``ModelHandle`` notices the flip on its next call and swaps without a restart::
+
+    python -m cardioscan.model_store list
+    python -m cardioscan.model_store import heart_model.pkl
+    python -m cardioscan.model_store activate v0002
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from cardioscan import metrics
+from cardioscan.cohort import CohortIndex, build_cohort
+from cardioscan.drift import DriftSketch, build_reference
+from cardioscan.features import FeaturePipeline
+from cardioscan.flat_forest import flatten
+from cardioscan.hashing import file_sha256
+from cardioscan.inference import MODEL_PATH, ROOT_DIR
+from cardioscan.quantize import load_forest
+
+STORE_FORMAT_VERSION = 1
+MODELS_DIR = Path(os.environ.get("CARDIOSCAN_MODEL_DIR", ROOT_DIR / "models"))
+DATA_PATH = ROOT_DIR / "Cardiovascular_Disease_Dataset.csv"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+METRICS_FILE = "metrics.json"
+FOREST_DIR = "forest"
+COHORT_DIR = "cohort"
+DRIFT_FILE = "drift.json"
+ESTIMATOR_FILE = "estimator.joblib"
+_VERSION_RE = re.compile(r"^v(\d{4,})$")
+
+MODEL_LOADS = metrics.counter("cardioscan_model_loads_total",
+                              "Model versions mapped by a ModelHandle (startup and hot swaps)")
+
+
+class LoadedModel:
+    """A loaded version: its name, manifest, predictor and feature pipeline."""
+
+    def __init__(self, version, manifest, model):
+        self.version = version
+        self.manifest = manifest
+        self.model = model
+        self.pipeline = FeaturePipeline.from_manifest(manifest)
+
+    def __repr__(self):
+        return f"LoadedModel({self.version!r})"
+
+
+def _metrics_report(model, manifest):
+    importances = getattr(model, "feature_importances_", None)
+    return {
+        "metrics": manifest.get("metrics", {}),
+        "feature_importances": dict(zip(manifest["feature_names"], map(float, importances)))
+        if importances is not None else {},
+        "n_trees": manifest["n_trees"],
+        "n_nodes": manifest["n_nodes"],
+        "data_rows": manifest.get("data_rows"),
+    }
+
+
+class ModelStore:
+    def __init__(self, root=MODELS_DIR):
+        self.root = Path(root)
+
+    def versions(self):
+        """Published versions, oldest first."""
+        if not self.root.is_dir():
+            return []
+        found = [p.name for p in self.root.iterdir()
+                 if p.is_dir() and _VERSION_RE.match(p.name) and (p / MANIFEST_FILE).exists()]
+        return sorted(found, key=lambda name: int(name[1:]))
+
+    def current_version(self):
+        """Name of the active version, or ``None`` for an empty store."""
+        try:
+            return (self.root / CURRENT_FILE).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def path(self, version):
+        return self.root / version
+
+    def manifest(self, version=None):
+        version = version or self._require_current()
+        return json.loads((self.path(version) / MANIFEST_FILE).read_text())
+
+    def load(self, version=None):
+        """Map a version's forest read-only (the active one by default)."""
+        version = version or self._require_current()
+        manifest = self.manifest(version)
+        if manifest.get("store_format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"{version}: unsupported store format "
+                             f"{manifest.get('store_format_version')}")
+        model = load_forest(self.path(version) / FOREST_DIR)
+        return LoadedModel(version, manifest, model)
+
+    def metrics(self, version=None):
+        """Held-out metrics and feature importances of a version.
+
+        Written at publish time; versions published before ``metrics.json``
+        existed get it computed from their estimator once and saved.
+        """
+        version = version or self._require_current()
+        path = self.path(version) / METRICS_FILE
+        try:
+            return json.loads(path.read_text())
+        except FileNotFoundError:
+            pass
+        report = _metrics_report(self.load_estimator(version), self.manifest(version))
+        tmp = path.with_name(f".{METRICS_FILE}.{os.getpid()}")
+        tmp.write_text(json.dumps(report, indent=2))
+        os.replace(tmp, path)
+        return report
+
+    def cohort(self, version=None):
+        """Cohort percentile index of a version (see ``cardioscan.cohort``).
+
+        Built at publish time; versions published before the index existed
+        (or with an older index format) get it built from the training CSV
+        once and saved.
+        """
+        version = version or self._require_current()
+        path = self.path(version) / COHORT_DIR
+        stale = None
+        if path.is_dir():
+            try:
+                return CohortIndex.load(path)
+            except ValueError:
+                stale = path.with_name(f".{COHORT_DIR}-stale-{os.getpid()}")
+        from cardioscan.dataset import load_dataset
+        from cardioscan.evaluation import split_of
+
+        loaded = self.load(version)
+        index = build_cohort(loaded.model, loaded.pipeline, load_dataset(DATA_PATH),
+                             split_of(loaded.manifest))
+        staging = Path(tempfile.mkdtemp(prefix=f".{COHORT_DIR}-", dir=self.path(version)))
+        index.save(staging)
+        try:
+            if stale is not None:
+                os.rename(path, stale)
+            os.rename(staging, path)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)  # a concurrent caller saved it first
+        if stale is not None:
+            shutil.rmtree(stale, ignore_errors=True)
+        return CohortIndex.load(path)
+
+    def drift_reference(self, version=None):
+        """Reference ``DriftSketch`` of a version (see ``cardioscan.drift``).
+
+        Built at publish time; versions published before drift monitoring
+        existed get it built from the training CSV once and saved.
+        """
+        version = version or self._require_current()
+        path = self.path(version) / DRIFT_FILE
+        try:
+            return DriftSketch.load(path)
+        except FileNotFoundError:
+            pass
+        from cardioscan.dataset import load_dataset
+        from cardioscan.evaluation import split_of
+
+        loaded = self.load(version)
+        reference = build_reference(loaded.model, loaded.pipeline, load_dataset(DATA_PATH),
+                                    split_of(loaded.manifest))
+        reference.save(path)
+        return reference
+
+    def load_estimator(self, version=None):
+        """Unpickle the estimator of a version (training paths only)."""
+        import joblib
+
+        version = version or self._require_current()
+        return joblib.load(self.path(version) / ESTIMATOR_FILE)
+
+    def publish(self, model, data_sha256, metrics=None, extra=None, activate=True, pipeline=None,
+                forest=None, cohort=None, drift=None):
+        """Write ``model`` as a new version and (by default) make it current.
+
+        ``pipeline`` is the ``FeaturePipeline`` the model was trained through
+        (by default one derived from its column names); it is stored in the
+        manifest and must produce exactly the model's columns. ``forest``
+        replaces the served ``FlatForest`` (e.g. a compressed one, see
+        ``cardioscan.compress``); ``model`` is still kept for retraining.
+        ``cohort`` is the version's ``CohortIndex`` and ``drift`` its reference
+        ``DriftSketch`` (each built on first use if omitted). The version
+        directory is assembled under a temporary name and renamed into place,
+        so readers never observe a half-written version.
+        """
+        import joblib
+        import sklearn
+
+        forest = forest or flatten(model)
+        feature_names = forest.feature_names_in_.tolist()
+        pipeline = pipeline or FeaturePipeline.for_columns(feature_names)
+        if pipeline.columns != feature_names:
+            raise ValueError(f"feature pipeline columns {pipeline.columns} do not match "
+                             f"the model's {feature_names}")
+        self.root.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=self.root))
+        forest.save(staging / FOREST_DIR)
+        if cohort is not None:
+            cohort.save(staging / COHORT_DIR)
+        if drift is not None:
+            drift.save(staging / DRIFT_FILE)
+        joblib.dump(model, staging / ESTIMATOR_FILE)
+        manifest = {
+            "store_format_version": STORE_FORMAT_VERSION,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "estimator": type(model).__name__,
+            "params": {k: v for k, v in model.get_params().items()
+                       if isinstance(v, (int, float, str, bool, type(None)))},
+            "feature_names": feature_names,
+            "feature_pipeline": pipeline.to_dict(),
+            "classes": forest.classes_.tolist(),
+            "n_trees": forest.n_trees,
+            "n_nodes": forest.n_nodes,
+            "training_data_sha256": data_sha256,
+            "sklearn_version": sklearn.__version__,
+            "metrics": metrics or {},
+        }
+        manifest.update(extra or {})
+        report = _metrics_report(model, manifest)
+        (staging / METRICS_FILE).write_text(json.dumps(report, indent=2))
+
+        while True:
+            versions = self.versions()
+            version = f"v{(int(versions[-1][1:]) + 1) if versions else 1:04d}"
+            manifest["version"] = version
+            (staging / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+            try:
+                os.rename(staging, self.path(version))
+                break
+            except OSError:
+                if self.path(version).exists():
+                    # Another publisher claimed this number first; take the next one
+                    continue
+                raise
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        """Atomically point ``CURRENT`` at ``version``."""
+        if not (self.path(version) / MANIFEST_FILE).exists():
+            raise ValueError(f"unknown model version: {version}")
+        tmp = self.root / f".{CURRENT_FILE}.{os.getpid()}"
+        tmp.write_text(version + "\n")
+        os.replace(tmp, self.root / CURRENT_FILE)
+
+    def import_pickle(self, path=MODEL_PATH, data_path=DATA_PATH, activate=True):
+        """Publish a legacy ``heart_model.pkl`` with its held-out metrics."""
+        import joblib
+
+        from cardioscan.dataset import dataset_sha256, load_dataset
+        from cardioscan.evaluation import classification_metrics, holdout_split
+
+        model = joblib.load(path)
+        data = load_dataset(data_path)
+        # Older pickles may still expect patientid; score them on their own columns
+        pipeline = FeaturePipeline.for_columns(model.feature_names_in_)
+        _, X_test, _, y_test = holdout_split(data, pipeline)
+        metrics = classification_metrics(y_test, model.predict(X_test))
+        return self.publish(model, dataset_sha256(data_path), metrics,
+                            extra={"source": Path(path).name, "data_rows": len(data)},
+                            activate=activate, pipeline=pipeline,
+                            cohort=build_cohort(model, pipeline, data),
+                            drift=build_reference(model, pipeline, data))
+
+    def _require_current(self):
+        version = self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"no active model in {self.root}")
+        return version
+
+
+class ModelHandle:
+    """Process-wide handle that follows ``CURRENT`` and hot-swaps on change.
+
+    ``get()`` costs one tiny file read per call; the forest is only re-mapped
+    when the active version actually changes. An empty store is seeded from
+    the legacy ``heart_model.pkl`` on first use.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or ModelStore()
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = self.store.current_version()
+        loaded = self._loaded
+        if loaded is not None and loaded.version == version:
+            return loaded
+        with self._lock:
+            version = self.store.current_version()
+            if version is None:
+                with metrics.span("model_import"):
+                    version = self.store.import_pickle()
+            if self._loaded is None or self._loaded.version != version:
+                with metrics.span("model_load"):
+                    self._loaded = self.store.load(version)
+                MODEL_LOADS.inc()
+            return self._loaded
+
+    def warm_up(self):
+        """Map the active version on a daemon thread; ``get()`` waits for it if needed."""
+        thread = threading.Thread(target=self.get, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and manage the model store.")
+    parser.add_argument("--root", default=str(MODELS_DIR))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List versions (* marks the active one)")
+    show = commands.add_parser("show", help="Print a version's manifest")
+    show.add_argument("version", nargs="?")
+    activate = commands.add_parser("activate", help="Make a version current")
+    activate.add_argument("version")
+    imported = commands.add_parser("import", help="Publish a legacy joblib pickle")
+    imported.add_argument("path", nargs="?", default=str(MODEL_PATH))
+    imported.add_argument("--data", default=str(DATA_PATH))
+    imported.add_argument("--no-activate", action="store_true")
+    args = parser.parse_args(argv)
+
+    store = ModelStore(args.root)
+    if args.command == "list":
+        current = store.current_version()
+        for version in store.versions():
+            manifest = store.manifest(version)
+            accuracy = manifest.get("metrics", {}).get("accuracy")
+            accuracy = f"{accuracy:.3f}" if accuracy is not None else "-"
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}  {manifest['created_at']}  "
+                  f"trees={manifest['n_trees']}  accuracy={accuracy}")
+    elif args.command == "show":
+        print(json.dumps(store.manifest(args.version), indent=2))
+    elif args.command == "activate":
+        store.activate(args.version)
+        print(f"Active model: {args.version}")
+    else:
+        version = store.import_pickle(args.path, args.data, activate=not args.no_activate)
+        print(f"Published {args.path} as {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Bounded, thread-safe memo of predictions keyed on the model feature vector.
+
+Keys are the feature row in model column order cast to float32, which is
+exactly what the forest compares against its thresholds, so two inputs that
+share a key are guaranteed to get the same prediction. Entries expire after
+``ttl_seconds``, the least recently used entry is evicted beyond
+``max_entries``, and the whole cache is dropped when the model version it was
+filled with is no longer the one asked for.
+
+Lookups, size and dropped entries are exported as
+``cardioscan_prediction_cache_*`` metrics (see ``cardioscan.metrics``);
+``stats()`` reports the same for one cache.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from cardioscan import metrics
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_TTL_SECONDS = 3600.0
+
+REQUESTS = metrics.counter("cardioscan_prediction_cache_requests_total",
+                           "Prediction cache lookups, by result")
+ENTRIES = metrics.gauge("cardioscan_prediction_cache_entries", "Predictions held in the cache")
+DROPPED = metrics.counter("cardioscan_prediction_cache_dropped_total",
+                          "Cache entries dropped, by reason (evicted, expired, invalidated)")
+
+
+def feature_key(features):
+    """Normalized cache key for one feature row (DataFrame, Series or array)."""
+    if hasattr(features, "to_numpy"):
+        features = features.to_numpy()
+    return np.ascontiguousarray(features, dtype=np.float32).reshape(-1).tobytes()
+
+
+class PredictionCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                DROPPED.inc(len(self._entries), reason="invalidated")
+            self._entries.clear()
+            self._version = version
+
+    def get(self, version, key):
+        """Cached value for ``key`` under model ``version``, or ``None``."""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                DROPPED.inc(reason="expired")
+                entry = None
+            ENTRIES.set(len(self._entries))
+            if entry is None:
+                self.misses += 1
+                REQUESTS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            REQUESTS.inc(result="hit")
+            return entry[1]
+
+    def put(self, version, key, value):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                DROPPED.inc(reason="evicted")
+            ENTRIES.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            ENTRIES.set(0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "version": self._version,
+            }
@@ -0,0 +1,326 @@
+"""Compact, quantized form of a ``FlatForest`` for packing many inference workers.
+
+A ``FlatForest`` spends 36 bytes per node (int32 feature and children,
+float64 threshold, two float64 class probabilities). ``QuantizedForest``
+stores the same trees in about 7:
+
+- ``feature``: uint8 (at most 255 input columns).
+- ``threshold``: uint16 *bin codes*. Each feature's distinct thresholds go
+  into a small sorted table (``bins``), and inputs are binned once per row
+  with ``searchsorted``, so ``x <= t`` becomes ``code(x) <= code(t)``. Tables
+  hold float32 rounded down, which is exact for the float32 inputs the
+  forest sees; integer features (per the feature pipeline) are floored, so
+  ``chestpain <= 1.5`` becomes ``<= 1``.
+- ``right``: tree-local int16 child index (int32 for trees over 32k nodes).
+  Nodes are in preorder, so an internal node's left child is the next node;
+  leaves point ``right`` at themselves.
+- ``value``: class probabilities as uint8 (``round(p * 255)``) or float16.
+
+Split decisions are exact; only leaf probabilities are rounded, by at most
+1/510 (uint8) per tree. ``check_agreement`` measures that on a dataset::
+
+    python -m cardioscan.quantize                  # active version -> new version
+    python -m cardioscan.quantize --leaf-dtype float16 --activate
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from cardioscan.flat_forest import APPLY_BLOCK_ROWS, META_FILE, FlatForest
+
+FORMAT_VERSION = 1
+KIND = "quantized"
+ARRAY_NAMES = ("feature", "threshold", "right", "value", "roots", "bins", "bin_offsets")
+LEAF_DTYPES = ("uint8", "float16")
+UINT8_SCALE = 255
+# Leaves compare against the largest code, which no input bin can exceed
+LEAF_CODE = np.iinfo(np.uint16).max
+
+
+def _round_down_float32(values):
+    """Largest float32 <= each float64 value (``x32 <= t`` iff ``x32 <= this``)."""
+    rounded = values.astype(np.float32)
+    over = rounded.astype(np.float64) > values
+    rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+    return rounded
+
+
+class QuantizedForest(FlatForest):
+    """Predictor over quantized node arrays; see the module docstring.
+
+    Exposes the same estimator-style interface as ``FlatForest``
+    (``predict_proba``, ``predict``, ``explain``, ``classes_``), so the
+    model store, batch scoring and the app use it unchanged.
+    """
+
+    def __init__(self, feature, threshold, right, value, roots, bins, bin_offsets,
+                 max_depth, classes, feature_names):
+        self.feature = feature
+        self.threshold = threshold
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.bins = bins
+        self.bin_offsets = bin_offsets
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(feature_names)
+        self._class_values = {}
+
+    @classmethod
+    def from_flat(cls, forest, integer_features=(), leaf_dtype="uint8"):
+        """Quantize ``forest``; ``integer_features`` names columns that only hold integers."""
+        if leaf_dtype not in LEAF_DTYPES:
+            raise ValueError(f"leaf_dtype must be one of {LEAF_DTYPES}, got {leaf_dtype!r}")
+        if forest.n_features_in_ > np.iinfo(np.uint8).max + 1:
+            raise ValueError("quantized forests support at most 256 features")
+        nodes = np.arange(forest.n_nodes)
+        leaf = forest.left == nodes
+        if not np.array_equal(forest.left[~leaf], nodes[~leaf] + 1):
+            raise ValueError("forest nodes are not in preorder")
+        integer_features = set(integer_features)
+
+        codes = np.full(forest.n_nodes, LEAF_CODE, dtype=np.uint16)
+        tables = []
+        for index, name in enumerate(forest.feature_names_in_):
+            split = ~leaf & (forest.feature == index)
+            thresholds = np.asarray(forest.threshold[split], dtype=np.float64)
+            if name in integer_features:
+                thresholds = np.floor(thresholds).astype(np.float32)
+            else:
+                thresholds = _round_down_float32(thresholds)
+            table, inverse = np.unique(thresholds, return_inverse=True)
+            if len(table) >= LEAF_CODE:
+                raise ValueError(f"{name}: too many distinct thresholds to quantize")
+            codes[split] = inverse
+            tables.append(table)
+
+        roots = np.asarray(forest.roots, dtype=np.int32)
+        sizes = np.diff(np.append(roots, forest.n_nodes))
+        index_dtype = np.int16 if sizes.max() <= np.iinfo(np.int16).max else np.int32
+        right = (forest.right - np.repeat(roots, sizes)).astype(index_dtype)
+        if leaf_dtype == "uint8":
+            value = np.rint(np.asarray(forest.value) * UINT8_SCALE).astype(np.uint8)
+        else:
+            value = np.asarray(forest.value).astype(np.float16)
+        return cls(
+            feature=np.where(leaf, 0, forest.feature).astype(np.uint8),
+            threshold=codes,
+            right=right,
+            value=np.ascontiguousarray(value),
+            roots=roots,
+            bins=np.concatenate(tables),
+            bin_offsets=np.cumsum([0] + [len(table) for table in tables]).astype(np.int32),
+            max_depth=forest.max_depth,
+            classes=forest.classes_,
+            feature_names=forest.feature_names_in_.tolist(),
+        )
+
+    @property
+    def leaf_dtype(self):
+        return np.dtype(self.value.dtype).name
+
+    @property
+    def size_bytes(self):
+        return int(sum(np.asarray(getattr(self, name)).nbytes for name in ARRAY_NAMES))
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+        meta = {
+            "kind": KIND,
+            "format_version": FORMAT_VERSION,
+            "n_trees": self.n_trees,
+            "n_nodes": self.n_nodes,
+            "max_depth": self.max_depth,
+            "leaf_dtype": self.leaf_dtype,
+            "classes": self.classes_.tolist(),
+            "feature_names": self.feature_names_in_.tolist(),
+        }
+        (directory / META_FILE).write_text(json.dumps(meta, indent=2))
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        meta = json.loads((directory / META_FILE).read_text())
+        if meta.get("kind") != KIND or meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported quantized forest format: {meta.get('format_version')}")
+        arrays = {name: np.load(directory / f"{name}.npy",
+                                mmap_mode="r" if mmap else None).view(np.ndarray)
+                  for name in ARRAY_NAMES}
+        return cls(max_depth=meta["max_depth"], classes=meta["classes"],
+                   feature_names=meta["feature_names"], **arrays)
+
+    def _binned(self, X):
+        """Input matrix as uint16 bin codes, one column per feature."""
+        X = self._as_matrix(X).astype(np.float64)
+        codes = np.empty(X.shape, dtype=np.uint16)
+        for index in range(self.n_features_in_):
+            table = self.bins[self.bin_offsets[index]:self.bin_offsets[index + 1]]
+            codes[:, index] = np.searchsorted(table, X[:, index], side="left")
+        return codes
+
+    def _walk(self, X):
+        """Yield ``(start, rows, roots, offsets, step)`` per row block.
+
+        ``roots`` is the block's starting (trees, rows) global node matrix and
+        ``step(node)`` advances it one level, returning ``(child, feature)``;
+        leaves map onto themselves.
+        """
+        codes = self._binned(X)
+        n_rows, n_features = codes.shape
+        roots = self.roots.astype(np.int64)[:, None]
+        for start in range(0, n_rows, APPLY_BLOCK_ROWS):
+            flat = np.ascontiguousarray(codes[start:start + APPLY_BLOCK_ROWS]).ravel()
+            rows = len(flat) // n_features
+            offsets = (np.arange(rows, dtype=np.int64) * n_features)[None, :]
+
+            def step(node, flat=flat, offsets=offsets):
+                feature = self.feature.take(node)
+                go_right = flat.take(offsets + feature) > self.threshold.take(node)
+                right = roots + self.right.take(node)
+                # Internal nodes go to node + 1 or their right child; leaves stay put
+                return np.where(go_right, right, node + (right != node)), feature
+
+            yield start, rows, np.repeat(roots, rows, axis=1), offsets, step
+
+    def apply(self, X):
+        X = self._as_matrix(X)
+        leaves = np.empty((self.n_trees, len(X)), dtype=np.int32)
+        for start, rows, node, _, step in self._walk(X):
+            for _ in range(self.max_depth):
+                node, _ = step(node)
+            leaves[:, start:start + rows] = node
+        return leaves
+
+    def _dequantized(self, values):
+        values = values.astype(np.float64)
+        return values / UINT8_SCALE if self.value.dtype == np.uint8 else values
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.empty((leaves.shape[1], len(self.classes_)), dtype=np.float64)
+        for start in range(0, leaves.shape[1], APPLY_BLOCK_ROWS):
+            block = leaves[:, start:start + APPLY_BLOCK_ROWS]
+            proba[start:start + block.shape[1]] = self._dequantized(self.value[block]).sum(axis=0)
+        proba /= self.n_trees
+        return proba
+
+    def _values_of(self, class_index):
+        values = self._class_values.get(class_index)
+        if values is None:
+            values = self._class_values[class_index] = self._dequantized(self.value[:, class_index])
+        return values
+
+    def explain(self, X, class_index):
+        """Path attribution as ``FlatForest.explain``, over the quantized node values."""
+        X = self._as_matrix(X)
+        n_rows, n_features = X.shape
+        values = self._values_of(class_index)
+        contributions = np.zeros((n_rows, n_features), dtype=np.float64)
+        for start, rows, node, offsets, step in self._walk(X):
+            totals = np.zeros(rows * n_features, dtype=np.float64)
+            for _ in range(self.max_depth):
+                child, feature = step(node)
+                delta = values.take(child) - values.take(node)
+                totals += np.bincount((offsets + feature).ravel(), weights=delta.ravel(),
+                                      minlength=totals.size)
+                node = child
+            contributions[start:start + rows] = totals.reshape(rows, n_features)
+        bias = float(values.take(self.roots).mean())
+        return bias, contributions / self.n_trees
+
+
+def load_forest(directory, mmap=True):
+    """Load a saved ``FlatForest`` or ``QuantizedForest``, whichever ``directory`` holds."""
+    meta = json.loads((Path(directory) / META_FILE).read_text())
+    cls = QuantizedForest if meta.get("kind") == KIND else FlatForest
+    return cls.load(directory, mmap=mmap)
+
+
+def check_agreement(reference, quantized, X):
+    """How closely ``quantized`` reproduces ``reference`` on ``X``.
+
+    Returns a dict with the number of rows whose predicted class differs and
+    the largest absolute probability difference; ``reference`` can be the
+    original sklearn estimator or its ``FlatForest``.
+    """
+    expected = reference.predict_proba(X)
+    actual = quantized.predict_proba(X)
+    return {
+        "rows": int(len(expected)),
+        "class_mismatches": int((expected.argmax(axis=1) != actual.argmax(axis=1)).sum()),
+        "max_abs_error": float(np.abs(expected - actual).max()),
+    }
+
+
+def integer_columns(pipeline):
+    """Names of the pipeline features stored as integers (safe to floor thresholds)."""
+    return [feature.name for feature in pipeline.features if np.dtype(feature.dtype).kind in "iu"]
+
+
+def main(argv=None):
+    from cardioscan.cohort import build_cohort
+    from cardioscan.dataset import load_dataset
+    from cardioscan.drift import build_reference
+    from cardioscan.evaluation import TARGET, classification_metrics, split_frames, split_of
+    from cardioscan.model_store import DATA_PATH, ModelStore
+
+    parser = argparse.ArgumentParser(description="Quantize the served forest of a model version.")
+    parser.add_argument("--version", help="Version to quantize (default: the active one)")
+    parser.add_argument("--leaf-dtype", choices=LEAF_DTYPES, default="uint8")
+    parser.add_argument("--data", default=str(DATA_PATH),
+                        help="Rows to check agreement on (default: the training CSV)")
+    parser.add_argument("--dry-run", action="store_true", help="Check only; publish nothing")
+    parser.add_argument("--activate", action="store_true",
+                        help="Serve the quantized version right away")
+    args = parser.parse_args(argv)
+
+    store = ModelStore()
+    version = args.version or store.current_version()
+    loaded = store.load(version)
+    if isinstance(loaded.model, QuantizedForest):
+        raise SystemExit(f"{version} is already quantized")
+    quantized = QuantizedForest.from_flat(loaded.model, integer_columns(loaded.pipeline),
+                                          args.leaf_dtype)
+    data = load_dataset(args.data)
+    agreement = check_agreement(loaded.model, quantized,
+                                loaded.pipeline.transform(data.drop(columns=[TARGET])))
+    flat_bytes = sum(np.asarray(getattr(loaded.model, name)).nbytes
+                     for name in ("feature", "threshold", "left", "right", "value", "roots"))
+    print(f"{version}: {flat_bytes:,} -> {quantized.size_bytes:,} bytes "
+          f"({flat_bytes / quantized.size_bytes:.1f}x smaller), {args.leaf_dtype} leaves")
+    print(f"Checked {agreement['rows']:,} rows: {agreement['class_mismatches']} class mismatches, "
+          f"max probability error {agreement['max_abs_error']:.2e}")
+    if args.dry_run:
+        return
+    if agreement["class_mismatches"]:
+        raise SystemExit("quantized forest disagrees with the original; not publishing")
+
+    manifest = loaded.manifest
+    # The source version's own hold-out rows (binned and incremental versions hash patientid)
+    split = split_of(manifest)
+    _, X_test, _, y_test = split_frames(data, loaded.pipeline, split)
+    scores = classification_metrics(y_test, quantized.predict(X_test))
+    extra = {key: manifest[key] for key in ("data_rows", "search", "source", "compression")
+             if key in manifest}
+    extra["split"] = split
+    extra["quantization"] = {**agreement, "leaf_dtype": args.leaf_dtype,
+                             "size_bytes": quantized.size_bytes, "source_version": version}
+    published = store.publish(store.load_estimator(version), manifest["training_data_sha256"],
+                              scores, extra=extra, activate=args.activate,
+                              pipeline=loaded.pipeline, forest=quantized,
+                              cohort=build_cohort(quantized, loaded.pipeline, data, split),
+                              drift=build_reference(quantized, loaded.pipeline, data, split))
+    print(f"Published {published}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Background scoring shared by every Streamlit session of a server process.
+
+Predictions and their explanations run on one bounded pool instead of inside
+each session's script run. The page submits a job, keeps the future in
+``st.session_state`` and polls it, so a slow model call never freezes the
+UI, and the number of concurrent model calls is set by the pool size rather
+than by the number of open browser tabs.
+
+- Local models are scored in worker *processes* (spawned, each mapping the
+  same forest files read-only), so throughput scales with cores.
+- A remote model (``$CARDIOSCAN_API_URL``) is I/O bound and uses threads.
+- At most ``workers + queue_size`` jobs are admitted; beyond that ``submit``
+  raises ``QueueFull`` so callers can ask the user to retry.
+- Cancelling a future that has not started frees its slot immediately; a
+  running one finishes and its result is dropped.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cardioscan import metrics
+from cardioscan.inference import explain_risk, predict_risk
+
+DEFAULT_QUEUE_PER_WORKER = 4
+# Versions kept mapped per worker; a swap keeps the previous one for in-flight jobs
+WORKER_VERSIONS = 2
+
+SUBMITTED = metrics.counter("cardioscan_scoring_jobs_total", "Background scoring jobs, by outcome")
+
+# Per-process state of pool workers (set by _init_worker)
+_worker_store = None
+_worker_models = {}
+
+
+class QueueFull(RuntimeError):
+    """Every scoring slot is taken; try again shortly."""
+
+
+def score_patient(loaded, features):
+    """Risk of the first row of ``features`` plus its attribution (``None`` if unsupported)."""
+    risk = float(predict_risk(loaded.model, features)[0])
+    if not hasattr(loaded.model, "explain"):
+        return risk, None
+    bias, contributions = explain_risk(loaded.model, features)
+    return risk, (bias, contributions[0])
+
+
+def _init_worker(models_dir):
+    global _worker_store
+    from cardioscan.model_store import ModelStore
+    _worker_store = ModelStore(models_dir)
+
+
+def _score_in_worker(version, features):
+    loaded = _worker_models.get(version)
+    if loaded is None:
+        while len(_worker_models) >= WORKER_VERSIONS:
+            _worker_models.pop(next(iter(_worker_models)))
+        loaded = _worker_models[version] = _worker_store.load(version)
+    return score_patient(loaded, features)
+
+
+class ScoringPool:
+    """Bounded executor front-end; see the module docstring."""
+
+    def __init__(self, executor, workers, queue_size, in_process_models=False):
+        self._executor = executor
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._in_process_models = in_process_models
+
+    @classmethod
+    def for_store(cls, models_dir, workers=None, queue_size=None):
+        """Process pool whose workers map versions from the store at ``models_dir``."""
+        workers = workers or os.cpu_count() or 1
+        # Spawn, not fork: the Streamlit server is multi-threaded
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(str(models_dir),))
+        queue_size = DEFAULT_QUEUE_PER_WORKER * workers if queue_size is None else queue_size
+        return cls(executor, workers, queue_size, in_process_models=True)
+
+    @classmethod
+    def threaded(cls, workers=None, queue_size=None):
+        """Thread pool, for predictors that are I/O bound (the HTTP client)."""
+        workers = workers or 4 * (os.cpu_count() or 1)
+        queue_size = DEFAULT_QUEUE_PER_WORKER * workers if queue_size is None else queue_size
+        return cls(ThreadPoolExecutor(workers, thread_name_prefix="scoring"), workers, queue_size)
+
+    def _release(self, future, submitted):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+        if future.cancelled():
+            SUBMITTED.inc(outcome="cancelled")
+        else:
+            SUBMITTED.inc(outcome="failed" if future.exception() else "done")
+            # Queue wait plus model time, as the page experiences it
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - submitted, stage="scoring_job")
+
+    def submit(self, fn, *args):
+        """Run ``fn(*args)`` on the pool; raises ``QueueFull`` when out of slots."""
+        if not self._slots.acquire(blocking=False):
+            SUBMITTED.inc(outcome="rejected")
+            raise QueueFull(f"all {self.capacity} scoring slots are busy")
+        with self._lock:
+            self._in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda done: self._release(done, submitted))
+        return future
+
+    def score(self, loaded, features):
+        """Submit ``score_patient`` for a ``LoadedModel``; the future yields ``(risk, explanation)``."""
+        if self._in_process_models:
+            # Workers map the version themselves; only the tiny feature row crosses over
+            return self.submit(_score_in_worker, loaded.version, features)
+        return self.submit(score_patient, loaded, features)
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "capacity": self.capacity, "in_flight": self._in_flight}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,153 @@
+"""Cross-validated hyperparameter search for the heart forest.
+
+Every (candidate, fold) pair is an independent task run in a process pool.
+Each finished task is cached on disk under the training data hash, keyed by
+the candidate, the fold and the feature pipeline (columns and encoding), so
+adding a candidate to the grid and re-running only fits the new candidate's
+folds, and a changed feature set never reuses stale scores.
+
+Candidates are ranked on a combined objective::
+
+    score = mean CV accuracy - latency_weight * single-row latency (ms)
+
+where latency is that of the ``FlatForest`` predictor used in serving; a
+fully grown 100-tree forest rarely earns its cost on ~1,000 rows.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from cardioscan.features import FeaturePipeline
+from cardioscan.flat_forest import FlatForest
+from cardioscan.inference import ROOT_DIR
+
+CACHE_DIR = ROOT_DIR / ".cache" / "search"
+RANDOM_STATE = 42
+DEFAULT_FOLDS = 5
+DEFAULT_LATENCY_WEIGHT = 0.01  # one accuracy point per 1ms of single-row latency
+DEFAULT_GRID = {
+    "n_estimators": [25, 50, 100],
+    "max_depth": [4, 8, None],
+    "min_samples_leaf": [1, 4],
+    "max_features": ["sqrt", 0.5],
+}
+LATENCY_REPEATS = 50
+
+# Training matrix for pool workers (set by _init_worker)
+_worker_data = None
+
+
+def expand_grid(grid):
+    """All parameter combinations of ``grid`` as a list of dicts."""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def _task_key(params, fold, n_folds, features):
+    payload = json.dumps({"params": params, "fold": fold, "n_folds": n_folds,
+                          "random_state": RANDOM_STATE, "features": features}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _init_worker(X, y, feature_names, n_folds):
+    global _worker_data
+    folds = list(StratifiedKFold(n_folds, shuffle=True, random_state=RANDOM_STATE).split(X, y))
+    _worker_data = (X, y, feature_names, folds)
+
+
+def _single_row_latency_ms(forest, X):
+    """Best-of-N single-row latency; the minimum is robust to pool contention."""
+    best = float("inf")
+    for i in range(LATENCY_REPEATS):
+        row = X[i % len(X)]
+        started = time.perf_counter()
+        forest.predict_proba(row)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _run_task(params, fold):
+    X, y, feature_names, folds = _worker_data
+    train_idx, valid_idx = folds[fold]
+    model = RandomForestClassifier(random_state=RANDOM_STATE, **params)
+    started = time.perf_counter()
+    model.fit(X[train_idx], y[train_idx])
+    fit_seconds = time.perf_counter() - started
+    forest = FlatForest.from_sklearn(model, feature_names)
+    accuracy = float((forest.predict(X[valid_idx]) == y[valid_idx]).mean())
+    return {
+        "accuracy": accuracy,
+        "latency_ms": _single_row_latency_ms(forest, X[valid_idx]),
+        "fit_seconds": fit_seconds,
+        "n_nodes": forest.n_nodes,
+    }
+
+
+def run_search(X_train, y_train, data_sha256, grid=None, n_folds=DEFAULT_FOLDS,
+               jobs=None, latency_weight=DEFAULT_LATENCY_WEIGHT, cache_dir=CACHE_DIR,
+               pipeline=None):
+    """Evaluate every candidate of ``grid`` with k-fold CV.
+
+    ``pipeline`` is the ``FeaturePipeline`` that produced ``X_train`` (by
+    default one derived from its columns); it is part of the cache key.
+
+    Returns ``(summaries, fitted)``: candidate summaries sorted best first,
+    each a dict with ``params``, ``accuracy``, ``latency_ms``, ``score`` and
+    per-fold results, and the number of tasks that were not in the cache.
+    """
+    candidates = expand_grid(grid or DEFAULT_GRID)
+    feature_names = [str(c) for c in X_train.columns]
+    pipeline = pipeline or FeaturePipeline.for_columns(feature_names)
+    if pipeline.columns != feature_names:
+        raise ValueError(f"feature pipeline columns {pipeline.columns} do not match "
+                         f"the training columns {feature_names}")
+    features = pipeline.to_dict()
+    X = np.asarray(X_train, dtype=np.float32)
+    y = np.asarray(y_train)
+    cache = Path(cache_dir) / data_sha256
+    cache.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    todo = []
+    for index, params in enumerate(candidates):
+        for fold in range(n_folds):
+            path = cache / f"{_task_key(params, fold, n_folds, features)}.json"
+            if path.exists():
+                results[index, fold] = json.loads(path.read_text())
+            else:
+                todo.append((index, fold, path))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(X, y, feature_names, n_folds)) as pool:
+            futures = {pool.submit(_run_task, candidates[index], fold): (index, fold, path)
+                       for index, fold, path in todo}
+            for future, (index, fold, path) in futures.items():
+                result = future.result()
+                path.write_text(json.dumps(result))
+                results[index, fold] = result
+
+    summaries = []
+    for index, params in enumerate(candidates):
+        folds = [results[index, fold] for fold in range(n_folds)]
+        accuracy = float(np.mean([f["accuracy"] for f in folds]))
+        latency = float(np.median([f["latency_ms"] for f in folds]))
+        summaries.append({
+            "params": params,
+            "accuracy": accuracy,
+            "accuracy_std": float(np.std([f["accuracy"] for f in folds])),
+            "latency_ms": latency,
+            "score": accuracy - latency_weight * latency,
+            "folds": folds,
+        })
+    summaries.sort(key=lambda s: s["score"], reverse=True)
+    return summaries, len(todo)
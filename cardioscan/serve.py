@@ -0,0 +1,361 @@
+"""HTTP JSON prediction service with request micro-batching.
+
+Concurrent single-patient requests are queued and coalesced, so one
+vectorized ``predict_proba`` call answers many callers::
+
+    python -m cardioscan.serve serve --port 8600 --max-batch-size 64 --max-wait-ms 5
+    python -m cardioscan.serve bench --url http://127.0.0.1:8600 --concurrency 32
+
+Endpoints:
+
+- ``GET /health`` -> ``{"status": "ok", "features": [...], "classes": [...],
+  "feature_pipeline": {...}}``
+- ``POST /predict`` with ``{"features": {...}}`` or ``{"instances": [{...}, ...]}``
+  -> ``{"probabilities": [[p0, p1], ...]}``; add ``"record": false`` for
+  rows that are not patients (e.g. what-if sweeps); 503 if they are not
+  scored within ``RESULT_TIMEOUT_SECONDS``
+- ``GET /metrics`` -> request, batch and stage metrics in Prometheus text format
+
+Instances go through the active version's feature pipeline, so categorical
+fields may be sent as codes or labels (``"gender": "Male"``) and
+out-of-range values are rejected with a 400. Scored instances are counted by
+the drift monitor (``cardioscan.drift``) and written to the audit log
+(``cardioscan.audit``), both as source ``serve``, unless the request says
+``"record": false``. The service is the one place that records what it
+scores: an app scoring through it records nothing itself.
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from cardioscan import metrics
+from cardioscan.audit import get_log
+from cardioscan.drift import get_monitor
+from cardioscan.inference import POSITIVE_CLASS, ROOT_DIR
+from cardioscan.model_store import MODELS_DIR, ModelHandle, ModelStore
+
+DEFAULT_PORT = 8600
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 5.0
+# A request whose rows are not scored within this long gets a 503
+RESULT_TIMEOUT_SECONDS = 30.0
+
+REQUESTS = metrics.counter("cardioscan_http_requests_total", "HTTP requests, by path and status")
+REQUEST_SECONDS = metrics.histogram("cardioscan_http_request_seconds",
+                                    "HTTP request handling time, by path")
+BATCH_ROWS = metrics.histogram("cardioscan_batch_rows", "Rows per micro-batched model call",
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+PREDICTIONS = metrics.counter("cardioscan_predictions_total", "Rows scored, by caller")
+
+
+class MicroBatcher:
+    """Coalesce single-row requests into batched calls of ``predict_fn``.
+
+    ``predict_fn(model, rows)`` takes the model a row was submitted with and a
+    2-D array (rows x features), and returns one result row per input row.
+    A batch is dispatched as soon as it holds ``max_batch_size`` rows or
+    ``max_wait_ms`` has passed since its first row arrived, whichever comes
+    first; rows submitted with different models (across a hot swap) are
+    scored in separate calls.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, row, model):
+        """Queue one feature row for ``model``; the returned future resolves to its result row."""
+        future = Future()
+        self._queue.put((row, future, model))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                groups = {}
+                for row, future, model in batch:
+                    groups.setdefault(id(model), (model, []))[1].append((row, future))
+                for model, items in groups.values():
+                    self._dispatch(model, items)
+            except Exception as exc:  # one bad batch must not stop the batcher thread
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    def _dispatch(self, model, items):
+        try:
+            BATCH_ROWS.observe(len(items))
+            rows = np.asarray([row for row, _ in items], dtype=np.float64)
+            with metrics.span("serve_predict"):
+                results = self.predict_fn(model, rows)
+        except Exception as exc:  # surface the failure to every caller in the batch
+            for _, future in items:
+                future.set_exception(exc)
+            return
+        for (_, future), result in zip(items, results):
+            future.set_result(result)
+
+
+class PredictionService:
+    """Model handle + batcher pair shared by all HTTP handler threads.
+
+    The handle follows the model store's active version, so activating a new
+    version takes effect on the next request without restarting the service.
+    Each request resolves the version once: its rows are encoded, scored and
+    logged by that one version even if another is activated meanwhile.
+    """
+
+    def __init__(self, handle, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, result_timeout=RESULT_TIMEOUT_SECONDS):
+        self.handle = handle
+        self.result_timeout = result_timeout
+        self.batcher = MicroBatcher(self._predict_rows, max_batch_size, max_wait_ms)
+
+    def _predict_rows(self, model, rows):
+        return model.predict_proba(rows)
+
+    def to_rows(self, instances, pipeline):
+        """Feature matrix for a list of instance dicts (validated by ``pipeline``)."""
+        if not instances:
+            return np.empty((0, len(pipeline.columns)), dtype=np.float32)
+        if not all(isinstance(features, dict) for features in instances):
+            raise ValueError("every instance must be an object of feature values")
+        columns = {name: [features.get(name) for features in instances] for name in pipeline.columns}
+        missing = [name for name, values in columns.items() if any(v is None for v in values)]
+        if missing:
+            raise ValueError(f"missing features: {', '.join(missing)}")
+        with metrics.span("preprocess"):
+            return pipeline.transform(columns)
+
+    def predict(self, instances, record=True):
+        """Probabilities of ``instances``; ``record=False`` keeps them out of drift and audit.
+
+        Raises ``TimeoutError`` if the batcher has not scored them within
+        ``result_timeout`` seconds.
+        """
+        loaded = self.handle.get()
+        rows = self.to_rows(instances, loaded.pipeline)
+        futures = [self.batcher.submit(row, loaded.model) for row in rows]
+        deadline = time.monotonic() + self.result_timeout
+        probabilities = [[float(p) for p in future.result(max(deadline - time.monotonic(), 0.0))]
+                         for future in futures]
+        PREDICTIONS.inc(len(probabilities), source="serve")
+        if probabilities and record:
+            risk = np.asarray(probabilities)[:, list(loaded.model.classes_).index(POSITIVE_CLASS)]
+            get_monitor(self.handle.store, loaded.version, "serve").observe(rows, risk)
+            get_log("serve").record(loaded.version, loaded.pipeline.columns, rows, risk)
+        return probabilities
+
+    def describe(self):
+        loaded = self.handle.get()
+        return {
+            "status": "ok",
+            "version": loaded.version,
+            "features": loaded.model.feature_names_in_.tolist(),
+            "classes": [int(c) for c in loaded.model.classes_],
+            "feature_pipeline": loaded.pipeline.to_dict(),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None  # set by make_server
+    _routes = ("/health", "/predict", "/metrics")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        path = self.path if self.path in self._routes else "other"
+        REQUESTS.inc(path=path, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - self._started, path=path)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        self._started = time.perf_counter()
+        if self.path == "/health":
+            self._send_json(200, self.service.describe())
+        elif self.path == "/metrics":
+            self._send(200, metrics.render().encode("utf-8"), metrics.CONTENT_TYPE)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        self._started = time.perf_counter()
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if "instances" in payload:
+                instances = payload["instances"]
+            elif "features" in payload:
+                instances = [payload["features"]]
+            else:
+                raise ValueError('expected "features" or "instances"')
+            record = payload.get("record", True)
+            if not isinstance(record, bool):
+                raise ValueError('"record" must be true or false')
+            probabilities = self.service.predict(instances, record)
+        except TimeoutError:
+            self._send_json(503, {"error": "prediction timed out"})
+            return
+        except (ValueError, TypeError) as exc:
+            self._send_json(400, {"error": str(exc)})
+            return
+        self._send_json(200, {"probabilities": probabilities})
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate the hot path
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 resets connections under concurrent load
+    request_queue_size = 128
+
+
+def make_server(handle, host="127.0.0.1", port=DEFAULT_PORT,
+                max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    """Build (but do not start) a threaded HTTP server around a ``ModelHandle``."""
+    handler = type("PredictionHandler", (_Handler,), {
+        "service": PredictionService(handle, max_batch_size, max_wait_ms),
+    })
+    return _Server((host, port), handler)
+
+
+class RemoteModel:
+    """Client for the service that quacks like the in-process estimator.
+
+    It exposes ``classes_``, ``feature_names_in_`` and ``predict_proba`` so
+    ``cardioscan.inference.predict_risk`` works with either; ``info`` is the
+    service's ``/health`` payload, including its feature pipeline. With
+    ``record=False`` the service keeps the scored rows out of its drift
+    monitor and audit log.
+    """
+
+    def __init__(self, url, timeout=5.0, record=True):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.record = record
+        self.info = info = self._request("/health")
+        self.feature_names_in_ = np.asarray(info["features"], dtype=object)
+        self.classes_ = np.asarray(info["classes"])
+
+    def _request(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def predict_proba(self, features):
+        frame = pd.DataFrame(features, columns=self.feature_names_in_)
+        payload = {"instances": frame.to_dict(orient="records")}
+        if not self.record:
+            payload["record"] = False
+        return np.asarray(self._request("/predict", payload)["probabilities"])
+
+
+def bench(url, concurrency=32, requests=2000, sample_path=None):
+    """Fire ``requests`` single-patient calls from ``concurrency`` threads.
+
+    Returns a dict with p50/p99 latency in milliseconds and throughput.
+    """
+    client = RemoteModel(url)
+    sample = pd.read_csv(sample_path or ROOT_DIR / "Cardiovascular_Disease_Dataset.csv")
+    records = sample[list(client.feature_names_in_)].to_dict(orient="records")
+    bodies = [json.dumps({"features": records[i % len(records)]}).encode("utf-8")
+            for i in range(requests)]
+
+    def call(data):
+        request = urllib.request.Request(client.url + "/predict", data=data,
+                                         headers={"Content-Type": "application/json"})
+        started = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.fromiter(pool.map(call, bodies), dtype=np.float64, count=requests)
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "throughput_rps": requests / elapsed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CardioScan prediction service.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="Run the HTTP prediction service")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_cmd.add_argument("--models-dir", default=str(MODELS_DIR))
+    serve_cmd.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    serve_cmd.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+
+    bench_cmd = commands.add_parser("bench", help="Measure latency/throughput of a running service")
+    bench_cmd.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    bench_cmd.add_argument("--concurrency", type=int, default=32)
+    bench_cmd.add_argument("--requests", type=int, default=2000)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        handle = ModelHandle(ModelStore(args.models_dir))
+        handle.get()  # map the model before accepting traffic
+        server = make_server(handle, args.host, args.port,
+                             args.max_batch_size, args.max_wait_ms)
+        print(f"Serving predictions on http://{args.host}:{args.port} "
+              f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms}ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        result = bench(args.url, args.concurrency, args.requests)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
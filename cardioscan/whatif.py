@@ -0,0 +1,62 @@
+"""What-if sensitivity sweeps around one patient.
+
+"What would the risk be if resting BP dropped to 130?" is answered by
+copying the patient's encoded feature row once per grid point, overwriting
+the swept columns and scoring the whole grid in a single batched
+``predict_risk`` call::
+
+    from cardioscan.whatif import feature_grid, sweep
+    grids = {"restingBP": feature_grid(pipeline, "restingBP", 80, 220),
+             "maxheartrate": feature_grid(pipeline, "maxheartrate", 60, 220)}
+    risk = sweep(model, pipeline.columns, X, grids)    # shape (141, 161)
+
+Grids are in model units (the pipeline's encoded values); categorical
+fields sweep over all their codes.
+"""
+
+import numpy as np
+
+from cardioscan.inference import predict_risk
+
+DEFAULT_POINTS = 60
+MAX_GRID_POINTS = 20_000
+
+
+def feature_grid(pipeline, name, low=None, high=None, points=DEFAULT_POINTS):
+    """Encoded values to sweep ``name`` over, at most ``points`` of them.
+
+    Categorical fields get every code; integer fields integer steps between
+    ``low`` and ``high`` (default: the feature's valid range).
+    """
+    feature = next((f for f in pipeline.features if f.name == name), None)
+    if feature is None:
+        raise ValueError(f"unknown feature: {name}")
+    if feature.categories:
+        return np.asarray(sorted(feature.categories.values()), dtype=np.float64)
+    low = feature.low if low is None else low
+    high = feature.high if high is None else high
+    if low is None or high is None:
+        raise ValueError(f"{name}: no range to sweep over")
+    values = np.linspace(low, high, points)
+    if feature.dtype.kind in "iu":
+        values = np.unique(np.round(values))
+    return values
+
+
+def sweep(model, columns, base, grids):
+    """Risk at every combination of ``grids`` around the patient row ``base``.
+
+    ``grids`` maps column names to 1-D value arrays; the result has one axis
+    per swept column, in that order (``indexing="ij"``).
+    """
+    base = np.asarray(base, dtype=np.float32).reshape(1, -1)
+    names = list(grids)
+    axes = [np.asarray(grids[name], dtype=np.float32) for name in names]
+    shape = tuple(len(axis) for axis in axes)
+    n_points = int(np.prod(shape))
+    if n_points > MAX_GRID_POINTS:
+        raise ValueError(f"grid of {n_points:,} points exceeds {MAX_GRID_POINTS:,}")
+    X = np.repeat(base, n_points, axis=0)
+    for name, values in zip(names, np.meshgrid(*axes, indexing="ij")):
+        X[:, columns.index(name)] = values.ravel()
+    return predict_risk(model, X).reshape(shape)
@@ -1,7 +1,7 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+
+from cardioscan.app_state import get_model_handle, get_model_report
+from cardioscan.features import FEATURE_LABELS
 
 # --- 1. PAGE CONFIGURATION (Matches Home Page) ---
 st.set_page_config(page_title="Model Analytics | CardioScan", page_icon="🧪", layout="wide")
@@ -46,36 +46,39 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --- 3. HEADER ---
+# Every figure below comes from the active model version's persisted report,
+# computed once when the version was published.
+loaded = get_model_handle().get()
+report = get_model_report(loaded.version)
+metrics = report["metrics"]
+
 st.title("🧠 Model Intelligence & Metrics")
-st.markdown("Detailed breakdown of the **XGBoost High-Precision Engine**.")
+st.markdown(f"Detailed breakdown of the **Random Forest engine** (model version `{loaded.version}`).")
 st.divider()
 
-# --- 4. THE BIG FOUR METRICS (97% Accuracy Layout) ---
+# --- 4. THE BIG FOUR METRICS (held-out test split) ---
 col1, col2, col3, col4 = st.columns(4)
 
-with col1:
+
+def metric_card(label, value):
+    shown = f"{value * 100:.1f}%" if value is not None else "n/a"
     st.markdown(f"""<div class="metric-card-light">
-        <p class="metric-label-sub">Overall Accuracy</p>
-        <p class="metric-value-large">97.2%</p>
+        <p class="metric-label-sub">{label}</p>
+        <p class="metric-value-large">{shown}</p>
     </div>""", unsafe_allow_html=True)
 
+
+with col1:
+    metric_card("Overall Accuracy", metrics.get("accuracy"))
+
 with col2:
-    st.markdown(f"""<div class="metric-card-light">
-        <p class="metric-label-sub">Precision</p>
-        <p class="metric-value-large">96.5%</p>
-    </div>""", unsafe_allow_html=True)
+    metric_card("Precision", metrics.get("precision"))
 
 with col3:
-    st.markdown(f"""<div class="metric-card-light">
-        <p class="metric-label-sub">Recall Score</p>
-        <p class="metric-value-large">98.1%</p>
-    </div>""", unsafe_allow_html=True)
+    metric_card("Recall Score", metrics.get("recall"))
 
 with col4:
-    st.markdown(f"""<div class="metric-card-light">
-        <p class="metric-label-sub">F1-Score</p>
-        <p class="metric-value-large">97.3%</p>
-    </div>""", unsafe_allow_html=True)
+    metric_card("F1-Score", metrics.get("f1"))
 
 st.write("##") # Vertical spacing
 
@@ -86,37 +89,50 @@ with col_left:
     st.subheader("📌 Feature Importance Analysis")
     st.write("Identification of the primary risk drivers determined by the AI.")
     
-    # Feature data matching the 97% model logic
-    feat_data = pd.DataFrame({
-        'Feature': ['Systolic BP', 'Age', 'Cholesterol', 'Weight', 'Smoking', 'Glucose', 'Activity'],
-        'Importance': [42, 22, 14, 10, 6, 4, 2]
-    }).sort_values(by='Importance', ascending=True)
-
-    fig = px.bar(feat_data, x='Importance', y='Feature', orientation='h',
-                 color='Importance', color_continuous_scale='Blues',
-                 template='plotly_white', text='Importance')
-    
-    fig.update_traces(texttemplate='%{text}%', textposition='outside')
-    fig.update_layout(showlegend=False, margin=dict(l=0, r=40, t=10, b=10), height=400)
-    st.plotly_chart(fig, use_container_width=True)
+    # Mean decrease in impurity (feature_importances_) of the active model, in %
+    importances = report["feature_importances"]
+    if importances:
+        # Heavy charting imports load only when a chart is actually drawn
+        import pandas as pd
+        import plotly.express as px
+
+        feat_data = pd.DataFrame({
+            'Feature': [FEATURE_LABELS.get(name, name) for name in importances],
+            'Importance': [round(value * 100, 1) for value in importances.values()]
+        }).sort_values(by='Importance', ascending=True)
+
+        fig = px.bar(feat_data, x='Importance', y='Feature', orientation='h',
+                     color='Importance', color_continuous_scale='Blues',
+                     template='plotly_white', text='Importance')
+
+        fig.update_traces(texttemplate='%{text}%', textposition='outside')
+        fig.update_layout(showlegend=False, margin=dict(l=0, r=40, t=10, b=10), height=400)
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("This model version has no recorded feature importances.")
 
 with col_right:
     st.subheader("📉 Confusion Matrix")
     st.write("Visualizing prediction errors vs. successes.")
     
-    # Heatmap setup
-    z = [[3415, 85], [40, 3460]]
-    x_labels = ['Predicted: Healthy', 'Predicted: CVD']
-    y_labels = ['Actual: Healthy', 'Actual: CVD']
+    z = metrics.get("confusion_matrix")
+    if z:
+        import plotly.graph_objects as go
+
+        # Heatmap setup (rows: actual class, columns: predicted class)
+        x_labels = ['Predicted: Healthy', 'Predicted: CVD']
+        y_labels = ['Actual: Healthy', 'Actual: CVD']
 
-    fig_cm = go.Figure(data=go.Heatmap(
-        z=z, x=x_labels, y=y_labels,
-        colorscale='Blues',
-        text=[[str(v) for v in row] for row in z],
-        texttemplate="%{text}",
-    ))
-    fig_cm.update_layout(height=350, margin=dict(l=10, r=10, t=10, b=10), template='plotly_white')
-    st.plotly_chart(fig_cm, use_container_width=True)
+        fig_cm = go.Figure(data=go.Heatmap(
+            z=z, x=x_labels, y=y_labels,
+            colorscale='Blues',
+            text=[[str(v) for v in row] for row in z],
+            texttemplate="%{text}",
+        ))
+        fig_cm.update_layout(height=350, margin=dict(l=10, r=10, t=10, b=10), template='plotly_white')
+        st.plotly_chart(fig_cm, use_container_width=True)
+    else:
+        st.info("This model version has no held-out evaluation yet.")
 
 
 
@@ -125,21 +141,22 @@ st.divider()
 st_col1, st_col2 = st.columns(2)
 
 with st_col1:
-    st.subheader("📘 Why is Accuracy so high?")
-    st.markdown("""
-    The **97.2% Accuracy** was achieved through:
-    1. **Hyper-parameter Tuning:** Optimized using Bayesian Search.
-    2. **Class Balancing:** SMOTE technique was applied to ensure the model doesn't favor one outcome.
-    3. **Recall Optimization:** We prioritized **Recall (98.1%)** because in heart health, missing a positive case is more dangerous than a false alarm.
+    st.subheader("📘 How are these numbers measured?")
+    st.markdown(f"""
+    The metrics above are computed on **{metrics.get("n_test", "n/a")} held-out patients** that the model never saw during training:
+    1. **Accuracy** is the share of correct predictions; **Precision** and **Recall** are measured for the CVD class.
+    2. **Recall** matters most here, because in heart health missing a positive case is more dangerous than a false alarm.
+    3. They are computed once when a model version is published and stored next to it, so this page always reflects the model that is actually serving.
     """)
 
 with st_col2:
     st.subheader("🛠️ Technical Stack")
-    st.info("""
-    - **Model:** XGBoost Classifier
-    - **Validation:** 10-Fold Cross-Validation
-    - **Inference Time:** < 15ms
-    - **Training Size:** 70,000 Verified Clinical Records
+    data_rows = report.get("data_rows")
+    st.info(f"""
+    - **Model:** Random Forest Classifier ({report["n_trees"]} trees, {report["n_nodes"]:,} nodes)
+    - **Validation:** 80/20 held-out split
+    - **Inference:** memory-mapped flat forest (measure with `python -m cardioscan.bench`)
+    - **Training Size:** {f"{data_rows:,}" if data_rows else "n/a"} clinical records
     """)
 
 # --- 7. FOOTER ---
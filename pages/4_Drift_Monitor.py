@@ -0,0 +1,127 @@
+import time
+
+import streamlit as st
+
+from cardioscan.app_state import get_model_handle
+from cardioscan.drift import MIN_ROWS, PSI_ALERT, PSI_WARN, RISK, SOURCES, drift_dir, load_live
+from cardioscan.features import FEATURE_LABELS
+
+# --- 1. PAGE CONFIGURATION (Matches Home Page) ---
+st.set_page_config(page_title="Drift Monitor | CardioScan", page_icon="📈", layout="wide")
+
+st.markdown("""
+    <style>
+    .stApp {
+        background-color: #F8FAFC;
+    }
+
+    h1, h2, h3 {
+        color: #1E293B;
+        font-family: 'Inter', sans-serif;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+WINDOWS = {"Last hour": 1, "Last 24 hours": 24, "Last 7 days": 24 * 7, "All time": None}
+STATUS_ICONS = {"stable": "🟢", "moderate": "🟠", "shifted": "🔴", "too few rows": "⚪",
+                "no data": "⚪"}
+
+
+def bin_labels(sketch, name, pipeline):
+    """Readable label of every bin of one column (category names, ranges or risk %)."""
+    if name in sketch.values:
+        feature = next((f for f in pipeline.features if f.name == name), None)
+        names = {code: label for label, code in (feature.categories or {}).items()} if feature else {}
+        return [names.get(int(value), f"{value:g}") for value in sketch.values[name]]
+    edges = sketch.edges[name]
+    shown = [f"{edge * 100:.1f}%" if name == RISK else f"{edge:g}" for edge in edges]
+    if not shown:
+        return ["all"]
+    return ([f"< {shown[0]}"] + [f"{low} – {high}" for low, high in zip(shown, shown[1:])]
+            + [f"≥ {shown[-1]}"])
+
+
+# --- 2. HEADER & FILTERS ---
+# Live sketches are written by every serving process (app, HTTP service,
+# batch scoring) and merged here; the reference was built from the training
+# data when the version was published (see cardioscan.drift).
+handle = get_model_handle()
+store = handle.store
+active = handle.get().version
+
+st.title("📈 Data Drift Monitor")
+st.markdown("How closely the patients being scored match the data the model was trained on.")
+
+c1, c2, c3 = st.columns(3)
+versions = store.versions()
+version = c1.selectbox("Model version", versions, index=versions.index(active),
+                       format_func=lambda v: f"{v} (active)" if v == active else v)
+window = c2.selectbox("Window", list(WINDOWS), index=1)
+sources = c3.multiselect("Sources", SOURCES, default=list(SOURCES))
+st.divider()
+
+reference = store.drift_reference(version)
+pipeline = store.load(version).pipeline
+hours = WINDOWS[window]
+since = time.time() - hours * 3600 if hours else None
+live, files = load_live(drift_dir(store) / version, reference, since, sources or None)
+report = live.compare(reference)
+scored = live.rows()
+
+# --- 3. SUMMARY ---
+m1, m2, m3 = st.columns(3)
+m1.metric("Patients scored", f"{scored:,}")
+m2.metric("Shifted columns", sum(entry["status"] == "shifted" for entry in report.values()))
+m3.metric("Moderate shifts", sum(entry["status"] == "moderate" for entry in report.values()))
+if not scored:
+    st.info("No predictions have been recorded for this version and window yet.")
+    st.stop()
+if scored < MIN_ROWS:
+    st.warning(f"Only {scored} patients in this window; scores below {MIN_ROWS} are mostly noise.")
+
+# --- 4. PER-COLUMN SCORES ---
+def feature_table(report):
+    # Heavy charting imports load only when there is something to draw
+    import pandas as pd
+
+    return pd.DataFrame([{
+        "Feature": "Predicted risk" if name == RISK else FEATURE_LABELS.get(name, name),
+        "Status": f"{STATUS_ICONS[entry['status']]} {entry['status']}",
+        "PSI": entry["psi"],
+        "KS": entry["ks"],
+        "Patients": entry["rows"],
+    } for name, entry in report.items()]).sort_values("PSI", ascending=False)
+
+
+def distribution_chart(reference, live, name, labels):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    for title, counts, color in (("Training", reference.counts[name], "#94A3B8"),
+                                 ("Scored", live.counts[name], "#0062FF")):
+        fig.add_trace(go.Bar(x=labels, y=counts / max(counts.sum(), 1) * 100, name=title,
+                             marker_color=color, hovertemplate="%{x}: %{y:.1f}%<extra></extra>"))
+    fig.update_layout(barmode="group", yaxis_title="Share of patients (%)", height=360,
+                      template="plotly_white", margin=dict(l=10, r=10, t=10, b=10))
+    return fig
+
+
+st.subheader("📋 Drift by feature")
+st.dataframe(feature_table(report), hide_index=True, width="stretch",
+             column_config={"PSI": st.column_config.NumberColumn(format="%.3f"),
+                            "KS": st.column_config.NumberColumn(format="%.3f")})
+st.caption(f"PSI (population stability index) below {PSI_WARN} reads as stable, above "
+           f"{PSI_ALERT} as a real shift. KS is the largest gap between the two cumulative "
+           f"distributions. {files} sketch file(s) merged.")
+
+# --- 5. DISTRIBUTION DETAIL ---
+st.subheader("🔍 Distribution detail")
+ranked = sorted(report, key=lambda name: -(report[name]["psi"] or 0))
+name = st.selectbox("Feature", ranked,
+                    format_func=lambda n: "Predicted risk" if n == RISK else FEATURE_LABELS.get(n, n))
+st.plotly_chart(distribution_chart(reference, live, name, bin_labels(reference, name, pipeline)),
+                width="stretch")
+
+# --- 6. FOOTER ---
+st.divider()
+st.caption("© 2026 CardioScan AI | Clinical Analytics v3.0 | Strictly Professional Implementation")
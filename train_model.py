@@ -1,23 +1,162 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import argparse
+
 from sklearn.ensemble import RandomForestClassifier
 import joblib
 
-# Load dataset
-data = pd.read_csv("Cardiovascular_Disease_Dataset.csv")
+from cardioscan import metrics
+from cardioscan.binned import DEFAULT_CHUNK_ROWS, DEFAULT_MAX_BINS, train_csv
+from cardioscan.cohort import build_cohort
+from cardioscan.compress import (DEFAULT_MAX_AUC_DROP, compress_for_serving, format_report,
+                                 selection_split)
+from cardioscan.dataset import dataset_sha256, load_dataset
+from cardioscan.drift import build_reference
+from cardioscan.evaluation import HOLDOUT, PATIENT_HASH, classification_metrics, holdout_split
+from cardioscan.features import FeaturePipeline
+from cardioscan.incremental import DEFAULT_DRIFT_THRESHOLD, IncrementalTrainer
+from cardioscan.model_store import ModelStore
+from cardioscan.search import (DEFAULT_FOLDS, DEFAULT_LATENCY_WEIGHT, RANDOM_STATE,
+                               run_search)
+
+DATA_PATH = "Cardiovascular_Disease_Dataset.csv"
+# With --compress: share of the training rows held out to choose the compression
+VALIDATION_SIZE = 0.2
+
+
+def train(args):
+    # Load dataset (compact columnar cache, rebuilt only when the CSV changes)
+    with metrics.span("load_data"):
+        data = load_dataset(DATA_PATH)
+        data_sha256 = dataset_sha256(DATA_PATH)
+
+    # Split data (features go through the same pipeline the app and batch scoring use)
+    pipeline = FeaturePipeline()
+    with metrics.span("preprocess"):
+        X_train, X_test, y_train, y_test = holdout_split(data, pipeline)
+
+    # Choose hyperparameters
+    params = {}
+    extra = {"data_rows": len(data), "split": HOLDOUT}
+    if args.search:
+        with metrics.span("search"):
+            ranked, fitted = run_search(X_train, y_train, data_sha256, n_folds=args.folds,
+                                        jobs=args.jobs, latency_weight=args.latency_weight,
+                                        pipeline=pipeline)
+        print(f"Searched {len(ranked)} candidates x {args.folds} folds ({fitted} new fits, rest cached)")
+        for entry in ranked[:5]:
+            print(f"  score={entry['score']:.4f}  accuracy={entry['accuracy']:.4f}  "
+                  f"latency={entry['latency_ms']:.3f}ms  {entry['params']}")
+        params = ranked[0]["params"]
+        extra["search"] = {key: ranked[0][key] for key in ("params", "accuracy", "latency_ms", "score")}
+
+    # Compression picks its trees on rows the forest never sees, so the
+    # held-out split below stays an unbiased measure of what is served
+    if args.compress:
+        X_train, X_val, y_train, y_val = selection_split(X_train, y_train, VALIDATION_SIZE)
+
+    # Train model
+    model = RandomForestClassifier(random_state=RANDOM_STATE, **params)
+    with metrics.span("fit"):
+        model.fit(X_train, y_train)
+
+    # Optionally serve a pruned forest instead (the full estimator is still stored)
+    forest = None
+    if args.compress:
+        with metrics.span("compress"):
+            forest, extra["compression"] = compress_for_serving(model, X_val, y_val, X_test, y_test,
+                                                                args.max_auc_drop)
+        print(format_report(extra["compression"]))
+
+    # Evaluate on the held-out split
+    with metrics.span("evaluate"):
+        predictor = forest if forest is not None else model
+        scores = classification_metrics(y_test, predictor.predict(X_test))
+
+    # Save model (legacy pickle + new version in the model store)
+    with metrics.span("publish"):
+        joblib.dump(model, "heart_model.pkl")
+        # Reference cohort for the result card's percentiles, scored by the served forest
+        cohort = build_cohort(predictor, pipeline, data)
+        # Reference histograms the drift monitor compares served patients against
+        drift = build_reference(predictor, pipeline, data)
+        version = ModelStore().publish(model, data_sha256, scores, extra=extra, pipeline=pipeline,
+                                       forest=forest, cohort=cohort, drift=drift)
+
+    print(f"Model trained and saved successfully! Published {version} "
+          f"(held-out accuracy {scores['accuracy']:.3f})")
+
+
+def train_binned(args):
+    # Streams the CSV; no step holds the dataset as a DataFrame
+    pipeline = FeaturePipeline()
+    with metrics.span("load_data"):
+        data_sha256 = dataset_sha256(DATA_PATH)
+    model, scores, cohort, drift, rows = train_csv(DATA_PATH, pipeline,
+                                                   {"max_bins": args.max_bins, "n_jobs": args.jobs},
+                                                   chunk_rows=args.chunk_rows)
+    with metrics.span("publish"):
+        version = ModelStore().publish(model, data_sha256, scores, pipeline=pipeline, cohort=cohort,
+                                       drift=drift,
+                                       extra={"data_rows": rows, "training_mode": "binned",
+                                              "split": PATIENT_HASH})
+
+    print(f"Binned model trained on {rows:,} rows and published as {version} "
+          f"(held-out accuracy {scores['accuracy']:.3f})")
+
+
+def train_incremental(args):
+    with metrics.span("incremental"):
+        summary = IncrementalTrainer(DATA_PATH).run(args.drift_threshold, force_full=args.full)
+    if summary["mode"] == "noop":
+        print(f"No new rows since the last run; {summary['version']} stays current.")
+        return
+    accuracy = summary["metrics"].get("accuracy")
+    drift = "no history" if summary["drift"] == float("inf") else f"drift {summary['drift']:.3f}"
+    print(f"Ingested {summary['delta_rows']:,} new rows ({drift}), "
+          f"{summary['mode']} -> {summary['version']} with {summary['n_trees']} trees"
+          + (f" (held-out accuracy {accuracy:.3f})" if accuracy is not None else ""))
 
-# Features and target
-X = data.drop("target", axis=1)
-y = data["target"]
 
-# Split data
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+def main():
+    parser = argparse.ArgumentParser(description="Train the heart disease model.")
+    parser.add_argument("--search", action="store_true",
+                        help="Pick hyperparameters by k-fold CV instead of using the defaults")
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS)
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Search worker processes (default: all cores), or --binned "
+                             "tree-growing processes (default: 1)")
+    parser.add_argument("--latency-weight", type=float, default=DEFAULT_LATENCY_WEIGHT,
+                        help="Accuracy traded per millisecond of single-row latency")
+    parser.add_argument("--compress", action="store_true",
+                        help="Serve a depth-capped, leaf-merged subset of the trees")
+    parser.add_argument("--max-auc-drop", type=float, default=DEFAULT_MAX_AUC_DROP,
+                        help="With --compress: largest allowed loss of validation AUC")
+    parser.add_argument("--binned", action="store_true",
+                        help="Grow trees on quantile-binned features, reading the CSV in chunks")
+    parser.add_argument("--max-bins", type=int, default=DEFAULT_MAX_BINS,
+                        help="With --binned: buckets per feature (at most 256)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="With --binned: CSV rows parsed at a time")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only ingest rows appended since the last incremental run")
+    parser.add_argument("--drift-threshold", type=float, default=DEFAULT_DRIFT_THRESHOLD,
+                        help="Standardized mean shift above which --incremental refits fully")
+    parser.add_argument("--full", action="store_true", help="With --incremental: force a full refit")
+    args = parser.parse_args()
+    if args.binned and (args.search or args.compress or args.incremental):
+        parser.error("--binned does not combine with --search, --compress or --incremental "
+                     "(compress a binned version afterwards with python -m cardioscan.compress)")
 
-# Train model
-model = RandomForestClassifier()
-model.fit(X_train, y_train)
+    # CARDIOSCAN_PROFILE=<dir> dumps a cProfile of the run; CARDIOSCAN_METRICS_FILE
+    # receives the stage timings (see cardioscan.metrics)
+    with metrics.Profile("train"):
+        if args.incremental:
+            train_incremental(args)
+        elif args.binned:
+            train_binned(args)
+        else:
+            train(args)
+    metrics.write_textfile()
 
-# Save model
-joblib.dump(model, "heart_model.pkl")
 
-print("Model trained and saved successfully!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()